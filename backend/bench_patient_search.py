@@ -0,0 +1,77 @@
+"""
+Patient search latency at hospital scale.
+
+Loads --patients synthetic patients (names drawn from common first names
+and surnames, ten-digit phones, ward-style room numbers) straight into a
+PatientSearchIndex, the way build() loads database rows, then runs every
+query in QUERIES --rounds times. Reports the build time, p50/p99/max over
+all searches and the slowest query; exits non-zero when p99 is over
+--target-ms.
+
+    python bench_patient_search.py --patients 1000000
+"""
+import argparse
+import random
+import string
+import sys
+import time
+from services.patient_search import PatientSearchIndex
+
+FIRST_NAMES = (
+    'james', 'mary', 'robert', 'patricia', 'john', 'jennifer', 'michael', 'linda', 'william', 'elizabeth',
+    'priya', 'amit', 'rahul', 'anita', 'sunita', 'raj', 'vikram', 'pooja', 'arjun', 'kavya',
+    'mohammed', 'fatima', 'ahmed', 'aisha', 'wei', 'li', 'chen', 'maria', 'jose', 'carlos'
+)
+SURNAMES = (
+    'smith', 'johnson', 'williams', 'brown', 'jones', 'garcia', 'miller', 'davis', 'rodriguez', 'martinez',
+    'sharma', 'patel', 'singh', 'kumar', 'gupta', 'reddy', 'iyer', 'nair', 'khan', 'das',
+    'wang', 'zhang', 'liu', 'nguyen', 'kim', 'lee', 'tawade', 'deshmukh', 'kulkarni', 'joshi'
+)
+QUERIES = (
+    'john', 'williams', 'will', 'priya sharma', 'kumar', 'sh', 'j', 'xq', 'zzz', 'ams', 'son',
+    'mary jo', 'patel a', '98765', '12345', '555', '4821', '500000', 'a-12', 'b-3', 'icu', 'ward 4'
+)
+
+
+def synthetic_rows(count, seed=1):
+    """(pk, room_number, phone, name, updated_at) rows like PatientSearchIndex.build() reads"""
+    rnd = random.Random(seed)
+    wards = ('a', 'b', 'c', 'd', 'icu', 'ward')
+    for pk in range(1, count + 1):
+        # Skewed towards the first names and surnames of each list, like real registers
+        first = FIRST_NAMES[min(int(rnd.expovariate(0.15)), len(FIRST_NAMES) - 1)]
+        last = SURNAMES[min(int(rnd.expovariate(0.12)), len(SURNAMES) - 1)]
+        room = f'{rnd.choice(wards)}-{rnd.randint(1, 40)}{rnd.randint(0, 99):02d}' if rnd.random() < 0.3 else None
+        phone = ''.join(rnd.choices(string.digits, k=10))
+        yield pk, room, phone, f'{first} {last}', None
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--patients', type=int, default=1000000)
+    parser.add_argument('--rounds', type=int, default=20)
+    parser.add_argument('--limit', type=int, default=10)
+    parser.add_argument('--target-ms', type=float, default=20.0)
+    args = parser.parse_args()
+
+    index = PatientSearchIndex()
+    started = time.perf_counter()
+    index.load(synthetic_rows(args.patients))
+    print(f'build: {args.patients} patients in {time.perf_counter() - started:.1f} s')
+
+    latencies = []
+    slowest = {}
+    for _ in range(args.rounds):
+        for query in QUERIES:
+            started = time.perf_counter()
+            index.search(query, args.limit)
+            ms = (time.perf_counter() - started) * 1000
+            latencies.append(ms)
+            slowest[query] = max(ms, slowest.get(query, 0.0))
+    latencies.sort()
+    p99 = latencies[min(int(len(latencies) * 0.99), len(latencies) - 1)]
+    print(f'searches: {len(latencies)}  p50 {latencies[len(latencies) // 2]:.2f} ms  '
+          f'p99 {p99:.2f} ms  max {latencies[-1]:.2f} ms')
+    for query, ms in sorted(slowest.items(), key=lambda item: -item[1])[:5]:
+        print(f'  {query!r:<16} max {ms:.2f} ms')
+    sys.exit(0 if p99 <= args.target_ms else 1)
@@ -0,0 +1,43 @@
+"""
+Check that backend/utils still matches flask_hms/utils.
+
+The two apps are deployed separately and share no package, so the modules
+in SHARED are kept in flask_hms/utils and copied here. The check fails when
+a copy differs from its source; --fix copies the sources over:
+
+    python check_shared_utils.py
+    python check_shared_utils.py --fix
+"""
+import argparse
+import filecmp
+import os
+import shutil
+import sys
+
+SHARED = ('compression.py', 'json_provider.py', 'metrics.py', 'profiler.py', 'query_stats.py')
+HERE = os.path.dirname(os.path.abspath(__file__))
+SOURCE = os.path.join(HERE, os.pardir, 'flask_hms', 'utils')
+COPY = os.path.join(HERE, 'utils')
+
+
+def stale_copies():
+    return [name for name in SHARED
+            if not filecmp.cmp(os.path.join(SOURCE, name), os.path.join(COPY, name), shallow=False)]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--fix', action='store_true', help='copy flask_hms/utils over the stale copies')
+    args = parser.parse_args()
+
+    stale = stale_copies()
+    for name in stale:
+        if args.fix:
+            shutil.copyfile(os.path.join(SOURCE, name), os.path.join(COPY, name))
+            print(f"✓ utils/{name} copied from flask_hms/utils")
+        else:
+            print(f"✗ utils/{name} differs from flask_hms/utils/{name}")
+    if stale and not args.fix:
+        print(f"\n✗ {len(stale)} shared module(s) out of sync; edit flask_hms/utils, then run with --fix")
+        sys.exit(1)
+    print("\n✓ Shared utils match flask_hms/utils")
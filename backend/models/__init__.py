@@ -1 +1,7 @@
-# This file makes the models directory a Python package
+# This file makes the models directory a Python package.
+# Every model is imported here so string relationships ('Prescription', ...)
+# resolve and db.create_all() creates every table.
+from . import (
+    patient, room, patient_stat, doctor, appointment, prescription, prescription_medicine,
+    lab_report, bill, bill_item
+)
@@ -1,6 +1,5 @@
 from datetime import datetime
-from .base import BaseModel
-from app import db
+from .base import BaseModel, db
 
 class Appointment(BaseModel):
     """Appointment model for scheduling patient visits"""
@@ -1,5 +1,5 @@
-from .base import BaseModel
-from app import db
+from .base import BaseModel, db
+from sqlalchemy import case, event, func, inspect, update
 
 class Bill(BaseModel):
     """Bill model for storing patient billing information"""
@@ -26,25 +26,66 @@ class Bill(BaseModel):
     def __repr__(self):
         return f'<Bill {self.bill_number} - {self.status}>'
     
-    def calculate_totals(self):
-        """Calculate subtotal, tax, and total amounts"""
-        self.subtotal = sum(item.amount for item in self.bill_items)
-        self.total_amount = self.subtotal + self.tax_amount - self.discount
-        self.balance = self.total_amount - self.paid_amount
+    @staticmethod
+    def _status(paid, balance):
+        """Payment status for the given paid amount and balance (SQL expressions)"""
+        return case(
+            (Bill.status == 'Cancelled', Bill.status),
+            (paid <= 0, 'Pending'),
+            (balance <= 0, 'Paid'),
+            else_='Partially Paid'
+        )
+    
+    @classmethod
+    def adjust_totals(cls, bill_id, subtotal_delta=0.0, paid_delta=0.0):
+        """
+        UPDATE moving subtotal and paid_amount by the given deltas, with
+        total_amount, balance and status following in the same statement.
+        status is assigned first so it sees the old values on every database
+        (MySQL applies SET assignments left to right).
+        """
+        balance = func.coalesce(cls.balance, 0)
+        paid = func.coalesce(cls.paid_amount, 0)
+        return update(cls).where(cls.id == bill_id).ordered_values(
+            (cls.status, cls._status(paid + paid_delta, balance + subtotal_delta - paid_delta)),
+            (cls.subtotal, func.coalesce(cls.subtotal, 0) + subtotal_delta),
+            (cls.total_amount, func.coalesce(cls.total_amount, 0) + subtotal_delta),
+            (cls.balance, balance + subtotal_delta - paid_delta),
+            (cls.paid_amount, paid + paid_delta)
+        ).execution_options(synchronize_session=False)
+    
+    def apply_totals(self):
+        """Derive total_amount, balance and status from the stored subtotal"""
+        self.total_amount = (self.subtotal or 0) + (self.tax_amount or 0) - (self.discount or 0)
+        self.balance = self.total_amount - (self.paid_amount or 0)
         
-        # Update status based on payment
-        if self.paid_amount <= 0:
+        if self.status == 'Cancelled':
+            return
+        if (self.paid_amount or 0) <= 0:
             self.status = 'Pending'
         elif self.balance <= 0:
             self.status = 'Paid'
         else:
             self.status = 'Partially Paid'
     
-    def to_dict(self):
-        """Convert bill object to dictionary"""
-        self.calculate_totals()  # Ensure totals are up to date
-        
-        return {
+    def calculate_totals(self):
+        """Recompute the subtotal from the line items, for repairing drifted totals"""
+        from .bill_item import BillItem
+        self.subtotal = db.session.query(func.coalesce(func.sum(BillItem.amount), 0.0)) \
+            .filter(BillItem.bill_id == self.id).scalar()
+        self.apply_totals()
+    
+    def record_payment(self, amount, payment_method=None):
+        """Add a payment atomically, so concurrent payments are not lost"""
+        db.session.execute(Bill.adjust_totals(self.id, paid_delta=amount))
+        if payment_method:
+            self.payment_method = payment_method
+        db.session.commit()
+        db.session.refresh(self)
+    
+    def to_dict(self, include_items=True):
+        """Convert bill object to dictionary (read-only: totals are kept up to date on write)"""
+        data = {
             'id': self.id,
             'bill_number': self.bill_number,
             'patient_id': self.patient_id,
@@ -60,7 +101,23 @@ class Bill(BaseModel):
             'payment_method': self.payment_method,
             'payment_status': self.payment_status,
             'notes': self.notes,
-            'bill_items': [item.to_dict() for item in self.bill_items],
             'created_at': self.created_at.isoformat(),
             'updated_at': self.updated_at.isoformat()
         }
+        if include_items:
+            data['bill_items'] = [item.to_dict() for item in self.bill_items]
+        return data
+
+
+@event.listens_for(Bill, 'before_insert')
+def _bill_before_insert(mapper, connection, target):
+    target.apply_totals()
+
+
+@event.listens_for(Bill, 'before_update')
+def _bill_before_update(mapper, connection, target):
+    # Line items move subtotal with their own UPDATEs; edits to the bill's
+    # own amounts re-derive the rest here
+    state = inspect(target)
+    if any(state.attrs[name].history.has_changes() for name in ('tax_amount', 'discount', 'paid_amount', 'subtotal')):
+        target.apply_totals()
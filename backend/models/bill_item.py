@@ -1,16 +1,19 @@
-from .base import BaseModel
-from app import db
+from .base import BaseModel, db
+from .bill import Bill
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, object_session
 
 class BillItem(BaseModel):
     """BillItem model for storing individual line items in a bill"""
     __tablename__ = 'bill_items'
     
-    bill_id = db.Column(db.Integer, db.ForeignKey('bills.id'), nullable=False)
+    # active_history: the old values are needed to move bill totals on update
+    bill_id = db.column_property(db.Column(db.Integer, db.ForeignKey('bills.id'), nullable=False), active_history=True)
     item_type = db.Column(db.String(50), nullable=False)  # Consultation, Medicine, Test, Room, Procedure, etc.
     description = db.Column(db.String(200), nullable=False)
     quantity = db.Column(db.Float, default=1.0)
     unit_price = db.Column(db.Float, default=0.0)
-    amount = db.Column(db.Float, default=0.0)
+    amount = db.column_property(db.Column(db.Float, default=0.0), active_history=True)
     item_date = db.Column(db.Date, nullable=False)
     reference_id = db.Column(db.Integer)  # ID of the related item (prescription, lab report, etc.)
     
@@ -37,3 +40,57 @@ class BillItem(BaseModel):
             'created_at': self.created_at.isoformat(),
             'updated_at': self.updated_at.isoformat()
         }
+
+
+# Bill totals follow their line items: every insert, update and delete of a
+# BillItem moves the bill's subtotal by the difference in one UPDATE, in the
+# same flush. Loaded Bill objects are expired afterwards so they re-read it.
+TOTAL_FIELDS = ('subtotal', 'total_amount', 'balance', 'paid_amount', 'status')
+
+
+def _adjust(connection, target, bill_id, delta):
+    if bill_id is None or not delta:
+        return
+    connection.execute(Bill.adjust_totals(bill_id, subtotal_delta=delta))
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault('stale_bills', set()).add(bill_id)
+
+
+def _committed(state, name):
+    history = state.attrs[name].history
+    if history.deleted:
+        return history.deleted[0]
+    return history.unchanged[0] if history.unchanged else None
+
+
+@event.listens_for(BillItem, 'after_insert')
+def _item_inserted(mapper, connection, target):
+    _adjust(connection, target, target.bill_id, target.amount or 0)
+
+
+@event.listens_for(BillItem, 'after_update')
+def _item_updated(mapper, connection, target):
+    state = inspect(target)
+    if not (state.attrs.amount.history.has_changes() or state.attrs.bill_id.history.has_changes()):
+        return
+    old_bill, old_amount = _committed(state, 'bill_id'), _committed(state, 'amount') or 0
+    if old_bill == target.bill_id:
+        _adjust(connection, target, target.bill_id, (target.amount or 0) - old_amount)
+    else:
+        _adjust(connection, target, old_bill, -old_amount)
+        _adjust(connection, target, target.bill_id, target.amount or 0)
+
+
+@event.listens_for(BillItem, 'after_delete')
+def _item_deleted(mapper, connection, target):
+    state = inspect(target)
+    _adjust(connection, target, _committed(state, 'bill_id'), -(_committed(state, 'amount') or 0))
+
+
+@event.listens_for(Session, 'after_flush_postexec')
+def _expire_stale_bills(session, flush_context):
+    for bill_id in session.info.pop('stale_bills', ()):
+        bill = session.identity_map.get(inspect(Bill).identity_key_from_primary_key((bill_id,)))
+        if bill is not None:
+            session.expire(bill, TOTAL_FIELDS)
@@ -1,5 +1,4 @@
-from .base import BaseModel
-from app import db
+from .base import BaseModel, db
 
 class LabReport(BaseModel):
     """LabReport model for storing patient lab test results"""
@@ -8,12 +8,13 @@ class Patient(BaseModel):
     name = db.Column(db.String(100), nullable=False)
     gender = db.Column(db.Enum('male', 'female', 'other'), nullable=False)
     disease = db.Column(db.String(200))
-    status = db.Column(db.Enum('admitted', 'discharged', 'pending'), default='admitted')
+    # active_history: patient_stat needs the old values to move the status counters
+    status = db.column_property(db.Column(db.Enum('admitted', 'discharged', 'pending'), default='admitted'), active_history=True)
     admission_date = db.Column(db.DateTime, default=datetime.utcnow)
     discharged_date = db.Column(db.DateTime, nullable=True)
-    deposited_amount = db.Column(db.Float, default=0.0)
+    deposited_amount = db.column_property(db.Column(db.Float, default=0.0), active_history=True)
     pending_amount = db.Column(db.Float, default=0.0)
-    total_amount = db.Column(db.Float, default=0.0)
+    total_amount = db.column_property(db.Column(db.Float, default=0.0), active_history=True)
     address = db.Column(db.String(200))
     emergency_contact = db.Column(db.String(20))
     
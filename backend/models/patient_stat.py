@@ -0,0 +1,78 @@
+from sqlalchemy import event, inspect
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from .base import db
+from .patient import Patient
+
+class PatientStat(db.Model):
+    """Running patient counters per status, maintained on every patient write"""
+    __tablename__ = 'patient_stats'
+    
+    status = db.Column(db.String(20), primary_key=True)
+    patient_count = db.Column(db.Integer, nullable=False, default=0)
+    deposited_amount = db.Column(db.Float, nullable=False, default=0.0)
+    pending_amount = db.Column(db.Float, nullable=False, default=0.0)
+    
+    def __repr__(self):
+        return f'<PatientStat {self.status}: {self.patient_count}>'
+
+
+def _contribution(status, deposited, total):
+    """What one patient adds to the counters; mirrors the SQL SUMs, which skip NULLs"""
+    pending = total - deposited if total is not None and deposited is not None else 0.0
+    return status, 1, deposited or 0.0, pending
+
+
+def _apply(connection, status, count, deposited, pending):
+    """Add to a status's counters, creating its row on first use in the same statement"""
+    if status is None:
+        return
+    table = PatientStat.__table__
+    increments = {
+        'patient_count': table.c.patient_count + count,
+        'deposited_amount': table.c.deposited_amount + deposited,
+        'pending_amount': table.c.pending_amount + pending
+    }
+    row = {'status': status, 'patient_count': count, 'deposited_amount': deposited, 'pending_amount': pending}
+    # One upsert, so two first writes for a status cannot both INSERT
+    if connection.dialect.name == 'mysql':
+        statement = mysql_insert(table).values(row).on_duplicate_key_update(**increments)
+    else:
+        statement = sqlite_insert(table).values(row).on_conflict_do_update(
+            index_elements=[table.c.status], set_=increments
+        )
+    connection.execute(statement)
+
+
+def _committed(state, name):
+    history = state.attrs[name].history
+    if history.deleted:
+        return history.deleted[0]
+    return history.unchanged[0] if history.unchanged else None
+
+
+# The counters move in the same transaction as the patient row, so a rollback
+# undoes both
+@event.listens_for(Patient, 'after_insert')
+def _patient_inserted(mapper, connection, target):
+    _apply(connection, *_contribution(target.status, target.deposited_amount, target.total_amount))
+
+
+@event.listens_for(Patient, 'after_update')
+def _patient_updated(mapper, connection, target):
+    state = inspect(target)
+    old = _contribution(*(_committed(state, name) for name in ('status', 'deposited_amount', 'total_amount')))
+    new = _contribution(target.status, target.deposited_amount, target.total_amount)
+    if old == new:
+        return
+    _apply(connection, old[0], -1, -old[2], -old[3])
+    _apply(connection, *new)
+
+
+@event.listens_for(Patient, 'after_delete')
+def _patient_deleted(mapper, connection, target):
+    state = inspect(target)
+    status, count, deposited, pending = _contribution(
+        *(_committed(state, name) for name in ('status', 'deposited_amount', 'total_amount'))
+    )
+    _apply(connection, status, -count, -deposited, -pending)
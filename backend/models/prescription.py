@@ -1,5 +1,4 @@
-from .base import BaseModel
-from app import db
+from .base import BaseModel, db
 
 class Prescription(BaseModel):
     """Prescription model for storing patient prescriptions"""
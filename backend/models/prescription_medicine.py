@@ -1,5 +1,4 @@
-from .base import BaseModel
-from app import db
+from .base import BaseModel, db
 
 class PrescriptionMedicine(BaseModel):
     """PrescriptionMedicine model for storing medicine details in a prescription"""
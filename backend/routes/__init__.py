@@ -1,11 +1,17 @@
 # Import all route blueprints here
 from .patients import patients_bp
 from .rooms import rooms_bp
+from .bills import bills_bp
+from .admin import admin_bp
+from .doctor_routes import doctor_bp
 
 def register_routes(app):
     """Register all route blueprints with the Flask app"""
     app.register_blueprint(patients_bp, url_prefix='/api')
     app.register_blueprint(rooms_bp, url_prefix='/api')
+    app.register_blueprint(bills_bp, url_prefix='/api')
+    app.register_blueprint(doctor_bp, url_prefix='/api/doctors')
+    app.register_blueprint(admin_bp, url_prefix='/api')
     
     # Add a simple health check endpoint
     @app.route('/api/health')
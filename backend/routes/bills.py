@@ -0,0 +1,132 @@
+from flask import Blueprint, request, jsonify
+from datetime import datetime
+from sqlalchemy.orm import selectinload
+from models.bill import Bill
+from models.bill_item import BillItem
+from models.base import db
+from utils.helpers import wants_keyset, parse_limit, keyset_paginate
+
+bills_bp = Blueprint('bills', __name__)
+
+def _include_items():
+    return request.args.get('include_items', '').lower() in ('1', 'true', 'yes')
+
+@bills_bp.route('/bills', methods=['GET'])
+def get_bills():
+    """List bills in one query; ?include_items=1 batch-loads the line items"""
+    try:
+        include_items = _include_items()
+        query = Bill.query
+        
+        if request.args.get('patient_id'):
+            query = query.filter(Bill.patient_id == request.args.get('patient_id'))
+        
+        if request.args.get('status'):
+            query = query.filter(Bill.status == request.args.get('status'))
+        
+        # One extra SELECT ... WHERE bill_id IN (...) for all items on the page
+        if include_items:
+            query = query.options(selectinload(Bill.bill_items))
+        
+        # Cursor pagination: ?after=<cursor>&limit=<n>
+        if wants_keyset(request.args):
+            try:
+                limit = parse_limit(request.args.get('limit'))
+                bills, next_cursor = keyset_paginate(query, Bill.id, request.args.get('after'), limit)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            
+            return jsonify({
+                'data': [bill.to_dict(include_items=include_items) for bill in bills],
+                'next_cursor': next_cursor,
+                'has_more': next_cursor is not None,
+                'limit': limit
+            }), 200
+        
+        bills = query.order_by(Bill.id).all()
+        return jsonify([bill.to_dict(include_items=include_items) for bill in bills]), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@bills_bp.route('/bills/<int:bill_id>', methods=['GET'])
+def get_bill(bill_id):
+    """Get a single bill with its line items"""
+    try:
+        bill = Bill.query.options(selectinload(Bill.bill_items)).filter(Bill.id == bill_id).first()
+        if not bill:
+            return jsonify({'error': 'Not found'}), 404
+        return jsonify(bill.to_dict()), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@bills_bp.route('/bills/<int:bill_id>/items', methods=['POST'])
+def add_bill_item(bill_id):
+    """Add a line item; the bill's totals are updated in the same commit"""
+    try:
+        bill = Bill.query.get(bill_id)
+        if not bill:
+            return jsonify({'error': 'Not found'}), 404
+        data = request.get_json()
+        
+        required_fields = ['item_type', 'description', 'unit_price']
+        if not all(field in data for field in required_fields):
+            return jsonify({'error': 'Missing required fields'}), 400
+        
+        item = BillItem(
+            bill_id=bill.id,
+            item_type=data['item_type'],
+            description=data['description'],
+            quantity=float(data.get('quantity', 1)),
+            unit_price=float(data['unit_price']),
+            item_date=datetime.utcnow().date(),
+            reference_id=data.get('reference_id')
+        )
+        item.calculate_amount()
+        
+        db.session.add(item)
+        db.session.commit()
+        
+        return jsonify({'item': item.to_dict(), 'bill': bill.to_dict(include_items=False)}), 201
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@bills_bp.route('/bills/<int:bill_id>/items/<int:item_id>', methods=['DELETE'])
+def delete_bill_item(bill_id, item_id):
+    """Remove a line item"""
+    try:
+        item = BillItem.query.filter_by(id=item_id, bill_id=bill_id).first()
+        if not item:
+            return jsonify({'error': 'Not found'}), 404
+        
+        db.session.delete(item)
+        db.session.commit()
+        
+        return jsonify(Bill.query.get(bill_id).to_dict(include_items=False)), 200
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@bills_bp.route('/bills/<int:bill_id>/payments', methods=['POST'])
+def add_payment(bill_id):
+    """Record a payment against a bill"""
+    try:
+        bill = Bill.query.get(bill_id)
+        if not bill:
+            return jsonify({'error': 'Not found'}), 404
+        data = request.get_json()
+        
+        try:
+            amount = float(data['amount'])
+        except (KeyError, TypeError, ValueError):
+            return jsonify({'error': 'amount is required'}), 400
+        if amount <= 0:
+            return jsonify({'error': 'amount must be positive'}), 400
+        if bill.status == 'Cancelled':
+            return jsonify({'error': 'Bill is cancelled'}), 400
+        
+        bill.record_payment(amount, data.get('payment_method'))
+        return jsonify(bill.to_dict(include_items=False)), 200
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
@@ -2,6 +2,7 @@ from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from models.patient import Patient
 from app import db
+from services.patient_search import index_patient, remove_patient, search_patient_ids
 from datetime import datetime
 import uuid
 
@@ -44,6 +45,7 @@ def create_patient():
         
         db.session.add(patient)
         db.session.commit()
+        index_patient(patient)
         
         return jsonify(patient.to_dict()), 201
     except Exception as e:
@@ -93,6 +95,7 @@ def update_patient(patient_id):
             patient.date_of_birth = datetime.strptime(data['date_of_birth'], '%Y-%m-%d').date()
         
         db.session.commit()
+        index_patient(patient)
         return jsonify(patient.to_dict()), 200
     except Exception as e:
         db.session.rollback()
@@ -106,6 +109,7 @@ def delete_patient(patient_id):
         patient = Patient.query.get_or_404(patient_id)
         db.session.delete(patient)
         db.session.commit()
+        remove_patient(patient_id)
         return jsonify({"message": "Patient deleted successfully"}), 200
     except Exception as e:
         db.session.rollback()
@@ -120,14 +124,11 @@ def search_patients():
         if not query:
             return jsonify({"error": "Search query is required"}), 400
         
-        # Search by patient_id, name, phone, or email
-        patients = Patient.query.filter(
-            (Patient.patient_id.ilike(f'%{query}%')) |
-            (Patient.first_name.ilike(f'%{query}%')) |
-            (Patient.last_name.ilike(f'%{query}%')) |
-            (Patient.phone.ilike(f'%{query}%')) |
-            (Patient.email.ilike(f'%{query}%'))
-        ).all()
+        # Ranked ids from the search index (patient id, name, phone, room number)
+        limit = request.args.get('limit', 20, type=int)
+        ids = search_patient_ids(query, max(1, min(limit, 50)))
+        by_id = {p.id: p for p in Patient.query.filter(Patient.id.in_(ids)).all()} if ids else {}
+        patients = [by_id[pk] for pk in ids if pk in by_id]
         
         return jsonify([patient.to_dict() for patient in patients]), 200
     except Exception as e:
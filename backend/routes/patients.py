@@ -1,55 +1,147 @@
 from flask import Blueprint, request, jsonify
 from datetime import datetime
+from sqlalchemy.orm import joinedload
 from models.patient import Patient
 from models.room import Room
 from models.base import db
+from services.patient_search import index_patient, remove_patient, search_patient_ids
+from services.room_availability import index_room
+from services.patient_stats import patient_stats
+from utils.decorators import conditional
+from utils.helpers import (
+    wants_keyset, parse_limit, keyset_paginate, page_total, wants_stream, stream_json_array,
+    model_columns, sparse_fieldset
+)
 
 patients_bp = Blueprint('patients', __name__)
 
+# Columns selectable with ?fields=; room_number comes from a join on rooms
+PATIENT_COLUMNS = model_columns(Patient, (
+    'id', 'name', 'gender', 'disease', 'room_id', 'status', 'admission_date',
+    'discharged_date', 'deposited_amount', 'pending_amount', 'total_amount',
+    'address', 'emergency_contact', 'created_at', 'updated_at'
+))
+PATIENT_COLUMNS['room_number'] = Room.room_number
+PATIENT_JOINS = {'room_number': lambda query: query.outerjoin(Room, Patient.room_id == Room.id)}
+
+def _patient_row(p):
+    """Serialize a patient for the list endpoint"""
+    return {
+        'id': p.id,
+        'name': p.name,
+        'gender': p.gender,
+        'disease': p.disease,
+        'room_id': p.room_id,
+        'room_number': p.room.room_number if p.room else None,
+        'status': p.status,
+        'admission_date': p.admission_date.isoformat(),
+        'deposited_amount': float(p.deposited_amount),
+        'pending_amount': float(p.pending_amount) if p.pending_amount else None,
+        'total_amount': float(p.total_amount) if p.total_amount else None,
+        'created_at': p.created_at.isoformat(),
+        'updated_at': p.updated_at.isoformat()
+    }
+
+def _filtered_patients():
+    """Patients matching ?status=&search= (name, id or room number)"""
+    query = Patient.query
+    status = request.args.get('status')
+    if status and status != 'all':
+        query = query.filter(Patient.status == status)
+    if request.args.get('search'):
+        search_term = f"%{request.args.get('search')}%"
+        query = query.filter(
+            (Patient.name.ilike(search_term)) |
+            (Patient.id.ilike(search_term)) |
+            (Patient.room.has(Room.room_number.ilike(search_term)))
+        )
+    return query
+
+def _patients_version():
+    """Version of the patients get_patients() would return, including their rooms"""
+    count, patients, rooms = _filtered_patients().outerjoin(Room, Patient.room_id == Room.id).with_entities(
+        db.func.count(Patient.id), db.func.max(Patient.updated_at), db.func.max(Room.updated_at)
+    ).order_by(None).one()
+    return count, patients, rooms, max(filter(None, (patients, rooms)), default=None)
+
+def _patient_version(patient_id):
+    row = db.session.query(Patient.updated_at, Room.updated_at).outerjoin(
+        Room, Patient.room_id == Room.id
+    ).filter(Patient.id == patient_id).first()
+    if row is None:
+        return None
+    return tuple(row) + (max(filter(None, row)),)
+
 @patients_bp.route('/patients', methods=['GET'])
+@conditional(_patients_version)
 def get_patients():
     """Get all patients with optional filters"""
     try:
         status = request.args.get('status')
         search = request.args.get('search')
         
-        query = Patient.query
+        query = _filtered_patients()
         
-        if status and status != 'all':
-            query = query.filter(Patient.status == status)
-            
-        if search:
-            search_term = f"%{search}%"
-            query = query.filter(
-                (Patient.name.ilike(search_term)) |
-                (Patient.id.ilike(search_term)) |
-                (Patient.room.has(Room.room_number.ilike(search_term)))
+        # Sparse fieldsets: ?fields=name,status,room_number
+        try:
+            query, serialize = sparse_fieldset(
+                query, request.args.get('fields'), PATIENT_COLUMNS, _patient_row, PATIENT_JOINS
             )
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        fields = request.args.get('fields')
+        
+        # Cursor pagination: ?after=<cursor>&limit=<n>
+        if wants_keyset(request.args):
+            try:
+                limit = parse_limit(request.args.get('limit'))
+                patients, next_cursor = keyset_paginate(query, Patient.id, request.args.get('after'), limit)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            
+            response = {
+                'data': [serialize(p) for p in patients],
+                'next_cursor': next_cursor,
+                'has_more': next_cursor is not None,
+                'limit': limit
+            }
+            filtered = bool((status and status != 'all') or search)
+            total = page_total(query, Patient, request.args.get('total'), filtered)
+            if total is not None:
+                response['total'] = total
+            return jsonify(response), 200
+        
+        # Streamed array for unbounded listings: ?stream=1
+        if wants_stream(request.args):
+            if not fields:
+                query = query.options(joinedload(Patient.room))
+            return stream_json_array(query.order_by(Patient.id), serialize)
         
         patients = query.all()
-        return jsonify([{
-            'id': p.id,
-            'name': p.name,
-            'gender': p.gender,
-            'disease': p.disease,
-            'room_id': p.room_id,
-            'room_number': p.room.room_number if p.room else None,
-            'status': p.status,
-            'admission_date': p.admission_date.isoformat(),
-            'deposited_amount': float(p.deposited_amount),
-            'pending_amount': float(p.pending_amount) if p.pending_amount else None,
-            'total_amount': float(p.total_amount) if p.total_amount else None,
-            'created_at': p.created_at.isoformat(),
-            'updated_at': p.updated_at.isoformat()
-        } for p in patients]), 200
+        return jsonify([serialize(p) for p in patients]), 200
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @patients_bp.route('/patients/<string:patient_id>', methods=['GET'])
+@conditional(_patient_version)
 def get_patient(patient_id):
     """Get a single patient by ID"""
     try:
+        # Sparse fieldsets return just the requested columns
+        if request.args.get('fields'):
+            try:
+                query, serialize = sparse_fieldset(
+                    Patient.query.filter(Patient.id == patient_id),
+                    request.args.get('fields'), PATIENT_COLUMNS, _patient_row, PATIENT_JOINS
+                )
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            row = query.first()
+            if not row:
+                return jsonify({'error': 'Not found'}), 404
+            return jsonify(serialize(row)), 200
+        
         patient = Patient.query.get_or_404(patient_id)
         return jsonify({
             'id': patient.id,
@@ -110,6 +202,8 @@ def create_patient():
         
         db.session.add(patient)
         db.session.commit()
+        index_patient(patient)
+        index_room(room)
         
         return jsonify({
             'id': patient.id,
@@ -140,6 +234,7 @@ def update_patient(patient_id):
             patient.deposited_amount = float(data['deposited_amount'])
         
         # Handle room change if needed
+        changed_rooms = []
         if 'room_id' in data and data['room_id'] != patient.room_id:
             new_room = Room.query.get(data['room_id'])
             if not new_room or new_room.status != 'available':
@@ -148,13 +243,18 @@ def update_patient(patient_id):
             # Free up the old room
             if patient.room:
                 patient.room.status = 'available'
+                changed_rooms.append(patient.room)
             
             # Assign new room
             patient.room_id = data['room_id']
             new_room.status = 'occupied'
+            changed_rooms.append(new_room)
         
         patient.updated_at = datetime.utcnow()
         db.session.commit()
+        index_patient(patient)
+        for room in changed_rooms:
+            index_room(room)
         
         return jsonify({
             'id': patient.id,
@@ -181,13 +281,17 @@ def update_patient_status(patient_id):
             return jsonify({'error': 'Invalid status'}), 400
             
         # Handle discharge
+        freed_room = None
         if new_status == 'discharged' and patient.room:
-            patient.room.status = 'available'
+            freed_room = patient.room
+            freed_room.status = 'available'
             patient.room_id = None
         
         patient.status = new_status
         patient.updated_at = datetime.utcnow()
         db.session.commit()
+        index_patient(patient)
+        index_room(freed_room)
         
         return jsonify({
             'id': patient.id,
@@ -206,11 +310,14 @@ def delete_patient(patient_id):
         patient = Patient.query.get_or_404(patient_id)
         
         # Free up the room if patient is in one
-        if patient.room:
-            patient.room.status = 'available'
+        freed_room = patient.room
+        if freed_room:
+            freed_room.status = 'available'
         
         db.session.delete(patient)
         db.session.commit()
+        remove_patient(patient.id)
+        index_room(freed_room)
         
         return '', 204
         
@@ -220,29 +327,17 @@ def delete_patient(patient_id):
 
 @patients_bp.route('/patients/stats', methods=['GET'])
 def get_patient_stats():
-    """Get patient statistics"""
+    """Get patient statistics from the incrementally maintained counters"""
     try:
-        total = Patient.query.count()
-        admitted = Patient.query.filter_by(status='admitted').count()
-        discharged = Patient.query.filter_by(status='discharged').count()
-        pending = Patient.query.filter_by(status='pending').count()
-        
-        # Calculate revenue and pending payments
-        result = db.session.query(
-            db.func.sum(Patient.deposited_amount).label('total_deposits'),
-            db.func.sum(Patient.total_amount - Patient.deposited_amount).label('total_pending')
-        ).first()
-        
-        total_revenue = float(result[0]) if result[0] else 0.0
-        pending_payments = float(result[1]) if result[1] else 0.0
+        stats = patient_stats()
         
         return jsonify({
-            'total': total,
-            'admitted': admitted,
-            'discharged': discharged,
-            'pending': pending,
-            'total_revenue': total_revenue,
-            'pending_payments': pending_payments
+            'total': stats['total'],
+            'admitted': stats['admitted'],
+            'discharged': stats['discharged'],
+            'pending': stats['pending'],
+            'total_revenue': round(stats['total_revenue'], 2),
+            'pending_payments': round(stats['pending_payments'], 2)
         }), 200
         
     except Exception as e:
@@ -250,18 +345,18 @@ def get_patient_stats():
 
 @patients_bp.route('/patients/search', methods=['GET'])
 def search_patients():
-    """Search patients by name, ID, or room number"""
+    """Search patients by name, ID, phone or room number"""
     try:
         query = request.args.get('q', '')
         if not query:
             return jsonify([]), 200
             
-        search = f"%{query}%"
-        patients = Patient.query.filter(
-            (Patient.name.ilike(search)) |
-            (Patient.id.ilike(search)) |
-            (Patient.room.has(Room.room_number.ilike(search)))
-        ).limit(10).all()
+        # Ranked ids from the search index, then one query for the rows
+        limit = request.args.get('limit', 10, type=int)
+        ids = search_patient_ids(query, max(1, min(limit, 50)))
+        rows = Patient.query.options(joinedload(Patient.room)).filter(Patient.id.in_(ids)).all() if ids else []
+        by_id = {p.id: p for p in rows}
+        patients = [by_id[pk] for pk in ids if pk in by_id]
         
         return jsonify([{
             'id': p.id,
@@ -1,34 +1,129 @@
 from flask import Blueprint, request, jsonify
 from models.room import Room
 from models.base import db
+from services.patient_search import index_patient
+from services.room_availability import (
+    index_room, remove_room, available_rooms, availability_summary, availability_version
+)
+from utils.decorators import conditional, query_version
+from utils.helpers import (
+    wants_keyset, parse_limit, keyset_paginate, page_total, wants_stream, stream_json_array,
+    model_columns, parse_fields, sparse_fieldset
+)
 
 rooms_bp = Blueprint('rooms', __name__)
 
+# Columns selectable with ?fields= (the keys of Room.to_dict)
+ROOM_COLUMNS = model_columns(Room, (
+    'id', 'room_number', 'room_type', 'status', 'floor', 'rate_per_day', 'created_at', 'updated_at'
+))
+
+def _available_only():
+    return request.args.get('available', '').lower() in ('1', 'true', 'yes')
+
+def _from_index():
+    """Available-room listings without a cursor or stream are answered from the availability index"""
+    return _available_only() and not wants_keyset(request.args) and not wants_stream(request.args)
+
+def _filtered_rooms():
+    """Rooms matching ?status=&type=&available="""
+    query = Room.query
+    if request.args.get('status'):
+        query = query.filter(Room.status == request.args.get('status'))
+    if request.args.get('type'):
+        query = query.filter(Room.room_type == request.args.get('type'))
+    if _available_only():
+        query = query.filter(Room.status == 'available')
+    return query
+
+def _rooms_version():
+    """Version of the rooms get_rooms() would return; index answers need no query"""
+    if _from_index():
+        return availability_version()
+    return query_version(_filtered_rooms(), Room)
+
+def _room_version(room_id):
+    version = query_version(Room.query.filter(Room.id == room_id), Room)
+    return version if version[0] else None
+
 @rooms_bp.route('/rooms', methods=['GET'])
+@conditional(_rooms_version)
 def get_rooms():
     """Get all rooms with optional filters"""
     try:
         status = request.args.get('status')
         room_type = request.args.get('type')
         
-        query = Room.query
+        available_only = _available_only()
+        
+        # Available rooms are answered from the in-memory availability index
+        if _from_index():
+            if status and status != 'available':
+                return jsonify([]), 200
+            rooms = available_rooms(room_type=room_type, floor=request.args.get('floor'))
+            if request.args.get('fields'):
+                try:
+                    names = parse_fields(request.args.get('fields'), ROOM_COLUMNS)
+                except ValueError as e:
+                    return jsonify({'error': str(e)}), 400
+                rooms = [{name: room[name] for name in names} for room in rooms]
+            return jsonify(rooms), 200
+        
+        query = _filtered_rooms()
+        
+        # Sparse fieldsets: ?fields=room_number,status
+        try:
+            query, serialize = sparse_fieldset(query, request.args.get('fields'), ROOM_COLUMNS, Room.to_dict)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
-        if status:
-            query = query.filter(Room.status == status)
+        # Cursor pagination: ?after=<cursor>&limit=<n>
+        if wants_keyset(request.args):
+            try:
+                limit = parse_limit(request.args.get('limit'))
+                rooms, next_cursor = keyset_paginate(query, Room.id, request.args.get('after'), limit)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
             
-        if room_type:
-            query = query.filter(Room.room_type == room_type)
+            response = {
+                'data': [serialize(room) for room in rooms],
+                'next_cursor': next_cursor,
+                'has_more': next_cursor is not None,
+                'limit': limit
+            }
+            total = page_total(query, Room, request.args.get('total'), bool(status or room_type or available_only))
+            if total is not None:
+                response['total'] = total
+            return jsonify(response), 200
+        
+        # Streamed array for unbounded listings: ?stream=1
+        if wants_stream(request.args):
+            return stream_json_array(query.order_by(Room.id), serialize)
             
         rooms = query.all()
-        return jsonify([room.to_dict() for room in rooms]), 200
+        return jsonify([serialize(room) for room in rooms]), 200
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @rooms_bp.route('/rooms/<int:room_id>', methods=['GET'])
+@conditional(_room_version)
 def get_room(room_id):
     """Get a single room by ID"""
     try:
+        # Sparse fieldsets return just the requested columns
+        if request.args.get('fields'):
+            try:
+                query, serialize = sparse_fieldset(
+                    Room.query.filter(Room.id == room_id), request.args.get('fields'), ROOM_COLUMNS, Room.to_dict
+                )
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            row = query.first()
+            if not row:
+                return jsonify({'error': 'Not found'}), 404
+            return jsonify(serialize(row)), 200
+        
         room = Room.query.get_or_404(room_id)
         return jsonify(room.to_dict()), 200
     except Exception as e:
@@ -60,6 +155,7 @@ def create_room():
         
         db.session.add(room)
         db.session.commit()
+        index_room(room)
         
         return jsonify(room.to_dict()), 201
         
@@ -73,6 +169,7 @@ def update_room(room_id):
     try:
         room = Room.query.get_or_404(room_id)
         data = request.get_json()
+        old_room_number = room.room_number
         
         # Update fields if provided
         if 'room_number' in data and data['room_number'] != room.room_number:
@@ -95,6 +192,13 @@ def update_room(room_id):
             room.update_status(data['status'])
         
         db.session.commit()
+        index_room(room)
+        
+        # Occupants are searchable by room number
+        if room.room_number != old_room_number:
+            for patient in room.patients:
+                index_patient(patient)
+        
         return jsonify(room.to_dict()), 200
         
     except ValueError as e:
@@ -117,6 +221,7 @@ def delete_room(room_id):
             
         db.session.delete(room)
         db.session.commit()
+        remove_room(room_id)
         
         return '', 204
         
@@ -126,9 +231,17 @@ def delete_room(room_id):
 
 @rooms_bp.route('/rooms/available', methods=['GET'])
 def get_available_rooms():
-    """Get all available rooms"""
+    """Get all available rooms, optionally by ?type= and ?floor="""
+    try:
+        rooms = available_rooms(room_type=request.args.get('type'), floor=request.args.get('floor'))
+        return jsonify(rooms), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@rooms_bp.route('/rooms/availability', methods=['GET'])
+def get_room_availability():
+    """Free and total rooms per room type, status and floor"""
     try:
-        rooms = Room.query.filter_by(status='available').all()
-        return jsonify([room.to_dict() for room in rooms]), 200
+        return jsonify(availability_summary()), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -0,0 +1,375 @@
+"""
+Doctor slot availability index.
+
+Each doctor's day is split into SLOT_MINUTES slots from midnight and kept as
+an int bitmap: bit i is set when an active appointment overlaps slot i. An
+appointment covers [appointment_date, end_time), or one slot when end_time is
+empty, and may span several slots or days. Free slots are the working-hours
+mask with the busy bits cleared, so a week or a month is answered from one
+query for the days not cached yet and a few bit operations per day.
+
+Each cached day keeps the mask of every appointment on it, so bookings,
+reschedules and cancellations committed by this process update only the days
+they touch (see the session listeners at the bottom). Days are re-read after
+CACHE_TTL seconds to pick up bookings made by other workers.
+
+earliest_slots() searches many doctors at once (one query for the whole
+range and all of them) and book_appointment() books without double-booking
+by serializing bookings per doctor on the doctor row.
+
+Working hours come from DOCTOR_WORKING_HOURS (('09:00', '17:00')) and
+DOCTOR_WORKING_DAYS (weekday numbers, Monday = 0) in the app config.
+"""
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import event, inspect, update
+from sqlalchemy.orm import Session
+from models.base import db
+from models.appointment import Appointment
+from models.doctor import Doctor
+
+SLOT_MINUTES = 30
+WORKING_HOURS = ('09:00', '17:00')
+WORKING_DAYS = (0, 1, 2, 3, 4, 5, 6)
+ACTIVE_STATUSES = ('Scheduled', 'In Progress')
+CACHE_TTL = 60             # seconds before a cached day is re-read
+MAX_CACHED_DAYS = 50000    # (doctor, day) entries kept in memory
+MAX_RANGE_DAYS = 62
+
+
+def _slot_minutes():
+    return current_app.config.get('DOCTOR_SLOT_MINUTES', SLOT_MINUTES)
+
+
+def _day_start(day):
+    return datetime.combine(day, datetime.min.time())
+
+
+def _span_mask(day, start, end, slot_minutes):
+    """Bits of the slots on day overlapped by [start, end)"""
+    day_start = _day_start(day)
+    slots_per_day = 24 * 60 // slot_minutes
+    first = max(0, int((start - day_start).total_seconds() // 60 // slot_minutes))
+    minutes = (end - day_start).total_seconds() / 60
+    last = min(slots_per_day, -int(-minutes // slot_minutes))   # ceil
+    if last <= first:
+        return 0
+    return ((1 << (last - first)) - 1) << first
+
+
+def appointment_masks(start, end, slot_minutes):
+    """{day: mask} for an appointment from start to end (None: one slot)"""
+    end = end if end and end > start else start + timedelta(minutes=slot_minutes)
+    masks = {}
+    day = start.date()
+    while _day_start(day) < end:
+        mask = _span_mask(day, start, end, slot_minutes)
+        if mask:
+            masks[day] = mask
+        day += timedelta(days=1)
+    return masks
+
+
+def _busy(appointments):
+    busy = 0
+    for mask in appointments.values():
+        busy |= mask
+    return busy
+
+
+class DoctorAvailabilityIndex:
+    """Thread-safe per-doctor, per-day busy-slot bitmaps"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (doctor_id, day) -> [loaded_at, {appointment_id: mask}, busy mask]
+        self._days = OrderedDict()
+        self._doctor_days = {}   # doctor_id -> days cached for that doctor
+        self._slot_minutes = None
+
+    def _store(self, key, appointments, loaded_at):
+        self._days[key] = [loaded_at, appointments, _busy(appointments)]
+        self._days.move_to_end(key)
+        self._doctor_days.setdefault(key[0], set()).add(key[1])
+        while len(self._days) > MAX_CACHED_DAYS:
+            (doctor_id, day), _ = self._days.popitem(last=False)
+            self._doctor_days[doctor_id].discard(day)
+
+    def _load(self, doctor_ids, days, slot_minutes):
+        """Read the appointments of the given doctors and days with one query; returns their busy masks"""
+        first, last = min(days), max(days)
+        range_start, range_end = _day_start(first), _day_start(last + timedelta(days=1))
+        rows = db.session.query(
+            Appointment.id, Appointment.doctor_id, Appointment.appointment_date, Appointment.end_time
+        ).filter(
+            Appointment.doctor_id.in_(doctor_ids),
+            Appointment.status.in_(ACTIVE_STATUSES),
+            Appointment.appointment_date < range_end,
+            (Appointment.end_time > range_start)
+            | (Appointment.end_time.is_(None) & (Appointment.appointment_date >= range_start - timedelta(minutes=slot_minutes)))
+        ).all()
+
+        loaded = {(doctor_id, day): {} for doctor_id in doctor_ids for day in days}
+        for appointment_id, doctor_id, start, end in rows:
+            for day, mask in appointment_masks(start, end, slot_minutes).items():
+                if (doctor_id, day) in loaded:
+                    loaded[(doctor_id, day)][appointment_id] = mask
+        now = time.monotonic()
+        with self._lock:
+            for key, appointments in loaded.items():
+                self._store(key, appointments, now)
+        return {key: _busy(appointments) for key, appointments in loaded.items()}
+
+    def busy_many(self, doctor_ids, first, last):
+        """{doctor_id: {day: busy mask}} for first..last inclusive"""
+        slot_minutes = _slot_minutes()
+        days = [first + timedelta(days=n) for n in range((last - first).days + 1)]
+        now = time.monotonic()
+        with self._lock:
+            if slot_minutes != self._slot_minutes:
+                self._days.clear()
+                self._doctor_days.clear()
+                self._slot_minutes = slot_minutes
+            busy = {doctor_id: {} for doctor_id in doctor_ids}
+            stale = set()
+            for doctor_id in doctor_ids:
+                for day in days:
+                    entry = self._days.get((doctor_id, day))
+                    if entry is None or now - entry[0] >= CACHE_TTL:
+                        stale.add((doctor_id, day))
+                    else:
+                        busy[doctor_id][day] = entry[2]
+        if stale:
+            # Taken from the load itself: a big range may evict cached days before they are read back
+            loaded = self._load(sorted({doctor_id for doctor_id, _ in stale}), sorted({day for _, day in stale}), slot_minutes)
+            for (doctor_id, day), mask in loaded.items():
+                if (doctor_id, day) in stale:
+                    busy[doctor_id][day] = mask
+        return busy
+
+    def busy(self, doctor_id, first, last):
+        """{day: busy mask} for first..last inclusive"""
+        return self.busy_many([doctor_id], first, last)[doctor_id]
+
+    def apply(self, doctor_id, appointment_id, masks):
+        """Replace an appointment's bits on the cached days (masks {} removes it)"""
+        with self._lock:
+            touched = {day for day in self._doctor_days.get(doctor_id, ())
+                       if appointment_id in self._days[(doctor_id, day)][1]} | set(masks)
+            for day in touched:
+                entry = self._days.get((doctor_id, day))
+                if entry is None:
+                    continue
+                appointments = dict(entry[1])
+                appointments.pop(appointment_id, None)
+                if day in masks:
+                    appointments[appointment_id] = masks[day]
+                self._store((doctor_id, day), appointments, entry[0])
+
+    def clear(self):
+        with self._lock:
+            self._days.clear()
+            self._doctor_days.clear()
+
+
+doctor_availability = DoctorAvailabilityIndex()
+
+
+def working_mask(day, slot_minutes=None):
+    """Bits of the slots that lie completely inside the working hours of day"""
+    slot_minutes = slot_minutes or _slot_minutes()
+    if day.weekday() not in current_app.config.get('DOCTOR_WORKING_DAYS', WORKING_DAYS):
+        return 0
+    opens, closes = current_app.config.get('DOCTOR_WORKING_HOURS', WORKING_HOURS)
+    day_start = _day_start(day)
+    start = datetime.combine(day, datetime.strptime(opens, '%H:%M').time())
+    end = datetime.combine(day, datetime.strptime(closes, '%H:%M').time())
+    first = -int(-(start - day_start).total_seconds() // 60 // slot_minutes)
+    last = int((end - day_start).total_seconds() // 60 // slot_minutes)
+    return ((1 << (last - first)) - 1) << first if last > first else 0
+
+
+def free_slots(doctor_id, first, last):
+    """{day: [slot start datetimes]} of the working-hour slots free on first..last"""
+    slot_minutes = _slot_minutes()
+    busy = doctor_availability.busy(doctor_id, first, last)
+    result = {}
+    for day, taken in busy.items():
+        free = working_mask(day, slot_minutes) & ~taken
+        day_start = _day_start(day)
+        slots = []
+        while free:
+            low = free & -free
+            slots.append(day_start + timedelta(minutes=(low.bit_length() - 1) * slot_minutes))
+            free ^= low
+        result[day] = slots
+    return result
+
+
+def _set_bits(mask):
+    """Indexes of the set bits, lowest first"""
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+def earliest_slots(doctor_ids, first, last, duration_minutes, limit, not_before=None):
+    """
+    The limit earliest starts on first..last at which one of the doctors is
+    free for duration_minutes, as [(start, end, doctor_id)] ordered by start.
+
+    The whole range (at most MAX_RANGE_DAYS) is read with one appointments
+    query for all the doctors; the day scan stops at the first day that
+    fills limit.
+    """
+    slot_minutes = _slot_minutes()
+    needed = max(1, -(-duration_minutes // slot_minutes))
+    found = []
+    busy = doctor_availability.busy_many(doctor_ids, first, last)
+    day = first
+    while day <= last and len(found) < limit:
+        open_slots = working_mask(day, slot_minutes)
+        day_start = _day_start(day)
+        candidates = []
+        for doctor_id in doctor_ids:
+            free = open_slots & ~busy[doctor_id].get(day, 0)
+            # Bit i survives when slots i .. i + needed - 1 are all free
+            starts = free
+            for shift in range(1, needed):
+                starts &= free >> shift
+            taken = 0
+            for bit in _set_bits(starts):
+                start = day_start + timedelta(minutes=bit * slot_minutes)
+                if not_before is not None and start < not_before:
+                    continue
+                candidates.append((start, start + timedelta(minutes=needed * slot_minutes), doctor_id))
+                taken += 1
+                if taken == limit:
+                    break
+        candidates.sort()
+        found.extend(candidates[:limit - len(found)])
+        day += timedelta(days=1)
+    return found
+
+
+class SlotUnavailable(Exception):
+    """Raised when an appointment cannot be booked"""
+
+    def __init__(self, message, not_found=False):
+        super().__init__(message)
+        self.not_found = not_found
+
+
+def book_appointment(doctor_id, patient_id, start, end, reason=None):
+    """
+    Book [start, end) with a doctor without double-booking.
+
+    The doctor row is claimed first with a conditional UPDATE, which holds
+    its row lock until commit, so concurrent bookings for the same doctor
+    run the overlap check one at a time. Raises SlotUnavailable.
+    """
+    slot_minutes = _slot_minutes()
+    masks = appointment_masks(start, end, slot_minutes)
+    if len(masks) != 1 or masks.get(start.date(), 0) & ~working_mask(start.date(), slot_minutes):
+        raise SlotUnavailable('Requested time is outside working hours')
+
+    claimed = db.session.execute(
+        update(Doctor).where(Doctor.id == doctor_id, Doctor.is_available.is_(True))
+        .values(updated_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if not claimed:
+        db.session.rollback()
+        if db.session.get(Doctor, doctor_id) is None:
+            raise SlotUnavailable('Doctor not found', not_found=True)
+        raise SlotUnavailable('Doctor is not available')
+
+    conflict = db.session.query(Appointment.id).filter(
+        Appointment.doctor_id == doctor_id,
+        Appointment.status.in_(ACTIVE_STATUSES),
+        Appointment.appointment_date < end,
+        (Appointment.end_time > start)
+        | (Appointment.end_time.is_(None) & (Appointment.appointment_date > start - timedelta(minutes=slot_minutes)))
+    ).first()
+    if conflict:
+        db.session.rollback()
+        raise SlotUnavailable('Slot is already booked')
+
+    appointment = Appointment(
+        appointment_id=f"APT-{str(uuid.uuid4())[:8].upper()}",
+        patient_id=patient_id,
+        doctor_id=doctor_id,
+        appointment_date=start,
+        end_time=end,
+        status='Scheduled',
+        reason=reason
+    )
+    db.session.add(appointment)
+    db.session.commit()
+    return appointment
+
+
+def parse_range(args):
+    """(first, last) days from ?from=&to= or ?date=; raises ValueError"""
+    if args.get('date') and not (args.get('from') or args.get('to')):
+        first = last = datetime.strptime(args['date'], '%Y-%m-%d').date()
+    else:
+        if not args.get('from'):
+            raise ValueError('from (or date) parameter is required')
+        first = datetime.strptime(args['from'], '%Y-%m-%d').date()
+        last = datetime.strptime(args['to'], '%Y-%m-%d').date() if args.get('to') else first
+    if last < first:
+        raise ValueError('to must not be before from')
+    if (last - first).days >= MAX_RANGE_DAYS:
+        raise ValueError(f'Range is limited to {MAX_RANGE_DAYS} days')
+    return first, last
+
+
+# -- incremental updates ---------------------------------------------------
+
+def _masks_for(target):
+    if target.status not in ACTIVE_STATUSES or target.appointment_date is None:
+        return {}
+    return appointment_masks(target.appointment_date, target.end_time, _slot_minutes())
+
+
+def _queue(session, target, masks):
+    session.info.setdefault('appointment_changes', {})[target.id] = (target.doctor_id, masks)
+
+
+@event.listens_for(Appointment, 'after_insert')
+def _appointment_inserted(mapper, connection, target):
+    _queue(inspect(target).session, target, _masks_for(target))
+
+
+@event.listens_for(Appointment, 'after_update')
+def _appointment_updated(mapper, connection, target):
+    state = inspect(target)
+    old_doctor = state.attrs.doctor_id.history.deleted
+    if old_doctor and old_doctor[0] != target.doctor_id:
+        state.session.info.setdefault('appointment_changes_moved', []).append((old_doctor[0], target.id))
+    _queue(state.session, target, _masks_for(target))
+
+
+@event.listens_for(Appointment, 'after_delete')
+def _appointment_deleted(mapper, connection, target):
+    _queue(inspect(target).session, target, {})
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_appointment_changes(session):
+    for doctor_id, appointment_id in session.info.pop('appointment_changes_moved', ()):
+        doctor_availability.apply(doctor_id, appointment_id, {})
+    for appointment_id, (doctor_id, masks) in session.info.pop('appointment_changes', {}).items():
+        doctor_availability.apply(doctor_id, appointment_id, masks)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_appointment_changes(session):
+    session.info.pop('appointment_changes', None)
+    session.info.pop('appointment_changes_moved', None)
@@ -0,0 +1,327 @@
+"""
+In-process index for front-desk patient search.
+
+Every searchable field (patient id, room number, phone, name) is lower-cased
+and stored once per patient as a tuple, and indexed three ways, one per
+ranking tier:
+
+* a sorted list of (value, pk) per field: the values starting with the query
+  are one bisect away (tier 1),
+* a sorted list of (rest of the value from each later word, pk) per field:
+  words starting with the query, the same way (tier 2),
+* trigram postings ("3~mit": the name field contains "mit"), compact integer
+  arrays used for substring matches (tier 3).
+
+A search walks the tiers best-first and, inside each tier, the fields most
+specific first, stopping as soon as it has enough results. Prefix tiers read
+exactly the matching range, so a common name costs what a rare one does;
+substring matches start from the query's rarest trigram in that field and
+verify against the stored tuple. Results come out already ranked, nothing is
+sorted or cut and lookups never touch the patients table.
+
+The index is loaded by the background thread init_patient_search() starts,
+which then catches up on patients.updated_at every SYNC_INTERVAL seconds;
+the create/update/delete routes call index_patient()/remove_patient() after
+they commit. Rows deleted by other workers are dropped when the route loads
+the ranked ids back from the database.
+"""
+from array import array
+from bisect import bisect_left, insort
+import logging
+import re
+import threading
+import time
+from models.base import db
+from models.patient import Patient
+from models.room import Room
+
+# Field order inside a stored document, most specific first
+FIELDS = ('patient_id', 'room_number', 'phone', 'name')
+
+SYNC_INTERVAL = 5            # seconds between catch-up syncs
+TOKEN_SPLIT = re.compile(r'[\s\-_/.,]+')
+WORD_START = re.compile(r'[\s\-_/.,]+(?=([^\s\-_/.,].*))')
+BULK_SYNC_ROWS = 1000        # catch-ups at least this big re-sort instead of inserting
+
+logger = logging.getLogger(__name__)
+
+
+def _normalize(value):
+    return ' '.join(str(value).lower().split()) if value is not None else ''
+
+
+def _trigrams(field, value):
+    head = f'{field}~'
+    return {head + value[i:i + 3] for i in range(len(value) - 2)}
+
+
+def _words(value):
+    """The rest of the value from the start of each word after the first"""
+    return [match.group(1) for match in WORD_START.finditer(value)]
+
+
+def _values(pk, room_number, phone, name):
+    return (_normalize(pk), _normalize(room_number), _normalize(phone), _normalize(name))
+
+
+def _is_word_start(value, key):
+    """True when key is the part of value that starts at one of its later words"""
+    position = len(value) - len(key)
+    return position > 0 and value.endswith(key) and TOKEN_SPLIT.match(value, position - 1) is not None
+
+
+def _range(keys, query):
+    """(key, pk) entries of a sorted list whose key starts with query"""
+    for i in range(bisect_left(keys, (query,)), len(keys)):
+        key, pk = keys[i]
+        if not key.startswith(query):
+            return
+        yield key, pk
+
+
+class PatientSearchIndex:
+    """Thread-safe sorted-key/trigram index over the searchable patient fields"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self._docs = {}                             # pk -> normalized values, in FIELDS order
+        self._starts = [[] for _ in FIELDS]         # per field: sorted (value, pk)
+        self._words = [[] for _ in FIELDS]          # per field: sorted (value from a later word, pk)
+        self._postings = {}                         # trigram -> array of pks
+        self._stale = 0
+        self._built = False
+        self._synced_at = None
+
+    # -- maintenance -------------------------------------------------------
+
+    def _add(self, pk, values, keep_sorted=True):
+        old = self._docs.get(pk)
+        insert = insort if keep_sorted else list.append
+        for field, value in enumerate(values):
+            old_value = old[field] if old is not None else ''
+            if value == old_value:
+                continue
+            if value:
+                insert(self._starts[field], (value, pk))
+                for key in _words(value):
+                    insert(self._words[field], (key, pk))
+            old_grams = _trigrams(field, old_value)
+            new_grams = _trigrams(field, value)
+            for gram in new_grams - old_grams:
+                posting = self._postings.get(gram)
+                if posting is None:
+                    posting = self._postings[gram] = array('i')
+                posting.append(pk)
+            # Entries for the old value are filtered at query time
+            self._stale += len(old_grams - new_grams) + (1 + len(_words(old_value)) if old_value else 0)
+        self._docs[pk] = values
+
+    def _maybe_compact(self):
+        if self._stale > 10 * max(len(self._docs), 1000):
+            self._fill(self._docs.items())
+
+    def _fill(self, docs):
+        """Rebuild every structure from (pk, values) pairs"""
+        starts = [[] for _ in FIELDS]
+        words = [[] for _ in FIELDS]
+        postings = {}
+        stored = {}
+        for pk, values in docs:
+            stored[pk] = values
+            for field, value in enumerate(values):
+                if not value:
+                    continue
+                starts[field].append((value, pk))
+                for key in _words(value):
+                    words[field].append((key, pk))
+                for gram in _trigrams(field, value):
+                    posting = postings.get(gram)
+                    if posting is None:
+                        posting = postings[gram] = array('i')
+                    posting.append(pk)
+        for keys in starts + words:
+            keys.sort()
+        self._docs, self._starts, self._words, self._postings = stored, starts, words, postings
+        self._stale = 0
+
+    def add(self, pk, patient_id=None, name=None, phone=None, room_number=None):
+        """Insert or replace one patient's document"""
+        values = _values(patient_id, room_number, phone, name)
+        with self._lock:
+            self._add(pk, values)
+            self._maybe_compact()
+
+    def remove(self, pk):
+        with self._lock:
+            values = self._docs.pop(pk, None)
+            if values is not None:
+                self._stale += sum(
+                    len(_trigrams(field, value)) + 1 + len(_words(value))
+                    for field, value in enumerate(values) if value
+                )
+            self._maybe_compact()
+
+    def _rows(self, query):
+        return query.with_entities(
+            Patient.id, Room.room_number, Patient.emergency_contact,
+            Patient.name, Patient.updated_at
+        ).outerjoin(Room, Patient.room_id == Room.id)
+
+    def load(self, rows):
+        """
+        Replace the index with (pk, room_number, phone, name, updated_at) rows.
+
+        The new index is built in a scratch instance and swapped in at the end,
+        so searches keep answering from the old one meanwhile; writes indexed
+        during the load are picked up again by the next sync().
+        """
+        synced_at = None
+
+        def docs():
+            nonlocal synced_at
+            for pk, room_number, phone, name, updated_at in rows:
+                if updated_at and (synced_at is None or updated_at > synced_at):
+                    synced_at = updated_at
+                yield pk, _values(pk, room_number, phone, name)
+
+        fresh = PatientSearchIndex()
+        fresh._fill(docs())
+        with self._lock:
+            self._docs, self._starts, self._words = fresh._docs, fresh._starts, fresh._words
+            self._postings, self._stale = fresh._postings, 0
+            self._synced_at = synced_at
+            self._built = True
+
+    def build(self):
+        """Load every patient from the database (needs an app context)"""
+        self.load(self._rows(Patient.query).yield_per(5000))
+
+    def ensure_built(self):
+        """Build once; callers arriving during a build wait for it instead of starting another"""
+        with self._build_lock:
+            if not self._built:
+                self.build()
+
+    def sync(self):
+        """Re-index patients changed since the last build or sync"""
+        if not self._built:
+            self.ensure_built()
+            return
+
+        query = Patient.query
+        if self._synced_at is not None:
+            query = query.filter(Patient.updated_at >= self._synced_at)
+        rows = self._rows(query).all()
+        # Inserting one by one shifts the sorted lists each time; a big catch-up re-sorts once
+        keep_sorted = len(rows) < BULK_SYNC_ROWS
+        with self._lock:
+            for pk, room_number, phone, name, updated_at in rows:
+                self._add(pk, _values(pk, room_number, phone, name), keep_sorted)
+                if updated_at and (self._synced_at is None or updated_at > self._synced_at):
+                    self._synced_at = updated_at
+            if not keep_sorted:
+                for keys in self._starts + self._words:
+                    keys.sort()
+            self._maybe_compact()
+
+    # -- queries -----------------------------------------------------------
+
+    def _collect(self, results, limit, candidates, matches):
+        """Add verified candidates in order until results are full"""
+        docs = self._docs
+        for pk in candidates:
+            if pk in results:
+                continue
+            values = docs.get(pk)
+            if values is not None and matches(values):
+                results[pk] = None
+                if len(results) >= limit:
+                    return True
+        return False
+
+    def search(self, query, limit=10):
+        """Return up to `limit` patient ids ranked by match quality"""
+        query = _normalize(query)
+        if not query:
+            return []
+
+        results = {}
+        with self._lock:
+            docs = self._docs
+
+            # Tier 1: a field starts with the query
+            for field in range(len(FIELDS)):
+                candidates = (pk for value, pk in _range(self._starts[field], query)
+                              if pk in docs and docs[pk][field] == value)
+                if self._collect(results, limit, candidates, lambda values: True):
+                    return list(results)
+
+            # Tier 2: a later word inside a field starts with the query
+            for field in range(len(FIELDS)):
+                candidates = (pk for key, pk in _range(self._words[field], query)
+                              if pk in docs and _is_word_start(docs[pk][field], key))
+                if self._collect(results, limit, candidates, lambda values: True):
+                    return list(results)
+
+            # Tier 3: plain substring of a field, starting from its rarest trigram
+            if len(query) < 3:
+                return list(results)
+            for field in range(len(FIELDS)):
+                postings = [self._postings.get(gram) for gram in _trigrams(field, query)]
+                if None in postings:
+                    continue
+                matches = lambda values, field=field: query in values[field]
+                if self._collect(results, limit, min(postings, key=len), matches):
+                    return list(results)
+
+        return list(results)
+
+
+patient_index = PatientSearchIndex()
+
+
+def index_patient(patient):
+    """Refresh one patient after a committed create/update"""
+    if not patient_index._built:
+        return
+    patient_index.add(
+        patient.id,
+        patient_id=patient.id,
+        name=patient.name,
+        phone=patient.emergency_contact,
+        room_number=patient.room.room_number if patient.room else None
+    )
+
+
+def remove_patient(pk):
+    """Drop a patient after a committed delete"""
+    patient_index.remove(pk)
+
+
+def search_patient_ids(query, limit=10):
+    """Ranked patient ids for a search string, waiting for the first build if needed"""
+    patient_index.ensure_built()
+    return patient_index.search(query, limit)
+
+
+def _sync_forever(app, interval):
+    while True:
+        # The first pass builds the index, so no search has to
+        with app.app_context():
+            try:
+                patient_index.sync()
+            except Exception:
+                logger.exception('Patient search sync failed')
+            finally:
+                # A fresh session per pass, so MySQL's repeatable-read snapshot cannot hide new rows
+                db.session.remove()
+        time.sleep(interval)
+
+
+def init_patient_search(app):
+    """Build the index in the background, then catch it up with other workers' writes on a timer"""
+    interval = app.config.get('PATIENT_SEARCH_SYNC_INTERVAL', SYNC_INTERVAL)
+    threading.Thread(
+        target=_sync_forever, args=(app, interval), name='patient-search-sync', daemon=True
+    ).start()
@@ -0,0 +1,110 @@
+"""
+Patient statistics for the dashboard.
+
+The patient_stats table holds, per status, the number of patients and the
+sums of deposited and pending amounts. Listeners in models/patient_stat.py
+move these counters inside every transaction that inserts, updates or
+deletes a patient, so reading the statistics is a primary-key scan of a
+three-row table instead of aggregating over patients.
+
+reconcile() recomputes the counters with one grouped aggregate and rewrites
+any that drifted (rows written by scripts that bypass the ORM, float
+rounding). The comparison reads one snapshot without locks; only when it
+finds drift are the counter rows locked, so concurrent patient writes wait
+for the correction rather than being overwritten. It runs on a background
+timer started by init_patient_stats(), every RECONCILE_INTERVAL seconds,
+never on the read path. A status without a counter row simply has no
+patients yet and is not drift.
+"""
+import logging
+import threading
+import time
+from models.base import db
+from models.patient import Patient
+from models.patient_stat import PatientStat
+
+logger = logging.getLogger(__name__)
+
+STATUSES = ('admitted', 'discharged', 'pending')
+RECONCILE_INTERVAL = 300   # seconds between drift checks
+TOLERANCE = 0.005          # amounts closer than this are not drift
+
+def aggregate_by_status():
+    """status -> (count, deposited, pending), in a single grouped query"""
+    rows = db.session.query(
+        Patient.status,
+        db.func.count(Patient.id),
+        db.func.coalesce(db.func.sum(Patient.deposited_amount), 0.0),
+        db.func.coalesce(db.func.sum(Patient.total_amount - Patient.deposited_amount), 0.0)
+    ).group_by(Patient.status).all()
+    return {status: (count, float(deposited), float(pending)) for status, count, deposited, pending in rows}
+
+
+def _drifted(counters, actual):
+    """Statuses whose counter row disagrees with the aggregate; a missing row counts as zero"""
+    drifted = []
+    for status in set(counters) | set(actual):
+        count, deposited, pending = actual.get(status, (0, 0.0, 0.0))
+        stat = counters.get(status)
+        if stat is None:
+            if count:
+                drifted.append(status)
+        elif (stat.patient_count != count
+              or abs(stat.deposited_amount - deposited) >= TOLERANCE
+              or abs(stat.pending_amount - pending) >= TOLERANCE):
+            drifted.append(status)
+    return drifted
+
+
+def reconcile():
+    """Rewrite drifted counters from the patients table; returns the statuses fixed"""
+    # Spotting drift needs no locks; the locked pass below checks again before writing
+    counters = {stat.status: stat for stat in PatientStat.query.all()}
+    drifted = _drifted(counters, aggregate_by_status())
+    db.session.commit()
+    if not drifted:
+        return []
+
+    counters = {stat.status: stat for stat in PatientStat.query.with_for_update().all()}
+    actual = aggregate_by_status()
+    fixed = _drifted(counters, actual)
+    for status in fixed:
+        stat = counters.get(status)
+        if stat is None:
+            stat = PatientStat(status=status)
+            db.session.add(stat)
+        stat.patient_count, stat.deposited_amount, stat.pending_amount = actual.get(status, (0, 0.0, 0.0))
+    db.session.commit()
+    if fixed:
+        logger.warning('Patient stats drifted for %s; corrected', ', '.join(sorted(fixed)))
+    return fixed
+
+
+def _reconcile_forever(app, interval):
+    while True:
+        with app.app_context():
+            try:
+                reconcile()
+            except Exception:
+                logger.exception('Patient stats reconcile failed')
+            finally:
+                db.session.remove()
+        time.sleep(interval)
+
+
+def init_patient_stats(app):
+    """Check the counters against the patients table on a background timer"""
+    interval = app.config.get('PATIENT_STATS_RECONCILE_INTERVAL', RECONCILE_INTERVAL)
+    threading.Thread(
+        target=_reconcile_forever, args=(app, interval), name='patient-stats-reconcile', daemon=True
+    ).start()
+
+
+def patient_stats():
+    """Dashboard totals read from the counters table"""
+    counters = {stat.status: stat for stat in PatientStat.query.all()}
+    stats = {status: counters[status].patient_count if status in counters else 0 for status in STATUSES}
+    stats['total'] = sum(stat.patient_count for stat in counters.values())
+    stats['total_revenue'] = sum(stat.deposited_amount for stat in counters.values())
+    stats['pending_payments'] = sum(stat.pending_amount for stat in counters.values())
+    return stats
@@ -0,0 +1,165 @@
+"""
+Process-local room availability index.
+
+Rooms here are single-occupancy, so a room with status 'available' is one
+free bed. The index keeps a to_dict() snapshot of every room plus the set of
+free rooms per room_type, status and floor, which lets the availability
+endpoints answer without querying the rooms table.
+
+Routes that change a room (room CRUD, admission, room change, discharge,
+patient delete) call index_room()/remove_room() after they commit. Changes
+made by other workers are caught by comparing a fingerprint of the rooms
+table - row count, free rooms and latest updated_at - every few seconds and
+reloading on mismatch, plus a periodic full reload.
+"""
+import threading
+import time
+from models.base import db
+from models.room import Room
+
+KEYS = ('room_type', 'status', 'floor')
+FREE_STATUS = 'available'
+VERSION_CHECK_INTERVAL = 2   # seconds between fingerprint checks
+RESYNC_INTERVAL = 300        # full reload even when the fingerprint matches
+
+
+class RoomAvailabilityIndex:
+    """Thread-safe free-room sets and counts keyed by room_type, status and floor"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rooms = {}        # id -> Room.to_dict() snapshot
+        self._updated_at = {}   # id -> updated_at, for the fingerprint
+        self._free = set()      # ids of available rooms
+        self._by_key = {}       # (key, value) -> ids of rooms with that value
+        self._built = False
+        self._checked_at = 0.0
+        self._built_at = 0.0
+
+    # -- maintenance -------------------------------------------------------
+
+    def _discard(self, room_id):
+        data = self._rooms.pop(room_id, None)
+        self._updated_at.pop(room_id, None)
+        if data is None:
+            return
+        self._free.discard(room_id)
+        for key in KEYS:
+            ids = self._by_key.get((key, data[key]))
+            if ids is not None:
+                ids.discard(room_id)
+
+    def _add(self, data, updated_at):
+        self._discard(data['id'])
+        self._rooms[data['id']] = data
+        self._updated_at[data['id']] = updated_at
+        if data['status'] == FREE_STATUS:
+            self._free.add(data['id'])
+        for key in KEYS:
+            self._by_key.setdefault((key, data[key]), set()).add(data['id'])
+
+    def add(self, room):
+        """Insert or replace one room from a committed Room instance"""
+        data = room.to_dict()
+        with self._lock:
+            self._add(data, room.updated_at)
+
+    def remove(self, room_id):
+        with self._lock:
+            self._discard(room_id)
+
+    def _fingerprint(self):
+        latest = max((value for value in self._updated_at.values() if value), default=None)
+        return len(self._rooms), len(self._free), latest
+
+    def build(self):
+        """Load every room from the database (needs an app context)"""
+        rooms = Room.query.all()
+        with self._lock:
+            self._rooms, self._updated_at, self._free, self._by_key = {}, {}, set(), {}
+            for room in rooms:
+                self._add(room.to_dict(), room.updated_at)
+            self._built = True
+            self._built_at = self._checked_at = time.monotonic()
+
+    def sync(self):
+        """Reload when the rooms table no longer matches the index"""
+        now = time.monotonic()
+        if not self._built or now - self._built_at >= RESYNC_INTERVAL:
+            self.build()
+            return
+        if now - self._checked_at < VERSION_CHECK_INTERVAL:
+            return
+        self._checked_at = now
+
+        count, free, latest = db.session.query(
+            db.func.count(Room.id),
+            db.func.coalesce(db.func.sum(db.case((Room.status == FREE_STATUS, 1), else_=0)), 0),
+            db.func.max(Room.updated_at)
+        ).one()
+        with self._lock:
+            current = self._fingerprint() == (count, int(free), latest)
+        if not current:
+            self.build()
+
+    # -- queries -----------------------------------------------------------
+
+    def version(self):
+        """Row count, free count and latest updated_at the index holds, for ETags"""
+        with self._lock:
+            return self._fingerprint()
+
+    def available(self, **filters):
+        """Snapshots of available rooms matching every key=value filter"""
+        with self._lock:
+            ids = self._free
+            for key, value in filters.items():
+                if value is None:
+                    continue
+                if key not in KEYS:
+                    raise ValueError(f"Cannot filter availability by '{key}'")
+                ids = ids & self._by_key.get((key, value), set())
+            return [self._rooms[room_id] for room_id in sorted(ids)]
+
+    def summary(self):
+        """Free and total rooms overall and per room_type, status and floor"""
+        with self._lock:
+            data = {'free_rooms': len(self._free), 'total_rooms': len(self._rooms)}
+            for key in KEYS:
+                data[f'by_{key}'] = {
+                    value: {'free_rooms': len(ids & self._free), 'total_rooms': len(ids)}
+                    for (k, value), ids in self._by_key.items() if k == key and value is not None and ids
+                }
+            return data
+
+
+room_availability = RoomAvailabilityIndex()
+
+
+def index_room(room):
+    """Refresh one room after a committed change to it"""
+    if room is not None and room_availability._built:
+        room_availability.add(room)
+
+
+def remove_room(room_id):
+    """Drop a room after a committed delete"""
+    room_availability.remove(room_id)
+
+
+def available_rooms(room_type=None, floor=None):
+    """Available rooms, served from the availability index"""
+    room_availability.sync()
+    return room_availability.available(room_type=room_type, floor=floor)
+
+
+def availability_summary():
+    """Free-room counts per room type, status and floor, served from the index"""
+    room_availability.sync()
+    return room_availability.summary()
+
+
+def availability_version():
+    """Version of the availability index, checked against the database at most every few seconds"""
+    room_availability.sync()
+    return room_availability.version()
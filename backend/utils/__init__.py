@@ -0,0 +1,3 @@
+# This file makes the utils directory a Python package.
+# compression, json_provider, metrics, profiler and query_stats are copies of
+# flask_hms/utils: edit those and run check_shared_utils.py --fix.
@@ -0,0 +1,70 @@
+"""
+Conditional GET for read endpoints.
+
+@conditional(version) answers a GET with 304 Not Modified, without running
+the view, when the client already has the current representation. version
+is called with the view's arguments and returns a cheap fingerprint of the
+data behind the response - usually query_version(), the row count and the
+newest updated_at of the filtered rows - as a tuple whose last element may
+be the Last-Modified time.
+
+The ETag hashes the fingerprint with the request path and query string, so
+every filter, page and field selection has its own. If-None-Match is
+checked first; If-Modified-Since is only used when the client sent no ETag.
+Only the ETag sees deletions, which lower the row count without moving
+updated_at.
+"""
+import hashlib
+from functools import wraps
+from flask import request, make_response
+from werkzeug.http import http_date, parse_date
+from models.base import db
+
+
+def query_version(query, model):
+    """(row count, newest updated_at) of the rows a query selects"""
+    return tuple(query.with_entities(
+        db.func.count(model.id), db.func.max(model.updated_at)
+    ).order_by(None).one())
+
+
+def _etag(version):
+    raw = f'{request.full_path}|{version!r}'.encode()
+    return hashlib.sha1(raw).hexdigest()[:20]
+
+
+def _not_modified(etag, last_modified):
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    since = parse_date(request.headers.get('If-Modified-Since'))
+    if since is None or last_modified is None:
+        return False
+    return last_modified.replace(microsecond=0, tzinfo=since.tzinfo) <= since
+
+
+def conditional(version):
+    """Serve 304 Not Modified when version(*args, **kwargs) is unchanged"""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            current = version(*args, **kwargs)
+            if current is None:
+                # Nothing to fingerprint (e.g. not found): let the view answer
+                return view(*args, **kwargs)
+
+            last_modified = current[-1] if current and hasattr(current[-1], 'strftime') else None
+            etag = _etag(current)
+            if _not_modified(etag, last_modified):
+                response = make_response('', 304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.headers['ETag'] = f'W/"{etag}"'
+            if last_modified is not None:
+                response.headers['Last-Modified'] = http_date(last_modified)
+            # Cacheable, but revalidated on every use
+            response.headers['Cache-Control'] = 'no-cache'
+            return response
+        return wrapper
+    return decorator
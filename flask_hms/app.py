@@ -3,18 +3,28 @@ from flask_cors import CORS
 from flask_socketio import SocketIO
 from config import config
 from database import db, ma, migrate
+from services.event_service import dispatcher
+from services.audit_service import audit_writer
+from services.audit_storage import audit_cli
+from services.billing_service import billing_cli
+from services.message_bus import create_client_manager
+from utils.json_provider import CompactJSONProvider
+from utils.compression import init_compression
+from utils.query_stats import init_query_stats
+from utils.metrics import init_metrics
+from utils.profiler import init_profiler
 
 # Import models
 from models import (
     patient, doctor, nurse, room, prescription, 
-    lab_report, bill, treatment, audit_log, ambulance, employee
+    lab_report, bill, treatment, audit_log, audit_checkpoint, ambulance, employee
 )
 
 # Import routes
 from routes import (
     patients_bp, doctors_bp, nurses_bp, rooms_bp, 
     prescriptions_bp, lab_reports_bp, bills_bp, 
-    treatments_bp, ambulances_bp, audit_bp
+    treatments_bp, ambulances_bp, audit_bp, admin_bp
 )
 
 socketio = SocketIO(cors_allowed_origins="*")
@@ -24,13 +34,29 @@ def create_app(config_name='development'):
     
     # Load config
     app.config.from_object(config[config_name])
+    app.json = CompactJSONProvider(app)
     
     # Initialize extensions
     db.init_app(app)
     ma.init_app(app)
     migrate.init_app(app, db)
     CORS(app, resources={r"/api/*": {"origins": "*"}})
-    socketio.init_app(app)
+    init_compression(app)
+    init_query_stats(app)
+    
+    # With several workers, emits travel over the configured message bus
+    message_queue = app.config.get('SOCKETIO_MESSAGE_QUEUE')
+    channel = app.config.get('SOCKETIO_CHANNEL')
+    client_manager = create_client_manager(message_queue, channel=channel)
+    if client_manager is not None:
+        socketio.init_app(app, client_manager=client_manager)
+    elif message_queue:
+        socketio.init_app(app, message_queue=message_queue, channel=channel)
+    else:
+        socketio.init_app(app)
+    dispatcher.init_app(app, socketio)
+    init_metrics(app, db)
+    init_profiler(app)
     
     # Register blueprints
     app.register_blueprint(patients_bp)
@@ -43,11 +69,17 @@ def create_app(config_name='development'):
     app.register_blueprint(treatments_bp)
     app.register_blueprint(ambulances_bp)
     app.register_blueprint(audit_bp)
+    app.register_blueprint(admin_bp)
     
     # Create tables
     with app.app_context():
         db.create_all()
     
+    # Start the buffered audit writer once the tables exist
+    audit_writer.init_app(app)
+    app.cli.add_command(audit_cli)
+    app.cli.add_command(billing_cli)
+    
     @app.route('/health')
     def health():
         return {'status': 'healthy'}, 200
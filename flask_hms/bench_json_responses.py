@@ -0,0 +1,68 @@
+"""
+List endpoint throughput end to end, uncompressed and with each response
+compression the client can negotiate.
+
+Builds the app with the testing config (in-memory SQLite), inserts --rows
+rooms and patients, then times --requests GETs of /api/rooms and
+/api/patients?limit=100&after= through the test client for each
+Accept-Encoding, in --rounds alternating rounds. Reports the median
+requests/s and the response size on the wire; 'br' is skipped when brotli
+is not installed.
+
+    python bench_json_responses.py --rows 2000 --requests 200
+"""
+import argparse
+import statistics
+import time
+from app import create_app
+from database import db
+from models.patient import Patient
+from models.room import Room
+from utils.compression import brotli
+
+ENDPOINTS = ('/api/rooms', '/api/patients?limit=100&after=')
+ENCODINGS = ('identity', 'gzip') + (('br',) if brotli is not None else ())
+
+
+def seed(rows):
+    # Explicit ids: BIGINT primary keys do not autoincrement on SQLite
+    db.session.bulk_insert_mappings(Room, [dict(
+        id=i + 1, room_no=f'R-{i}', room_type='ICU' if i % 4 == 0 else 'Normal', price_per_day=1500.50 + i,
+        bed_count_total=4, bed_count_remaining=i % 5, health_card='HC-STANDARD'
+    ) for i in range(rows)])
+    db.session.bulk_insert_mappings(Patient, [dict(
+        id=i + 1, patient_id=f'PAT-{i:06d}', first_name='Asha', last_name='Rao', name='Asha Rao', age=30 + i % 50,
+        gender='Female', blood_group='O+', height=160.5, weight=60.25, bmi=23.4, phone_no='9999999999',
+        email_id=f'p{i}@example.com', address='12 MG Road, Pune', disease='Influenza', category='InPatient',
+        amount=1200.75
+    ) for i in range(rows)])
+    db.session.commit()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=2000)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--rounds', type=int, default=5)
+    args = parser.parse_args()
+
+    app = create_app('testing')
+    with app.app_context():
+        seed(args.rows)
+
+    client = app.test_client()
+    rates = {(endpoint, encoding): [] for endpoint in ENDPOINTS for encoding in ENCODINGS}
+    sizes = {}
+    for _ in range(args.rounds):
+        for endpoint in ENDPOINTS:
+            for encoding in ENCODINGS:
+                headers = {'Accept-Encoding': encoding}
+                sizes[(endpoint, encoding)] = len(client.get(endpoint, headers=headers).data)
+                started = time.perf_counter()
+                for _ in range(args.requests):
+                    client.get(endpoint, headers=headers)
+                rates[(endpoint, encoding)].append(args.requests / (time.perf_counter() - started))
+
+    print(f'{"encoding":<10} {"endpoint":<32} {"req/s":>8} {"bytes":>9}')
+    for (endpoint, encoding), samples in rates.items():
+        print(f'{encoding:<10} {endpoint:<32} {statistics.median(samples):>8.0f} {sizes[(endpoint, encoding)]:>9}')
@@ -0,0 +1,105 @@
+"""
+Socket.IO fan-out benchmark across worker processes.
+
+Starts a Unix-socket message bus, then for each worker count runs that many
+Socket.IO server processes with --clients simulated connections each, plus
+one publisher process that emits --events room_updated events. Each worker
+replays the events it receives from the bus to all of its clients, encoding
+real Socket.IO packets (the transport write itself is counted, not sent).
+Reports events/s through the bus and packets/s delivered to clients.
+
+    python bench_socketio_fanout.py --workers 1,2,4,8 --clients 250 --events 2000
+"""
+import argparse
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+import socketio
+from services.message_bus import BusBroker, UnixSocketManager
+
+
+def _server(bus_path):
+    manager = UnixSocketManager(f'unix://{bus_path}', channel='bench')
+    server = socketio.Server(client_manager=manager, async_mode='threading')
+    server.manager_initialized = True
+    manager.initialize()
+    return server
+
+
+def worker(bus_path, clients, expected, ready, done):
+    server = _server(bus_path)
+    delivered = [0]
+    finished = threading.Event()
+
+    def send(eio_sid, packet):
+        delivered[0] += 1
+        if delivered[0] >= expected:
+            finished.set()
+
+    # Older engine.io versions send encoded strings, newer ones packets
+    server.eio.send = send
+    server.eio.send_packet = send
+    for i in range(clients):
+        server.manager.connect(f'client-{i}', '/')
+
+    time.sleep(0.5)   # let the bus subscription settle
+    ready.put(os.getpid())
+    finished.wait()
+    done.put(time.perf_counter())
+
+
+def publisher(bus_path, events, start):
+    server = _server(bus_path)
+    time.sleep(0.5)
+    room = {
+        'id': 0, 'room_no': 'A-101', 'status': 'Normal', 'room_type': 'ICU',
+        'price_per_day': 4500.0, 'bed_count_total': 4, 'bed_count_remaining': 2, 'health_card': None
+    }
+    start.wait()
+    for i in range(events):
+        room['id'] = i % 200
+        server.emit('room_updated', room)
+
+
+def run(bus_path, workers, clients, events):
+    ready, done = multiprocessing.Queue(), multiprocessing.Queue()
+    start = multiprocessing.Event()
+    processes = [
+        multiprocessing.Process(target=worker, args=(bus_path, clients, clients * events, ready, done), daemon=True)
+        for _ in range(workers)
+    ]
+    processes.append(multiprocessing.Process(target=publisher, args=(bus_path, events, start), daemon=True))
+    for process in processes:
+        process.start()
+    for _ in range(workers):
+        ready.get(timeout=30)
+    time.sleep(0.5)
+
+    began = time.perf_counter()
+    start.set()
+    finished = max(done.get(timeout=600) for _ in range(workers))
+    elapsed = finished - began
+    for process in processes:
+        process.terminate()
+    return elapsed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--workers', default='1,2,4')
+    parser.add_argument('--clients', type=int, default=250, help='connected clients per worker')
+    parser.add_argument('--events', type=int, default=2000)
+    args = parser.parse_args()
+
+    bus_path = os.path.join(tempfile.mkdtemp(), 'bus.sock')
+    broker = BusBroker(bus_path)
+    threading.Thread(target=broker.serve_forever, daemon=True).start()
+
+    print(f'{"workers":>7} {"clients":>8} {"seconds":>8} {"events/s":>10} {"packets/s":>11}')
+    for count in [int(n) for n in args.workers.split(',')]:
+        elapsed = run(bus_path, count, args.clients, args.events)
+        packets = count * args.clients * args.events
+        print(f'{count:>7} {count * args.clients:>8} {elapsed:>8.2f} {args.events / elapsed:>10.0f} {packets / elapsed:>11.0f}')
+    broker.shutdown()
@@ -1 +1,4 @@
-from . import patient, doctor, nurse, room, prescription, lab_report, bill, treatment, audit_log, ambulance, employee
\ No newline at end of file
+from . import (
+    patient, doctor, nurse, room, prescription, lab_report, bill, treatment, audit_log, audit_checkpoint, ambulance, employee,
+    in_patient, out_patient, healthcare, charge, chemist
+)
\ No newline at end of file
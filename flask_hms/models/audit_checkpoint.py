@@ -0,0 +1,22 @@
+from database import db
+from datetime import datetime
+
+class AuditCheckpoint(db.Model):
+    __tablename__ = 'audit_checkpoints'
+    
+    id = db.Column(db.BigInteger, primary_key=True)
+    last_audit_id = db.Column(db.BigInteger, nullable=False, index=True)
+    row_hash = db.Column(db.String(64), nullable=False)
+    signature = db.Column(db.String(64), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    verified_at = db.Column(db.DateTime)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'last_audit_id': self.last_audit_id,
+            'row_hash': self.row_hash,
+            'signature': self.signature,
+            'created_at': str(self.created_at),
+            'verified_at': str(self.verified_at) if self.verified_at else None
+        }
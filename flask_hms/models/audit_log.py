@@ -4,6 +4,11 @@ import json
 
 class AuditLog(db.Model):
     __tablename__ = 'audit_logs'
+    __table_args__ = (
+        # "history of entity X" and "everything between two times" are both range scans
+        db.Index('ix_audit_logs_entity_created', 'entity_type', 'entity_id', 'created_at'),
+        db.Index('ix_audit_logs_created_at', 'created_at'),
+    )
     
     id = db.Column(db.BigInteger, primary_key=True)
     actor_id = db.Column(db.BigInteger)
@@ -14,7 +19,14 @@ class AuditLog(db.Model):
     old_values = db.Column(db.JSON)
     new_values = db.Column(db.JSON)
     payload = db.Column(db.JSON)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # 'snapshot': new_values is the full state; 'delta': only the changed
+    # fields; 'full': legacy rows with complete before/after dicts
+    encoding = db.Column(db.String(10), default='full')
+    # Hash chain over rows in id order (see services/audit_chain.py)
+    prev_hash = db.Column(db.String(64))
+    row_hash = db.Column(db.String(64))
+    # Partition key on MySQL (see services/audit_storage.py)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     
     def to_dict(self):
         return {
@@ -27,5 +39,8 @@ class AuditLog(db.Model):
             'old_values': self.old_values,
             'new_values': self.new_values,
             'payload': self.payload,
+            'encoding': self.encoding,
+            'prev_hash': self.prev_hash,
+            'row_hash': self.row_hash,
             'created_at': str(self.created_at)
         }
\ No newline at end of file
@@ -15,6 +15,8 @@ class Bill(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    charges = db.relationship('Charge', backref='bill', order_by='Charge.charge_date')
+    
     def to_dict(self):
         return {
             'id': self.id,
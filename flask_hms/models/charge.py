@@ -1,19 +1,36 @@
 from database import db
 from datetime import datetime
 
+# Category of the nightly room charges posted by services.billing_service
+ROOM_CATEGORY = 'Room'
+
 class Charge(db.Model):
     __tablename__ = 'charges'
+    __table_args__ = (
+        # One room charge per patient and night, which makes re-running the accrual
+        # a no-op; other charges leave room_night NULL and are never constrained
+        db.UniqueConstraint('patient_id', 'room_night', name='uq_charges_patient_room_night'),
+    )
     
     id = db.Column(db.BigInteger, primary_key=True)
     room_id = db.Column(db.BigInteger, db.ForeignKey('rooms.id'), nullable=False)
+    patient_id = db.Column(db.BigInteger, db.ForeignKey('patients.id'))
+    bill_id = db.Column(db.BigInteger, db.ForeignKey('bills.id'), index=True)
     amount = db.Column(db.Numeric(12, 2), nullable=False)
     category = db.Column(db.String(100))
+    charge_date = db.Column(db.Date)
+    room_night = db.Column(
+        db.Date, db.Computed(f"CASE WHEN category = '{ROOM_CATEGORY}' THEN charge_date END", persisted=True)
+    )
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     def to_dict(self):
         return {
             'id': self.id,
             'room_id': self.room_id,
+            'patient_id': self.patient_id,
+            'bill_id': self.bill_id,
             'amount': float(self.amount) if self.amount else 0,
-            'category': self.category
+            'category': self.category,
+            'charge_date': str(self.charge_date) if self.charge_date else None
         }
\ No newline at end of file
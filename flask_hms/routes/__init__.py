@@ -10,6 +10,7 @@ bills_bp = Blueprint('bills', __name__, url_prefix='/api/bills')
 treatments_bp = Blueprint('treatments', __name__, url_prefix='/api/treatments')
 ambulances_bp = Blueprint('ambulances', __name__, url_prefix='/api/ambulances')
 audit_bp = Blueprint('audit', __name__, url_prefix='/api/audit')
+admin_bp = Blueprint('admin', __name__, url_prefix='/api/admin')
 
 # Import route handlers
-from . import patients, doctors, nurses, rooms, prescriptions, lab_reports, bills, treatments, ambulances, audit
\ No newline at end of file
+from . import patients, doctors, nurses, rooms, prescriptions, lab_reports, bills, treatments, ambulances, audit, admin
\ No newline at end of file
@@ -0,0 +1,63 @@
+from flask import request, jsonify, current_app, abort, Response
+from routes import admin_bp
+from datetime import datetime
+from utils.profiler import profiler, parse_session_args, ProfilerBusy, SAMPLE_INTERVAL, TOP_SITES
+import hmac
+
+@admin_bp.before_request
+def require_admin_token():
+    """Admin endpoints exist only when PROFILER_TOKEN is set and the caller sends it"""
+    token = current_app.config.get('PROFILER_TOKEN')
+    if not token:
+        abort(404)
+    if not hmac.compare_digest(request.headers.get('X-Admin-Token', ''), token):
+        return jsonify({'success': False, 'message': 'Invalid admin token'}), 403
+
+def _session_args():
+    return parse_session_args(request.args, current_app.config.get('PROFILER_MAX_SECONDS', 120))
+
+@admin_bp.route('/profile/cpu', methods=['POST'])
+def profile_cpu():
+    """Sample stacks for ?seconds= or the next ?requests= to ?route=; returns collapsed stacks"""
+    try:
+        seconds, route, requests = _session_args()
+        interval = float(request.args.get('interval_ms', SAMPLE_INTERVAL * 1000)) / 1000
+        if interval < 0.001:
+            raise ValueError("'interval_ms' must be at least 1")
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    
+    try:
+        collapsed, summary = profiler.cpu(
+            seconds, route, requests, interval,
+            include_idle=request.args.get('threads') == 'all'
+        )
+    except ProfilerBusy as e:
+        return jsonify({'success': False, 'message': str(e)}), 409
+    
+    response = Response(collapsed, mimetype='text/plain')
+    response.headers['Content-Disposition'] = (
+        f"attachment; filename=cpu-{datetime.utcnow():%Y%m%dT%H%M%S}.collapsed"
+    )
+    for name, value in summary.items():
+        response.headers[f'X-Profile-{name.title()}'] = str(value)
+    return response
+
+@admin_bp.route('/profile/memory', methods=['POST'])
+def profile_memory():
+    """Top allocation sites by growth over ?seconds= or the next ?requests= to ?route="""
+    try:
+        seconds, route, requests = _session_args()
+        limit = int(request.args.get('limit', TOP_SITES))
+        group_by = request.args.get('group_by', 'lineno')
+        if group_by not in ('lineno', 'filename', 'traceback'):
+            raise ValueError("'group_by' must be lineno, filename or traceback")
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    
+    try:
+        report = profiler.memory(seconds, route, requests, limit=limit, group_by=group_by)
+    except ProfilerBusy as e:
+        return jsonify({'success': False, 'message': str(e)}), 409
+    
+    return jsonify({'success': True, 'data': report}), 200
@@ -0,0 +1,97 @@
+from flask import request, jsonify
+from routes import audit_bp
+from datetime import datetime
+from services.audit_service import audit_writer
+from services.audit_storage import query_audit, reconstruct_state
+from services.audit_chain import verify_chain
+from utils.helpers import parse_limit, encode_cursor, decode_cursor
+
+def _parse_time(name):
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"'{name}' must be an ISO 8601 date or datetime")
+
+def _audit_page(entity_type=None, entity_id=None):
+    """One page of audit rows ordered by time, from the hot table and the archive"""
+    try:
+        start = _parse_time('from')
+        end = _parse_time('to')
+        limit = parse_limit(request.args.get('limit'), default=100, maximum=1000)
+        after = None
+        if request.args.get('after'):
+            cursor = decode_cursor(request.args['after'])
+            after = (datetime.fromisoformat(cursor['created_at']), int(cursor['id']))
+    except (ValueError, KeyError, TypeError) as e:
+        return jsonify({'success': False, 'message': str(e) or 'Invalid cursor'}), 400
+    
+    rows, last_key = query_audit(
+        start=start,
+        end=end,
+        entity_type=entity_type or request.args.get('entity_type'),
+        entity_id=entity_id if entity_id is not None else request.args.get('entity_id', type=int),
+        action=request.args.get('action'),
+        after=after,
+        limit=limit
+    )
+    
+    next_cursor = encode_cursor({'created_at': str(last_key[0]), 'id': last_key[1]}) if last_key else None
+    return jsonify({
+        'success': True,
+        'data': rows,
+        'next_cursor': next_cursor,
+        'has_more': next_cursor is not None,
+        'limit': limit
+    }), 200
+
+@audit_bp.route('', methods=['GET'])
+def get_audit_logs():
+    """Audit rows in a time range: ?from=&to=&entity_type=&entity_id=&action=&after=&limit="""
+    return _audit_page()
+
+@audit_bp.route('/verify', methods=['GET'])
+def verify_audit_chain():
+    """Check the audit hash chain over ?from=&to= (default: since the last verified checkpoint)"""
+    try:
+        start = _parse_time('from')
+        end = _parse_time('to')
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    
+    report = verify_chain(start, end)
+    return jsonify({'success': report['ok'], 'data': report}), 200 if report['ok'] else 409
+
+@audit_bp.route('/<string:entity_type>/<int:entity_id>', methods=['GET'])
+def get_entity_history(entity_type, entity_id):
+    """History of one entity, oldest first"""
+    return _audit_page(entity_type, entity_id)
+
+@audit_bp.route('/<string:entity_type>/<int:entity_id>/state', methods=['GET'])
+def get_entity_state(entity_type, entity_id):
+    """Reconstruct an entity as it was at ?at= (default: its latest recorded state)"""
+    try:
+        at = _parse_time('at')
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    
+    state, as_of, applied = reconstruct_state(entity_type, entity_id, at)
+    if as_of is None:
+        return jsonify({'success': False, 'message': 'No audit history for this entity'}), 404
+    
+    return jsonify({
+        'success': True,
+        'data': {
+            'state': state,
+            'deleted': state is None,
+            'as_of': as_of,
+            'rows_applied': applied
+        }
+    }), 200
+
+@audit_bp.route('/metrics', methods=['GET'])
+def get_audit_metrics():
+    """Audit writer queue depth and throughput"""
+    return jsonify({'success': True, 'data': audit_writer.metrics()}), 200
@@ -1,4 +1,4 @@
-from flask import request, jsonify
+from flask import request, jsonify, abort
 from routes import patients_bp
 from database import db
 from models.patient import Patient
@@ -7,58 +7,128 @@ from models.out_patient import OutPatient
 from models.room import Room
 from datetime import datetime
 from services.audit_service import log_action
-from services.patient_service import allocate_room, free_room
-from app import socketio
+from services.room_service import allocate_bed, release_bed, index_room, NoBedAvailable
+from utils.decorators import conditional, query_version
+from utils.helpers import (
+    wants_keyset, parse_limit, keyset_paginate, page_total, model_columns, sparse_fieldset
+)
+from services.patient_service import (
+    load_patient_chart, parse_chart_sections, serialize_patient_chart, import_patient_chunk,
+    patient_chart_version
+)
+from services.event_service import dispatcher
+from services.billing_service import generate_discharge_bill, room_charge_summary
+import csv
+import io
+import json
+import logging
 import uuid
 
+logger = logging.getLogger(__name__)
+
+BULK_CHUNK_SIZE = 1000
+BULK_ROW_FAILED = 'Row could not be saved'
+
+# Columns selectable with ?fields= (the keys of Patient.to_dict)
+PATIENT_COLUMNS = model_columns(Patient, (
+    'id', 'patient_id', 'first_name', 'middle_name', 'last_name', 'name',
+    'date_of_birth', 'age', 'gender', 'blood_group', 'height', 'weight', 'bmi',
+    'phone_no', 'email_id', 'address', 'disease', 'category', 'amount'
+))
+
+def _filtered_patients():
+    """Patients matching ?category=&status="""
+    query = Patient.query
+    if request.args.get('category'):
+        query = query.filter_by(category=request.args.get('category'))
+    if request.args.get('status'):
+        query = query.filter_by(status=request.args.get('status'))
+    return query
+
+def _chart_version(patient_id):
+    """Version of a patient and the chart sections requested with ?include="""
+    try:
+        sections = parse_chart_sections(request.args.get('include'))
+    except ValueError:
+        # The view reports the bad section
+        return None
+    return patient_chart_version(patient_id, () if request.args.get('fields') else sections)
+
 @patients_bp.route('', methods=['GET'])
+@conditional(lambda: query_version(_filtered_patients(), Patient))
 def get_patients():
     """Get all patients with optional filtering"""
     page = request.args.get('page', 1, type=int)
     category = request.args.get('category')
     status = request.args.get('status')
     
-    query = Patient.query
+    query = _filtered_patients()
     
-    if category:
-        query = query.filter_by(category=category)
-    if status:
-        query = query.filter_by(status=status)
+    # Sparse fieldsets: ?fields=name,phone_no
+    try:
+        query, serialize = sparse_fieldset(query, request.args.get('fields'), PATIENT_COLUMNS, Patient.to_dict)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    
+    # Cursor pagination: ?after=<cursor>&limit=<n>
+    if wants_keyset(request.args):
+        try:
+            limit = parse_limit(request.args.get('limit'))
+            patients, next_cursor = keyset_paginate(query, Patient.id, request.args.get('after'), limit)
+        except ValueError as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
+        
+        response = {
+            'success': True,
+            'data': [serialize(p) for p in patients],
+            'next_cursor': next_cursor,
+            'has_more': next_cursor is not None,
+            'limit': limit
+        }
+        total = page_total(query, Patient, request.args.get('total'), bool(category or status))
+        if total is not None:
+            response['total'] = total
+        return jsonify(response), 200
     
     paginated = query.paginate(page=page, per_page=20)
     
     return jsonify({
         'success': True,
-        'data': [p.to_dict() for p in paginated.items],
+        'data': [serialize(p) for p in paginated.items],
         'total': paginated.total,
         'pages': paginated.pages,
         'current_page': page
     }), 200
 
 @patients_bp.route('/<int:patient_id>', methods=['GET'])
+@conditional(_chart_version)
 def get_patient(patient_id):
     """Get single patient with all related data"""
-    patient = Patient.query.get_or_404(patient_id)
-    
-    data = patient.to_dict()
-    
-    # Include inpatient data if exists
-    if patient.in_patient:
-        data['inpatient'] = {
-            'date_of_admission': str(patient.in_patient.date_of_admission),
-            'date_of_discharge': str(patient.in_patient.date_of_discharge) if patient.in_patient.date_of_discharge else None,
-            'room_id': patient.in_patient.room_id,
-            'room': patient.in_patient.room.to_dict() if patient.in_patient.room else None
-        }
+    # Sparse fieldsets return just the requested patient columns
+    if request.args.get('fields'):
+        try:
+            query, serialize = sparse_fieldset(
+                Patient.query.filter(Patient.id == patient_id),
+                request.args.get('fields'), PATIENT_COLUMNS, Patient.to_dict
+            )
+        except ValueError as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
+        row = query.first()
+        if not row:
+            abort(404)
+        return jsonify({'success': True, 'data': serialize(row)}), 200
     
-    # Include prescriptions
-    data['prescriptions'] = [p.to_dict() for p in patient.prescriptions]
+    try:
+        sections = parse_chart_sections(request.args.get('include'))
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
     
-    # Include bills
-    data['bills'] = [b.to_dict() for b in patient.bills]
+    # Patient and every requested section in a fixed number of queries
+    patient = load_patient_chart(patient_id, sections)
+    if not patient:
+        abort(404)
     
-    # Include lab reports
-    data['lab_reports'] = [l.to_dict() for l in patient.lab_reports]
+    data = serialize_patient_chart(patient, sections)
     
     return jsonify({'success': True, 'data': data}), 200
 
@@ -66,6 +136,8 @@ def get_patient(patient_id):
 def create_patient():
     """Create new patient - triggers room allocation if inpatient"""
     data = request.get_json()
+    allocated_room_id = None
+    admitted = False
     
     try:
         # Validate required fields
@@ -97,42 +169,39 @@ def create_patient():
             amount=data.get('amount', 0)
         )
         
+        # If inpatient, take a bed in the requested room (or any free room of
+        # room_type) with an atomic conditional decrement, committed on its own
+        # so no room lock is held while the patient is written
+        if data.get('category') == 'InPatient' and (data.get('room_id') or data.get('room_type')):
+            try:
+                allocated_room_id = allocate_bed(room_id=data.get('room_id'), room_type=data.get('room_type'))
+            except NoBedAvailable as e:
+                return jsonify({'success': False, 'message': str(e)}), 404 if e.not_found else 400
+        
         db.session.add(patient)
         db.session.flush()
         
-        # If inpatient, allocate room
-        if data.get('category') == 'InPatient' and data.get('room_id'):
-            room_id = data.get('room_id')
-            room = Room.query.get(room_id)
-            
-            if not room:
-                db.session.rollback()
-                return jsonify({'success': False, 'message': 'Room not found'}), 404
-            
-            if room.bed_count_remaining <= 0:
-                db.session.rollback()
-                return jsonify({'success': False, 'message': 'No beds available in this room'}), 400
-            
-            # Allocate bed
-            room.bed_count_remaining -= 1
-            room.status = 'Full' if room.bed_count_remaining == 0 else 'Partially Occupied'
-            
+        if allocated_room_id is not None:
             # Create inpatient record
             in_patient = InPatient(
                 patient_id=patient.id,
                 date_of_admission=datetime.utcnow(),
-                room_id=room_id
+                room_id=allocated_room_id
             )
             db.session.add(in_patient)
-            
-            # Emit room update event
-            socketio.emit('room_updated', room.to_dict(), broadcast=True)
         else:
             # Create outpatient record
             out_patient = OutPatient(patient_id=patient.id)
             db.session.add(out_patient)
         
         db.session.commit()
+        admitted = True
+        
+        # Emit room update event
+        if allocated_room_id is not None:
+            room = Room.query.get(allocated_room_id)
+            index_room(room)
+            dispatcher.emit('room_updated', room.to_dict(), key=room.id)
         
         # Log action
         log_action(
@@ -141,15 +210,15 @@ def create_patient():
             action='patient_created',
             entity_type='Patient',
             entity_id=patient.id,
-            payload=patient.to_dict()
+            new_values=patient.to_dict()
         )
         
         # Broadcast patient added event
-        socketio.emit('patient_added', {
+        dispatcher.emit('patient_added', {
             'patient_id': patient.patient_id,
             'name': patient.name,
             'category': patient.category
-        }, broadcast=True)
+        }, key=patient.id)
         
         return jsonify({
             'success': True,
@@ -159,8 +228,108 @@ def create_patient():
     
     except Exception as e:
         db.session.rollback()
+        # Hand back a bed taken for an admission that was never recorded
+        if allocated_room_id is not None and not admitted:
+            release_bed(allocated_room_id)
+            db.session.commit()
+            index_room(Room.query.get(allocated_room_id))
         return jsonify({'success': False, 'message': str(e)}), 500
 
+def _iter_bulk_rows():
+    """Yield (row_number, data) from a streamed CSV or NDJSON request body"""
+    stream = io.TextIOWrapper(request.stream, encoding='utf-8', newline='')
+    
+    if request.mimetype in ('text/csv', 'application/csv'):
+        for row_number, row in enumerate(csv.DictReader(stream), start=1):
+            yield row_number, row
+        return
+    
+    for row_number, line in enumerate(stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield row_number, json.loads(line)
+        except ValueError:
+            yield row_number, None
+
+def _import_bulk_rows(rows):
+    """Insert rows in one transaction; on a database error retry each half so only failing rows are rejected"""
+    try:
+        patient_ids, errors, room_ids = import_patient_chunk(rows)
+        db.session.commit()
+        return patient_ids, errors, room_ids
+    except Exception:
+        db.session.rollback()
+        if len(rows) == 1:
+            # The driver message quotes the statement and other rows' values
+            logger.exception('Bulk import of row %s failed', rows[0][0])
+            return [], [{'row': rows[0][0], 'errors': [BULK_ROW_FAILED]}], []
+    
+    middle = len(rows) // 2
+    first_ids, first_errors, first_rooms = _import_bulk_rows(rows[:middle])
+    second_ids, second_errors, second_rooms = _import_bulk_rows(rows[middle:])
+    return (
+        first_ids + second_ids,
+        sorted(first_errors + second_errors, key=lambda error: error['row']),
+        list(set(first_rooms) | set(second_rooms))
+    )
+
+def _flush_bulk_chunk(chunk, summary):
+    """Insert one chunk, then audit and broadcast it once"""
+    patient_ids, errors, room_ids = _import_bulk_rows(chunk)
+    
+    summary['inserted'] += len(patient_ids)
+    summary['failed'] += len(errors)
+    summary['errors'].extend(errors)
+    
+    if not patient_ids:
+        return
+    
+    log_action(
+        actor_id=None,
+        actor_role='Admin',
+        action='patients_bulk_imported',
+        entity_type='Patient',
+        entity_id=patient_ids[0],
+        payload={
+            'rows': [chunk[0][0], chunk[-1][0]],
+            'inserted': len(patient_ids),
+            'failed': len(errors),
+            'patient_ids': patient_ids
+        }
+    )
+    
+    dispatcher.emit('patients_imported', {'count': len(patient_ids), 'patient_ids': patient_ids})
+    for room in Room.query.filter(Room.id.in_(room_ids)).all() if room_ids else []:
+        index_room(room)
+        dispatcher.emit('room_updated', room.to_dict(), key=room.id)
+
+@patients_bp.route('/bulk', methods=['POST'])
+def bulk_create_patients():
+    """Bulk import patients from a streamed CSV or NDJSON body"""
+    if request.mimetype not in ('text/csv', 'application/csv', 'application/x-ndjson', 'application/jsonl'):
+        return jsonify({
+            'success': False,
+            'message': 'Content-Type must be text/csv or application/x-ndjson'
+        }), 415
+    
+    summary = {'inserted': 0, 'failed': 0, 'errors': []}
+    chunk = []
+    for row_number, data in _iter_bulk_rows():
+        chunk.append((row_number, data))
+        if len(chunk) >= BULK_CHUNK_SIZE:
+            _flush_bulk_chunk(chunk, summary)
+            chunk = []
+    if chunk:
+        _flush_bulk_chunk(chunk, summary)
+    
+    return jsonify({
+        'success': True,
+        'message': f"Imported {summary['inserted']} patients, {summary['failed']} rows failed",
+        'data': summary
+    }), 200
+
 @patients_bp.route('/<int:patient_id>', methods=['PATCH'])
 def update_patient(patient_id):
     """Update patient information"""
@@ -222,27 +391,20 @@ def discharge_patient(patient_id):
         in_patient = patient.in_patient
         room = in_patient.room
         
-        # Calculate stay duration
-        admission = in_patient.date_of_admission
-        discharge = datetime.utcnow()
-        days_stayed = max(1, (discharge - admission).days + 1)
-        
-        # Calculate charges
-        room_charges = float(room.price_per_day) * days_stayed
+        if in_patient.date_of_discharge:
+            return jsonify({'success': False, 'message': 'Patient is already discharged'}), 400
         
-        # Mark as discharged
-        in_patient.date_of_discharge = discharge
-        room.bed_count_remaining += 1
-        room.status = 'Available' if room.bed_count_remaining > 0 else room.status
+        # Mark as discharged and return the bed in the same commit
+        in_patient.date_of_discharge = datetime.utcnow()
+        release_bed(room.id)
         
-        # Update patient
-        patient.category = 'Discharged'
+        # Post the days the nightly accrual has not reached and finalize the bill
+        bill = generate_discharge_bill(in_patient)
+        days_stayed, room_charges = room_charge_summary(bill) if bill else (0, 0.0)
         
+        # in_patient.date_of_discharge records the discharge; category stays InPatient
         db.session.commit()
-        
-        # Create discharge bill (handled by billing service)
-        from services.billing_service import generate_discharge_bill
-        bill = generate_discharge_bill(patient.id, room_charges)
+        index_room(room)
         
         # Log action
         log_action(
@@ -252,20 +414,20 @@ def discharge_patient(patient_id):
             entity_type='Patient',
             entity_id=patient.id,
             payload={
-                'days_stayed': days_staged,
+                'days_stayed': days_stayed,
                 'room_charges': room_charges,
                 'bill_id': bill.bill_id if bill else None
             }
         )
         
         # Emit events
-        socketio.emit('patient_discharged', {
+        dispatcher.emit('patient_discharged', {
             'patient_id': patient.patient_id,
             'name': patient.name,
             'bill_id': bill.bill_id if bill else None
-        }, broadcast=True)
+        }, key=patient.id)
         
-        socketio.emit('room_updated', room.to_dict(), broadcast=True)
+        dispatcher.emit('room_updated', room.to_dict(), key=room.id)
         
         return jsonify({
             'success': True,
@@ -286,15 +448,21 @@ def delete_patient(patient_id):
     patient = Patient.query.get_or_404(patient_id)
     
     try:
-        # If inpatient, free room first
-        if patient.in_patient:
-            room = patient.in_patient.room
-            room.bed_count_remaining += 1
-            room.status = 'Available'
+        # If still admitted, free the bed in the same commit
+        freed_room_id = None
+        if patient.in_patient and not patient.in_patient.date_of_discharge:
+            freed_room_id = patient.in_patient.room_id
+            release_bed(freed_room_id)
         
         db.session.delete(patient)
         db.session.commit()
         
+        if freed_room_id is not None:
+            room = Room.query.get(freed_room_id)
+            index_room(room)
+            if room:
+                dispatcher.emit('room_updated', room.to_dict(), key=room.id)
+        
         log_action(
             actor_id=None,
             actor_role='Admin',
@@ -1,40 +1,142 @@
-from flask import request, jsonify
+from flask import request, jsonify, abort
 from routes import rooms_bp
 from database import db
 from models.room import Room
-from app import socketio
+from models.in_patient import InPatient
+from models.patient import Patient
+from services.event_service import dispatcher
 from services.audit_service import log_action
+from services.room_service import (
+    index_room, remove_room, available_rooms, availability_summary, availability_version
+)
+from utils.decorators import conditional, query_version
+from utils.helpers import (
+    wants_keyset, parse_limit, keyset_paginate, page_total, wants_stream, stream_json_array,
+    model_columns, parse_fields, sparse_fieldset
+)
+
+# Columns selectable with ?fields= (the keys of Room.to_dict)
+ROOM_COLUMNS = model_columns(Room, (
+    'id', 'room_no', 'status', 'room_type', 'price_per_day',
+    'bed_count_total', 'bed_count_remaining', 'health_card'
+))
+
+def _filtered_rooms():
+    """Rooms matching ?status=&type=&available="""
+    query = Room.query
+    if request.args.get('status'):
+        query = query.filter_by(status=request.args.get('status'))
+    if request.args.get('type'):
+        query = query.filter_by(room_type=request.args.get('type'))
+    if request.args.get('available', False, type=bool):
+        query = query.filter(Room.bed_count_remaining > 0)
+    return query
+
+def _from_index():
+    """Free-room listings without a cursor or stream are answered from the availability index"""
+    return (request.args.get('available', False, type=bool)
+            and not wants_keyset(request.args) and not wants_stream(request.args))
+
+def _rooms_version():
+    """Version of the rooms get_rooms() would return; index answers need no query"""
+    if _from_index():
+        return availability_version()
+    return query_version(_filtered_rooms(), Room)
+
+def _room_version(room_id):
+    """Version of a room and its occupants"""
+    room = db.session.query(Room.updated_at).filter(Room.id == room_id).first()
+    if room is None:
+        return None
+    count, admitted, patient = db.session.query(
+        db.func.count(InPatient.id), db.func.max(InPatient.updated_at), db.func.max(Patient.updated_at)
+    ).join(Patient, Patient.id == InPatient.patient_id).filter(InPatient.room_id == room_id).one()
+    return count, admitted, patient, max(filter(None, (room.updated_at, admitted, patient)))
 
 @rooms_bp.route('', methods=['GET'])
+@conditional(_rooms_version)
 def get_rooms():
     """Get all rooms with optional filtering"""
     status = request.args.get('status')
     room_type = request.args.get('type')
     available_only = request.args.get('available', False, type=bool)
     
-    query = Room.query
+    # Free rooms are answered from the in-memory availability index
+    if _from_index():
+        rooms = available_rooms(room_type=room_type, status=status)
+        if request.args.get('fields'):
+            try:
+                names = parse_fields(request.args.get('fields'), ROOM_COLUMNS)
+            except ValueError as e:
+                return jsonify({'success': False, 'message': str(e)}), 400
+            rooms = [{name: r[name] for name in names} for r in rooms]
+        return jsonify({'success': True, 'data': rooms}), 200
     
-    if status:
-        query = query.filter_by(status=status)
-    if room_type:
-        query = query.filter_by(room_type=room_type)
-    if available_only:
-        query = query.filter(Room.bed_count_remaining > 0)
+    query = _filtered_rooms()
+    
+    # Sparse fieldsets: ?fields=room_no,bed_count_remaining
+    try:
+        query, serialize = sparse_fieldset(query, request.args.get('fields'), ROOM_COLUMNS, Room.to_dict)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    
+    # Cursor pagination: ?after=<cursor>&limit=<n>
+    if wants_keyset(request.args):
+        try:
+            limit = parse_limit(request.args.get('limit'))
+            rooms, next_cursor = keyset_paginate(query, Room.id, request.args.get('after'), limit)
+        except ValueError as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
+        
+        response = {
+            'success': True,
+            'data': [serialize(r) for r in rooms],
+            'next_cursor': next_cursor,
+            'has_more': next_cursor is not None,
+            'limit': limit
+        }
+        total = page_total(query, Room, request.args.get('total'), bool(status or room_type or available_only))
+        if total is not None:
+            response['total'] = total
+        return jsonify(response), 200
+    
+    # Streamed array for unbounded listings: ?stream=1
+    if wants_stream(request.args):
+        return stream_json_array(query.order_by(Room.id), serialize, envelope={'success': True})
     
     rooms = query.all()
     
     return jsonify({
         'success': True,
-        'data': [r.to_dict() for r in rooms]
+        'data': [serialize(r) for r in rooms]
     }), 200
 
+@rooms_bp.route('/availability', methods=['GET'])
+def get_availability():
+    """Free beds per room type and status"""
+    return jsonify({'success': True, 'data': availability_summary()}), 200
+
 @rooms_bp.route('/<int:room_id>', methods=['GET'])
+@conditional(_room_version)
 def get_room(room_id):
     """Get single room with occupancy details"""
+    # Sparse fieldsets return just the requested room columns
+    if request.args.get('fields'):
+        try:
+            query, serialize = sparse_fieldset(
+                Room.query.filter(Room.id == room_id), request.args.get('fields'), ROOM_COLUMNS, Room.to_dict
+            )
+        except ValueError as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
+        row = query.first()
+        if not row:
+            abort(404)
+        return jsonify({'success': True, 'data': serialize(row)}), 200
+    
     room = Room.query.get_or_404(room_id)
     
     data = room.to_dict()
-    data['occupants'] = [p.to_dict() for p in room.patients] if room.in_patients else []
+    data['occupants'] = [in_patient.patient.to_dict() for in_patient in room.in_patients]
     
     return jsonify({'success': True, 'data': data}), 200
 
@@ -59,6 +161,7 @@ def create_room():
         
         db.session.add(room)
         db.session.commit()
+        index_room(room)
         
         log_action(
             actor_id=None,
@@ -66,10 +169,10 @@ def create_room():
             action='room_created',
             entity_type='Room',
             entity_id=room.id,
-            payload=room.to_dict()
+            new_values=room.to_dict()
         )
         
-        socketio.emit('room_created', room.to_dict(), broadcast=True)
+        dispatcher.emit('room_created', room.to_dict(), key=room.id)
         
         return jsonify({
             'success': True,
@@ -96,6 +199,7 @@ def update_room(room_id):
             room.price_per_day = data['price_per_day']
         
         db.session.commit()
+        index_room(room)
         
         log_action(
             actor_id=None,
@@ -107,7 +211,7 @@ def update_room(room_id):
             new_values=room.to_dict()
         )
         
-        socketio.emit('room_updated', room.to_dict(), broadcast=True)
+        dispatcher.emit('room_updated', room.to_dict(), key=room.id)
         
         return jsonify({
             'success': True,
@@ -127,6 +231,7 @@ def delete_room(room_id):
     try:
         db.session.delete(room)
         db.session.commit()
+        remove_room(room_id)
         
         log_action(
             actor_id=None,
@@ -137,7 +242,7 @@ def delete_room(room_id):
             payload={'room_id': room.room_id}
         )
         
-        socketio.emit('room_deleted', {'room_id': room.room_id}, broadcast=True)
+        dispatcher.emit('room_deleted', {'room_id': room.room_id}, key=room.id)
         
         return jsonify({'success': True, 'message': 'Room deleted successfully'}), 200
     
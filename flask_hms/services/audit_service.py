@@ -0,0 +1,355 @@
+"""
+Buffered audit trail writer.
+
+log_action() is called after every patient and room commit. Instead of a
+separate INSERT per call, records are queued in process and a background
+thread writes them with multi-row INSERTs whenever AUDIT_FLUSH_SIZE records
+are waiting or AUDIT_FLUSH_INTERVAL seconds have passed, and once more at
+shutdown.
+
+The queue is a hard bound: a caller that finds AUDIT_MAX_QUEUE records
+waiting gives the writer up to ENQUEUE_TIMEOUT seconds to drain it and, if
+it is still full, inserts its own record synchronously instead (counted in
+'overflow_writes'). Audit records are never dropped; when the database is
+down that insert fails and the error reaches the caller.
+
+With AUDIT_WAL_DIR set every record is also appended to a local write-ahead
+segment before log_action() returns. Segments are deleted only after their
+records are committed, and segments left behind by a crashed process are
+replayed when the next writer starts, so delivery is at-least-once.
+
+When the writer has not been started (scripts, tests) log_action() inserts
+synchronously.
+
+Entity state is delta-encoded. An update passing old_values/new_values is
+stored as the changed fields only ('delta'); a full copy of the new state
+('snapshot') is written for creates, for the first change to an entity seen
+by this process and after every AUDIT_SNAPSHOT_EVERY deltas, so rebuilding a
+past version never replays more than that many rows. Rows written before
+delta encoding carry full before/after dicts ('full').
+"""
+from database import db
+from models.audit_log import AuditLog
+from services.audit_chain import chain_records, record_checkpoint, CHECKPOINT_EVERY
+from datetime import datetime
+from flask import current_app
+from collections import OrderedDict, deque
+import atexit
+import glob
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+FLUSH_SIZE = 500         # records per INSERT / flush trigger
+FLUSH_INTERVAL = 1.0     # seconds a record may wait before being written
+MAX_QUEUE = 50000        # callers wait for the writer beyond this depth
+ENQUEUE_TIMEOUT = 2.0    # longest a caller waits for room before writing its record itself
+RETRY_BACKOFF = 5.0      # seconds between attempts while the database is down
+SNAPSHOT_EVERY = 20      # deltas per entity between full snapshots
+TRACKED_ENTITIES = 100000
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class AuditWriter:
+    """Queues audit records and writes them in batches from a background thread"""
+
+    def __init__(self):
+        self.app = None
+        self.flush_size = FLUSH_SIZE
+        self.flush_interval = FLUSH_INTERVAL
+        self.max_queue = MAX_QUEUE
+        self.wal_dir = None
+        self._queue = deque()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._drained = threading.Condition(self._lock)
+        self._flush_lock = threading.Lock()
+        self._wal_lock = threading.Lock()    # the open segment; taken after _lock, never before
+        self._thread = None
+        self._stopping = False
+        self._wal = None
+        self._wal_sequence = 0
+        self._sealed = []       # WAL segments whose records are still queued
+        self.counters = {
+            'enqueued': 0, 'written': 0, 'batches': 0, 'failures': 0,
+            'replayed': 0, 'blocked': 0, 'overflow_writes': 0, 'last_flush_ms': 0.0
+        }
+
+    @property
+    def started(self):
+        return self._thread is not None
+
+    def init_app(self, app):
+        if not app.config.get('AUDIT_ASYNC', True):
+            return
+        self.app = app
+        self.flush_size = app.config.get('AUDIT_FLUSH_SIZE', FLUSH_SIZE)
+        self.flush_interval = app.config.get('AUDIT_FLUSH_INTERVAL', FLUSH_INTERVAL)
+        self.max_queue = app.config.get('AUDIT_MAX_QUEUE', MAX_QUEUE)
+        self.wal_dir = app.config.get('AUDIT_WAL_DIR')
+        if self.wal_dir:
+            os.makedirs(self.wal_dir, exist_ok=True)
+            self._replay()
+            self._open_segment()
+        self._thread = threading.Thread(target=self._run, name='audit-writer', daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+        app.extensions['audit_writer'] = self
+
+    # -- write-ahead segments ----------------------------------------------
+
+    def _segment_path(self, pid, sequence):
+        return os.path.join(self.wal_dir, f'audit-{pid}-{sequence:08d}.wal')
+
+    def _open_segment(self):
+        self._wal_sequence += 1
+        self._wal = open(self._segment_path(os.getpid(), self._wal_sequence), 'a', encoding='utf-8')
+
+    def _seal_segment(self):
+        """Start a new segment; the old one is removed once its records are written"""
+        with self._wal_lock:
+            self._wal.flush()
+            os.fsync(self._wal.fileno())
+            self._wal.close()
+            self._sealed.append(self._wal.name)
+            self._open_segment()
+
+    def _append_wal(self, line):
+        with self._wal_lock:
+            if self._wal is not None:
+                self._wal.write(line)
+                self._wal.flush()
+
+    def _replay(self):
+        """Write records from segments left behind by processes that are gone"""
+        for path in sorted(glob.glob(os.path.join(self.wal_dir, 'audit-*.wal'))):
+            try:
+                pid = int(os.path.basename(path).split('-')[1])
+            except (IndexError, ValueError):
+                continue
+            if pid != os.getpid() and _pid_alive(pid):
+                continue
+            # Claim the segment so concurrently starting workers replay it once
+            claimed = path + '.replay'
+            try:
+                os.rename(path, claimed)
+            except FileNotFoundError:
+                continue
+            records = []
+            with open(claimed, encoding='utf-8') as segment:
+                for line in segment:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # Torn last line from the crash
+                        continue
+                    record['created_at'] = datetime.fromisoformat(record['created_at'])
+                    record.setdefault('encoding', 'full')
+                    records.append(record)
+            if records:
+                with self.app.app_context():
+                    self._insert(records)
+                self.counters['replayed'] += len(records)
+                logger.warning('Replayed %d audit records from %s', len(records), path)
+            os.unlink(claimed)
+
+    # -- producing ---------------------------------------------------------
+
+    def enqueue(self, record):
+        line = json.dumps(record, default=str) + '\n' if self.wal_dir else None
+        overflow = False
+        with self._lock:
+            if len(self._queue) >= self.max_queue:
+                # Back-pressure instead of dropping audit records
+                self.counters['blocked'] += 1
+                self._wakeup.notify()
+                overflow = not self._drained.wait_for(lambda: len(self._queue) < self.max_queue, ENQUEUE_TIMEOUT)
+            if overflow:
+                self.counters['overflow_writes'] += 1
+            else:
+                self._queue.append(record)
+                self.counters['enqueued'] += 1
+                if len(self._queue) >= self.flush_size:
+                    self._wakeup.notify()
+
+        if overflow:
+            with self.app.app_context():
+                self._insert([record])
+            return
+        # Outside _lock: a flush sealing the segment meanwhile only moves this
+        # line to the next segment, a duplicate on replay rather than a loss
+        if line is not None:
+            self._append_wal(line)
+
+    # -- flushing ----------------------------------------------------------
+
+    def _insert(self, records):
+        insert_records(records, self.flush_size)
+
+    def flush(self):
+        """Write everything queued so far; returns the number of records written"""
+        with self._flush_lock:
+            with self._lock:
+                if not self._queue:
+                    return 0
+                records = list(self._queue)
+                self._queue.clear()
+                if self._wal is not None:
+                    self._seal_segment()
+                sealed, self._sealed = self._sealed, []
+                self._drained.notify_all()
+
+            started = time.perf_counter()
+            try:
+                with self.app.app_context():
+                    self._insert(records)
+            except Exception:
+                # Put the batch back in front and keep its segments for the retry
+                with self._lock:
+                    self._queue.extendleft(reversed(records))
+                    self._sealed = sealed + self._sealed
+                self.counters['failures'] += 1
+                raise
+
+            for path in sealed:
+                os.unlink(path)
+            self.counters['written'] += len(records)
+            self.counters['batches'] += 1
+            self.counters['last_flush_ms'] = round((time.perf_counter() - started) * 1000, 2)
+            return len(records)
+
+    def _run(self):
+        while True:
+            with self._lock:
+                self._wakeup.wait_for(
+                    lambda: self._stopping or len(self._queue) >= self.flush_size, self.flush_interval
+                )
+                stopping = self._stopping
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Audit flush failed, retrying in %.0fs', RETRY_BACKOFF)
+                if not stopping:
+                    time.sleep(RETRY_BACKOFF)
+            if stopping:
+                return
+
+    def stop(self):
+        """Flush what is left and stop the background thread"""
+        if self._thread is None:
+            return
+        with self._lock:
+            self._stopping = True
+            self._wakeup.notify()
+        self._thread.join(timeout=30)
+        self._thread = None
+        with self._wal_lock:
+            if self._wal is not None:
+                self._wal.close()
+                if not self._queue:
+                    os.unlink(self._wal.name)
+                self._wal = None
+
+    def metrics(self):
+        with self._lock:
+            depth = len(self._queue)
+            oldest = self._queue[0]['created_at'] if depth else None
+        return dict(
+            self.counters,
+            running=self.started,
+            queue_depth=depth,
+            max_queue=self.max_queue,
+            oldest_age_seconds=round((datetime.utcnow() - oldest).total_seconds(), 3) if oldest else 0.0,
+            wal_enabled=bool(self.wal_dir),
+            wal_segments=len(self._sealed) + (1 if self._wal is not None else 0)
+        )
+
+
+audit_writer = AuditWriter()
+_since_checkpoint = [0]
+
+
+def insert_records(records, batch_size=FLUSH_SIZE):
+    """Chain and insert audit records in one transaction, signing a checkpoint when due"""
+    with db.engine.begin() as connection:
+        chain_records(connection, records)
+        for start in range(0, len(records), batch_size):
+            connection.execute(AuditLog.__table__.insert(), records[start:start + batch_size])
+        _since_checkpoint[0] += len(records)
+        if _since_checkpoint[0] >= current_app.config.get('AUDIT_CHECKPOINT_EVERY', CHECKPOINT_EVERY):
+            record_checkpoint(connection)
+            _since_checkpoint[0] = 0
+
+
+# (entity_type, entity_id) -> deltas written since the last snapshot
+_since_snapshot = OrderedDict()
+_since_snapshot_lock = threading.Lock()
+
+
+def diff_values(old, new):
+    """Changed fields only: ({field: old value}, {field: new value})"""
+    changed = [key for key in new if key not in old or old[key] != new[key]]
+    changed += [key for key in old if key not in new]
+    return {key: old.get(key) for key in changed}, {key: new.get(key) for key in changed}
+
+
+def _encode_state(entity_type, entity_id, old_values, new_values):
+    """Pick snapshot or delta encoding for a state change"""
+    if new_values is None:
+        return 'full', old_values, new_values
+    snapshot_every = audit_writer.app.config.get('AUDIT_SNAPSHOT_EVERY', SNAPSHOT_EVERY) if audit_writer.app else SNAPSHOT_EVERY
+    key = (entity_type, entity_id)
+    with _since_snapshot_lock:
+        count = _since_snapshot.pop(key, None)
+        snapshot = old_values is None or count is None or count + 1 >= snapshot_every
+        _since_snapshot[key] = 0 if snapshot else count + 1
+        if len(_since_snapshot) > TRACKED_ENTITIES:
+            _since_snapshot.popitem(last=False)
+
+    if old_values is None:
+        return 'snapshot', None, new_values
+    before, after = diff_values(old_values, new_values)
+    if snapshot:
+        return 'snapshot', before, new_values
+    return 'delta', before, after
+
+
+def log_action(actor_id, actor_role, action, entity_type, entity_id,
+               old_values=None, new_values=None, payload=None):
+    """
+    Record an audit entry; buffered when the writer is running.
+
+    new_values is the entity's state after the action (with old_values the
+    state before it); payload carries event details that are not state.
+    """
+    encoding, old_values, new_values = _encode_state(entity_type, entity_id, old_values, new_values)
+    record = {
+        'actor_id': actor_id,
+        'actor_role': actor_role,
+        'action': action,
+        'entity_type': entity_type,
+        'entity_id': entity_id,
+        'old_values': old_values,
+        'new_values': new_values,
+        'payload': payload,
+        'encoding': encoding,
+        'created_at': datetime.utcnow()
+    }
+    if audit_writer.started:
+        audit_writer.enqueue(record)
+        return
+
+    insert_records([record])
@@ -0,0 +1,438 @@
+"""
+Time-partitioned audit storage.
+
+Hot rows live in audit_logs. On MySQL the table is RANGE-partitioned by
+month on created_at (the primary key becomes (id, created_at), as MySQL
+requires the partition key in every unique key), so a time-range query only
+touches the months it covers and retiring a month is a DROP PARTITION.
+
+The retention job rolls every month older than AUDIT_HOT_MONTHS into a
+compressed segment under AUDIT_ARCHIVE_DIR:
+
+    audit-YYYYMM[-n].ndjson.gz   rows as NDJSON, written as independent gzip
+                                 members of ARCHIVE_BLOCK_ROWS rows each
+    audit-YYYYMM[-n].idx.json    per-block byte ranges and time bounds, plus
+                                 the blocks each entity appears in
+    manifest.json                every segment with its time range and row count
+
+Segments stay queryable: query_audit() seeks straight to the blocks that can
+match the time range or entity and merges them with the hot table, and
+reconstruct_state() replays an entity's snapshots and deltas across both.
+"""
+from database import db
+from models.audit_log import AuditLog
+from services.audit_chain import verify_chain
+from datetime import datetime, timedelta
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import and_, func, inspect, or_, text
+from functools import lru_cache
+from itertools import islice
+import click
+import gzip
+import heapq
+import json
+import os
+
+ARCHIVE_BLOCK_ROWS = 1000
+HOT_MONTHS = 12
+PARTITIONS_AHEAD = 3
+DELETE_BATCH = 5000
+RECONSTRUCT_PAGE = 500
+
+audit_cli = AppGroup('audit', help='Audit log storage maintenance')
+
+
+def _month_start(value):
+    return datetime(value.year, value.month, 1)
+
+
+def _next_month(month):
+    return datetime(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def _add_months(month, count):
+    for _ in range(count):
+        month = _next_month(month)
+    return month
+
+
+def _row_key(row):
+    return datetime.fromisoformat(row['created_at']), row['id']
+
+
+def _archive_dir():
+    return current_app.config.get('AUDIT_ARCHIVE_DIR') or os.path.join(current_app.instance_path, 'audit_archive')
+
+
+# -- indexes and partitions ------------------------------------------------
+
+def ensure_schema():
+    """Add audit columns and indexes missing from databases created before them"""
+    table = AuditLog.__table__
+    existing = {column['name'] for column in inspect(db.engine).get_columns(table.name)}
+    with db.engine.begin() as connection:
+        for column in table.columns:
+            if column.name not in existing:
+                column_type = column.type.compile(dialect=db.engine.dialect)
+                connection.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+    for index in table.indexes:
+        index.create(bind=db.engine, checkfirst=True)
+
+
+def _partition_names():
+    return [name for (name,) in db.session.execute(text(
+        'SELECT PARTITION_NAME FROM information_schema.PARTITIONS '
+        'WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :table AND PARTITION_NAME IS NOT NULL '
+        'ORDER BY PARTITION_ORDINAL_POSITION'
+    ), {'table': AuditLog.__tablename__})]
+
+
+def _partition_clause(month):
+    return f"PARTITION p{month:%Y%m} VALUES LESS THAN (TO_DAYS('{_next_month(month):%Y-%m-%d}'))"
+
+
+def ensure_partitions(months_ahead=PARTITIONS_AHEAD):
+    """
+    Partition audit_logs by month (MySQL only) and keep months_ahead empty
+    partitions ready. Returns the names of the partitions added.
+    """
+    if db.engine.dialect.name != 'mysql':
+        return []
+
+    existing = _partition_names()
+    last = _add_months(_month_start(datetime.utcnow()), months_ahead)
+    if not existing:
+        first = db.session.query(func.min(AuditLog.created_at)).scalar() or datetime.utcnow()
+        months = []
+        month = _month_start(first)
+        while month <= last:
+            months.append(month)
+            month = _next_month(month)
+        db.session.execute(text(
+            'ALTER TABLE audit_logs DROP PRIMARY KEY, ADD PRIMARY KEY (id, created_at) '
+            'PARTITION BY RANGE (TO_DAYS(created_at)) ('
+            + ', '.join(_partition_clause(m) for m in months)
+            + ', PARTITION pmax VALUES LESS THAN MAXVALUE)'
+        ))
+        db.session.commit()
+        return [f'p{m:%Y%m}' for m in months]
+
+    monthly = [name for name in existing if name != 'pmax']
+    month = _next_month(datetime.strptime(monthly[-1][1:], '%Y%m')) if monthly else _month_start(datetime.utcnow())
+    months = []
+    while month <= last:
+        months.append(month)
+        month = _next_month(month)
+    if months:
+        db.session.execute(text(
+            'ALTER TABLE audit_logs REORGANIZE PARTITION pmax INTO ('
+            + ', '.join(_partition_clause(m) for m in months)
+            + ', PARTITION pmax VALUES LESS THAN MAXVALUE)'
+        ))
+        db.session.commit()
+    return [f'p{m:%Y%m}' for m in months]
+
+
+# -- archive segments --------------------------------------------------------
+
+def _load_manifest(directory):
+    path = os.path.join(directory, 'manifest.json')
+    if not os.path.exists(path):
+        return {'segments': []}
+    with open(path, encoding='utf-8') as manifest:
+        return json.load(manifest)
+
+
+def _write_atomic(path, data, mode='w'):
+    tmp = path + '.tmp'
+    with open(tmp, mode) as target:
+        target.write(data)
+        target.flush()
+        os.fsync(target.fileno())
+    os.replace(tmp, path)
+
+
+def archive_month(month, directory):
+    """
+    Roll one month of audit_logs into a segment and remove it from the hot
+    table. Returns the manifest entry, or None when the month is empty.
+    """
+    start, end = month, _next_month(month)
+    in_month = and_(AuditLog.created_at >= start, AuditLog.created_at < end)
+    if not db.session.query(AuditLog.id).filter(in_month).first():
+        return None
+
+    os.makedirs(directory, exist_ok=True)
+    manifest = _load_manifest(directory)
+    name = f'audit-{month:%Y%m}'
+    taken = {segment['name'] for segment in manifest['segments']}
+    suffix = 1
+    while name in taken:
+        suffix += 1
+        name = f'audit-{month:%Y%m}-{suffix}'
+
+    blocks, entities = [], {}
+    rows = 0
+    min_id = max_id = None
+    data_path = os.path.join(directory, name + '.ndjson.gz')
+    query = AuditLog.query.filter(in_month).order_by(AuditLog.created_at, AuditLog.id)
+    with open(data_path + '.tmp', 'wb') as segment:
+        block = []
+
+        def write_block():
+            member = gzip.compress(''.join(json.dumps(r, separators=(',', ':')) + '\n' for r in block).encode())
+            number = len(blocks)
+            blocks.append({
+                'offset': segment.tell(),
+                'length': len(member),
+                'rows': len(block),
+                'first': block[0]['created_at'],
+                'last': block[-1]['created_at']
+            })
+            segment.write(member)
+            for r in block:
+                numbers = entities.setdefault(f"{r['entity_type']}:{r['entity_id']}", [])
+                if not numbers or numbers[-1] != number:
+                    numbers.append(number)
+
+        for log in query.yield_per(ARCHIVE_BLOCK_ROWS):
+            block.append(log.to_dict())
+            rows += 1
+            min_id = log.id if min_id is None else min(min_id, log.id)
+            max_id = log.id if max_id is None else max(max_id, log.id)
+            if len(block) >= ARCHIVE_BLOCK_ROWS:
+                write_block()
+                block = []
+        if block:
+            write_block()
+        segment.flush()
+        os.fsync(segment.fileno())
+    os.replace(data_path + '.tmp', data_path)
+    _write_atomic(os.path.join(directory, name + '.idx.json'), json.dumps({'blocks': blocks, 'entities': entities}))
+
+    entry = {
+        'name': name,
+        'from': str(start),
+        'to': str(end),
+        'rows': rows,
+        'min_id': min_id,
+        'max_id': max_id,
+        'bytes': os.path.getsize(data_path),
+        'archived_at': str(datetime.utcnow())
+    }
+    manifest['segments'].append(entry)
+    manifest['segments'].sort(key=lambda s: (s['from'], s['name']))
+    _write_atomic(os.path.join(directory, 'manifest.json'), json.dumps(manifest, indent=2))
+
+    # The segment is durable; drop the month from the hot table
+    partition = f'p{month:%Y%m}'
+    if db.engine.dialect.name == 'mysql' and partition in _partition_names():
+        db.session.execute(text(f'ALTER TABLE audit_logs DROP PARTITION {partition}'))
+    else:
+        while True:
+            ids = [i for (i,) in db.session.query(AuditLog.id).filter(in_month).limit(DELETE_BATCH)]
+            if not ids:
+                break
+            AuditLog.query.filter(AuditLog.id.in_(ids)).delete(synchronize_session=False)
+            db.session.commit()
+    db.session.commit()
+    return entry
+
+
+def run_retention(hot_months=None, directory=None):
+    """Archive every month older than the hot window; returns the new manifest entries"""
+    hot_months = hot_months if hot_months is not None else current_app.config.get('AUDIT_HOT_MONTHS', HOT_MONTHS)
+    directory = directory or _archive_dir()
+    cutoff = _month_start(datetime.utcnow())
+    for _ in range(hot_months):
+        cutoff = datetime(cutoff.year - (cutoff.month == 1), (cutoff.month - 2) % 12 + 1, 1)
+
+    oldest = db.session.query(func.min(AuditLog.created_at)).filter(AuditLog.created_at < cutoff).scalar()
+    entries = []
+    month = _month_start(oldest) if oldest else cutoff
+    while month < cutoff:
+        entry = archive_month(month, directory)
+        if entry:
+            entries.append(entry)
+        month = _next_month(month)
+    _segment_index.cache_clear()
+    return entries
+
+
+@lru_cache(maxsize=64)
+def _segment_index(path, mtime):
+    with open(path, encoding='utf-8') as index:
+        return json.load(index)
+
+
+def _scan_segment(directory, segment, start, end, entity_type, entity_id, action, after):
+    """Rows of one segment matching the filters, in (created_at, id) order"""
+    index_path = os.path.join(directory, segment['name'] + '.idx.json')
+    index = _segment_index(index_path, os.path.getmtime(index_path))
+    blocks = index['blocks']
+    if entity_type is not None and entity_id is not None:
+        numbers = index['entities'].get(f'{entity_type}:{entity_id}', [])
+    else:
+        numbers = range(len(blocks))
+
+    lower = max(filter(None, (start, after[0] if after else None)), default=None)
+    with open(os.path.join(directory, segment['name'] + '.ndjson.gz'), 'rb') as data:
+        for number in numbers:
+            block = blocks[number]
+            if lower and datetime.fromisoformat(block['last']) < lower:
+                continue
+            if end and datetime.fromisoformat(block['first']) >= end:
+                break
+            data.seek(block['offset'])
+            for line in gzip.decompress(data.read(block['length'])).splitlines():
+                row = json.loads(line)
+                key = _row_key(row)
+                if after and key <= after:
+                    continue
+                if start and key[0] < start:
+                    continue
+                if end and key[0] >= end:
+                    return
+                if entity_type is not None and row['entity_type'] != entity_type:
+                    continue
+                if entity_id is not None and row['entity_id'] != entity_id:
+                    continue
+                if action and row['action'] != action:
+                    continue
+                yield row
+
+
+def _scan_archive(start, end, entity_type, entity_id, action, after):
+    directory = _archive_dir()
+    segments = [
+        s for s in _load_manifest(directory)['segments']
+        if (not end or datetime.fromisoformat(s['from']) < end)
+        and (not start or datetime.fromisoformat(s['to']) > start)
+        and (not after or datetime.fromisoformat(s['to']) > after[0])
+    ]
+    return heapq.merge(
+        *(_scan_segment(directory, s, start, end, entity_type, entity_id, action, after) for s in segments),
+        key=_row_key
+    )
+
+
+def query_audit(start=None, end=None, entity_type=None, entity_id=None, action=None, after=None, limit=100):
+    """
+    Audit rows in [start, end) ordered by (created_at, id), from the hot table
+    and the archive. after is the (created_at, id) of the last row already
+    seen. Returns (rows, last_key) where last_key is None on the last page.
+    """
+    query = AuditLog.query
+    if start:
+        query = query.filter(AuditLog.created_at >= start)
+    if end:
+        query = query.filter(AuditLog.created_at < end)
+    if entity_type is not None:
+        query = query.filter(AuditLog.entity_type == entity_type)
+    if entity_id is not None:
+        query = query.filter(AuditLog.entity_id == entity_id)
+    if action:
+        query = query.filter(AuditLog.action == action)
+    if after:
+        query = query.filter(or_(
+            AuditLog.created_at > after[0],
+            and_(AuditLog.created_at == after[0], AuditLog.id > after[1])
+        ))
+    hot = (log.to_dict() for log in query.order_by(AuditLog.created_at, AuditLog.id).limit(limit + 1))
+
+    archived = _scan_archive(start, end, entity_type, entity_id, action, after)
+    rows = list(islice(heapq.merge(archived, hot, key=_row_key), limit + 1))
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, _row_key(rows[-1])
+    return rows, None
+
+
+def _is_base(row):
+    """Rows that carry an entity's complete state"""
+    return row.get('encoding') in ('snapshot', 'full', None) and row['new_values'] is not None
+
+
+def reconstruct_state(entity_type, entity_id, at=None):
+    """
+    State of an entity as of `at` (default: now), replayed from the nearest
+    snapshot before it. Returns (state, as_of, rows_applied); state is None
+    when nothing was recorded or the entity had been deleted.
+    """
+    end = at + timedelta(microseconds=1) if at else None
+    after = None
+
+    # Start from the latest complete state in the hot table when there is one
+    base = AuditLog.query.filter(
+        AuditLog.entity_type == entity_type,
+        AuditLog.entity_id == entity_id,
+        or_(AuditLog.encoding.in_(('snapshot', 'full')), AuditLog.encoding.is_(None)),
+        AuditLog.new_values.isnot(None)
+    )
+    if end:
+        base = base.filter(AuditLog.created_at < end)
+    base = base.order_by(AuditLog.created_at.desc(), AuditLog.id.desc()).first()
+
+    state, as_of, applied = None, None, 0
+    if base is not None:
+        state, as_of, applied = dict(base.new_values), str(base.created_at), 1
+        after = (base.created_at, base.id)
+
+    # Replay what follows (everything, from the archive on, without a base)
+    while True:
+        rows, last_key = query_audit(
+            end=end, entity_type=entity_type, entity_id=entity_id, after=after, limit=RECONSTRUCT_PAGE
+        )
+        for row in rows:
+            if row['action'].endswith('_deleted'):
+                state = None
+            elif _is_base(row):
+                state = dict(row['new_values'])
+            elif row.get('encoding') == 'delta' and row['new_values']:
+                state = dict(state or {}, **row['new_values'])
+            else:
+                continue
+            as_of = row['created_at']
+            applied += 1
+        if last_key is None:
+            return state, as_of, applied
+        after = last_key
+
+
+# -- CLI -------------------------------------------------------------------
+
+@audit_cli.command('partitions')
+@click.option('--months-ahead', default=PARTITIONS_AHEAD, show_default=True)
+def partitions_command(months_ahead):
+    """Create missing audit columns, indexes and monthly partitions"""
+    ensure_schema()
+    added = ensure_partitions(months_ahead)
+    click.echo(f"Added partitions: {', '.join(added)}" if added else 'Partitions up to date')
+
+
+@audit_cli.command('archive')
+@click.option('--hot-months', type=int, default=None, help='Months kept in the hot table (AUDIT_HOT_MONTHS)')
+def archive_command(hot_months):
+    """Roll audit months past the hot window into compressed segments"""
+    entries = run_retention(hot_months)
+    for entry in entries:
+        click.echo(f"{entry['name']}: {entry['rows']} rows, {entry['bytes']} bytes")
+    if not entries:
+        click.echo('Nothing to archive')
+    ensure_partitions()
+
+
+@audit_cli.command('verify')
+@click.option('--from', 'start', type=click.DateTime(), default=None, help='Only rows created at or after this time')
+@click.option('--to', 'end', type=click.DateTime(), default=None, help='Only rows created before this time')
+def verify_command(start, end):
+    """Check the audit hash chain, resuming from the last verified checkpoint"""
+    report = verify_chain(start, end)
+    click.echo(
+        f"{report['rows']} rows, {report['checkpoints_verified']} checkpoints in {report['seconds']}s "
+        f"({report['rows_per_second']} rows/s)"
+    )
+    if not report['ok']:
+        raise click.ClickException(report['error'])
+    click.echo('Audit chain intact')
@@ -0,0 +1,168 @@
+"""
+Room charge accrual and discharge billing.
+
+Every admission has one InPatient bill, numbered BILL-IP<in_patients.id>,
+which stays Open until discharge. accrue_room_charges(day) posts that day's
+room charge for every patient who was in a bed on the day with three
+statements, whatever the number of beds:
+
+    INSERT INTO bills ... SELECT     open bills for admissions without one
+    INSERT INTO charges ... SELECT   one 'Room' charge per patient for the day
+    UPDATE bills SET amount = ...    totals of the bills that were charged
+
+The unique key on room charges (patient_id, room_night) and the
+NOT EXISTS guards make the job idempotent per date, so it can be re-run or
+run late for a missed night. A patient counts for a day when admitted on or
+before it and not discharged before it.
+
+Discharge only posts days the job has not reached yet (normally just the
+discharge day) and finalizes the bill.
+"""
+from database import db
+from models.bill import Bill
+from models.charge import Charge, ROOM_CATEGORY
+from models.in_patient import InPatient
+from models.room import Room
+from datetime import date, datetime, timedelta
+from flask.cli import AppGroup
+from sqlalchemy import String, and_, cast, exists, func, insert, literal, select, update
+import click
+import time
+
+BILL_PREFIX = 'BILL-IP'
+
+billing_cli = AppGroup('billing', help='Billing jobs')
+
+
+def _in_bed_on(day):
+    """Admissions occupying a bed at some point on day"""
+    return and_(
+        InPatient.date_of_admission < datetime.combine(day + timedelta(days=1), datetime.min.time()),
+        (InPatient.date_of_discharge.is_(None))
+        | (InPatient.date_of_discharge >= datetime.combine(day, datetime.min.time()))
+    )
+
+
+def _admission_bill_id():
+    """Bill number of an admission: one bill per in_patients row"""
+    return literal(BILL_PREFIX) + cast(InPatient.id, String)
+
+
+def accrue_room_charges(day, patient_id=None):
+    """
+    Post the room charge for day to every open inpatient bill.
+
+    Runs in the current session without committing. Returns the number of
+    charges posted (0 when the day was already accrued).
+    """
+    now = datetime.utcnow()
+    in_bed = _in_bed_on(day)
+    if patient_id is not None:
+        in_bed = and_(in_bed, InPatient.patient_id == patient_id)
+
+    new_bills = select(
+        _admission_bill_id(),
+        InPatient.patient_id,
+        InPatient.room_id,
+        literal(0),
+        Room.health_card,
+        literal('InPatient'),
+        literal('Open'),
+        literal(now),
+        literal(now)
+    ).join(Room, Room.id == InPatient.room_id).where(
+        in_bed,
+        ~exists().where(Bill.bill_id == _admission_bill_id())
+    )
+    db.session.execute(insert(Bill.__table__).from_select(
+        ['bill_id', 'patient_id', 'room_id', 'amount', 'health_card',
+         'patient_type', 'status', 'created_at', 'updated_at'],
+        new_bills
+    ))
+
+    day_charges = select(
+        InPatient.room_id,
+        InPatient.patient_id,
+        Bill.id,
+        func.coalesce(Room.price_per_day, 0),
+        literal(ROOM_CATEGORY),
+        literal(day),
+        literal(now)
+    ).join(Room, Room.id == InPatient.room_id).join(
+        Bill, and_(Bill.bill_id == _admission_bill_id(), Bill.status == 'Open')
+    ).where(
+        in_bed,
+        ~exists().where(
+            Charge.patient_id == InPatient.patient_id,
+            Charge.category == ROOM_CATEGORY,
+            Charge.charge_date == day
+        )
+    )
+    posted = db.session.execute(insert(Charge.__table__).from_select(
+        ['room_id', 'patient_id', 'bill_id', 'amount', 'category', 'charge_date', 'created_at'],
+        day_charges
+    )).rowcount
+
+    if posted:
+        charged_bills = select(Charge.bill_id).where(Charge.charge_date == day, Charge.category == ROOM_CATEGORY)
+        if patient_id is not None:
+            charged_bills = charged_bills.where(Charge.patient_id == patient_id)
+        db.session.execute(
+            update(Bill.__table__)
+            .where(Bill.id.in_(charged_bills))
+            .values(
+                amount=select(func.coalesce(func.sum(Charge.amount), 0))
+                .where(Charge.bill_id == Bill.id)
+                .scalar_subquery(),
+                updated_at=now
+            )
+        )
+    return posted
+
+
+def generate_discharge_bill(in_patient):
+    """
+    Post the days of the stay not accrued yet and finalize the patient's open
+    bill. Call after setting date_of_discharge; does not commit.
+    """
+    db.session.flush()
+    day = in_patient.date_of_admission.date()
+    accrued = {
+        charge_date for (charge_date,) in db.session.query(Charge.charge_date).filter(
+            Charge.patient_id == in_patient.patient_id,
+            Charge.category == ROOM_CATEGORY
+        )
+    }
+    while day <= in_patient.date_of_discharge.date():
+        if day not in accrued:
+            accrue_room_charges(day, patient_id=in_patient.patient_id)
+        day += timedelta(days=1)
+
+    bill = Bill.query.filter_by(bill_id=f'{BILL_PREFIX}{in_patient.id}', status='Open').first()
+    if bill is None:
+        return None
+    bill.status = 'Finalized'
+    return bill
+
+
+def room_charge_summary(bill):
+    """(days charged, room charges total) on a bill"""
+    days, total = db.session.query(func.count(Charge.id), func.coalesce(func.sum(Charge.amount), 0)).filter(
+        Charge.bill_id == bill.id,
+        Charge.category == ROOM_CATEGORY
+    ).one()
+    return days, float(total)
+
+
+# -- CLI -------------------------------------------------------------------
+
+@billing_cli.command('accrue')
+@click.option('--date', 'day', type=click.DateTime(formats=['%Y-%m-%d']), default=None,
+              help='Day to charge (default: yesterday)')
+def accrue_command(day):
+    """Post one day's room charge for every inpatient"""
+    day = day.date() if day else date.today() - timedelta(days=1)
+    started = time.perf_counter()
+    posted = accrue_room_charges(day)
+    db.session.commit()
+    click.echo(f'{day}: {posted} room charges posted in {time.perf_counter() - started:.2f}s')
@@ -0,0 +1,132 @@
+"""
+Binary (MessagePack) frames for Socket.IO events.
+
+A client that connects with auth {'encoding': 'msgpack'} (or
+?encoding=msgpack) receives each event as one binary attachment instead of
+a JSON object. Each frame is a MessagePack array:
+
+    [key, version, base, mask, values, extra]
+
+* key      the entity id the event was emitted with (None when keyless)
+* version  the entity's state counter on this worker (0 when keyless)
+* base     the version the frame is a delta against; 0 means full state
+* mask     bit i set when EVENT_SCHEMAS[event][i] is present
+* values   the present schema fields, in schema order
+* extra    fields outside the schema (or the whole payload for events
+           without one), None when empty
+
+Field names never go over the wire for schema fields; the client gets the
+schemas once, in the 'hms_encoding' event sent on connect. A delta frame
+carries only the fields that changed since the version named by base,
+which the client applies on top of the state it holds for that event and
+key. A field
+that disappeared is sent as None.
+
+msgpack is an optional dependency; without it every client gets JSON.
+"""
+from datetime import date, datetime, time
+from decimal import Decimal
+from uuid import UUID
+
+try:
+    import msgpack
+except ImportError:  # optional dependency
+    msgpack = None
+
+JSON = 'json'
+MSGPACK = 'msgpack'
+
+ROOM_FIELDS = (
+    'id', 'room_no', 'status', 'room_type', 'price_per_day',
+    'bed_count_total', 'bed_count_remaining', 'health_card'
+)
+
+# Field order is part of the wire format: only ever append to these
+EVENT_SCHEMAS = {
+    'room_created': ROOM_FIELDS,
+    'room_updated': ROOM_FIELDS,
+    'patient_added': ('patient_id', 'name', 'category'),
+    'patient_discharged': ('patient_id', 'name', 'bill_id'),
+}
+
+_FIELD_INDEX = {
+    event: {field: i for i, field in enumerate(fields)}
+    for event, fields in EVENT_SCHEMAS.items()
+}
+
+
+def _default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    if isinstance(value, UUID):
+        return str(value)
+    raise TypeError(f'Object of type {type(value).__name__} is not MessagePack serializable')
+
+
+def negotiate(auth, args):
+    """Encoding a connecting client asked for, if this server can speak it"""
+    wanted = (auth or {}).get('encoding') if isinstance(auth, dict) else None
+    wanted = wanted or args.get('encoding')
+    if wanted == MSGPACK and msgpack is not None:
+        return MSGPACK
+    return JSON
+
+
+def changed_fields(old, new):
+    """Names of the fields that differ between two states of an entity"""
+    changed = [field for field, value in new.items() if field not in old or old[field] != value]
+    changed += [field for field in old if field not in new]
+    return changed
+
+
+def encode_frame(event, key, data, version=0, base=0, fields=None):
+    """
+    Pack one event as a MessagePack frame.
+
+    fields limits the frame to those names (a delta against base); by
+    default every field in data is sent.
+    """
+    if not isinstance(data, dict):
+        return msgpack.packb([key, version, 0, 0, [], data], default=_default)
+
+    index = _FIELD_INDEX.get(event, {})
+    names = data.keys() if fields is None else fields
+    mask = 0
+    present = []
+    extra = {}
+    for name in names:
+        position = index.get(name)
+        if position is None:
+            extra[name] = data.get(name)
+        else:
+            mask |= 1 << position
+            present.append(position)
+    values = [data.get(EVENT_SCHEMAS[event][position]) for position in sorted(present)]
+    return msgpack.packb([key, version, base, mask, values, extra or None], default=_default)
+
+
+def decode_frame(event, frame, state=None):
+    """
+    Rebuild the event payload from a frame (what a client does).
+
+    state is the client's copy of the entity at the frame's base version;
+    it is required for delta frames.
+    """
+    key, version, base, mask, values, extra = msgpack.unpackb(frame)
+    if base:
+        if state is None:
+            raise ValueError(f'Delta against version {base} of {event} {key} without a base state')
+        data = dict(state)
+    elif not isinstance(extra, dict) and not mask:
+        return extra
+    else:
+        data = {}
+    values = iter(values)
+    for position, field in enumerate(EVENT_SCHEMAS.get(event, ())):
+        if mask & (1 << position):
+            data[field] = next(values)
+    if extra:
+        data.update(extra)
+    return data
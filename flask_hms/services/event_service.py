@@ -0,0 +1,289 @@
+"""
+Coalescing Socket.IO event dispatcher.
+
+Request handlers call dispatcher.emit(); it only records the event and
+returns. A background task wakes up every TICK_INTERVAL seconds and sends
+what accumulated since the last tick, so request latency no longer depends
+on how many dashboards are connected.
+
+* Events emitted with a key are coalesced: room 12 updated five times within
+  a tick goes out once, with its latest state.
+* Up-to-date clients get each event with a single broadcast.
+* A client whose transport queue is backed up is taken off the broadcast and
+  fed from its own bounded queue, keyed the same way, so superseded updates
+  replace each other instead of piling up. Everything left in a full queue
+  is the latest state of something, so an overflow drops the whole queue
+  instead: once the client drains it gets one 'hms_resync' event naming the
+  events it missed, refetches, and rejoins the broadcasts.
+* Clients that negotiate MessagePack (see services.event_encoding) sit in
+  their own Socket.IO room and get binary frames. For keyed events the
+  dispatcher remembers the state each of them was last sent, so an update
+  goes out as one broadcast of the changed fields to every client holding
+  the previous version, and as a full frame to the rest. With a message bus
+  the clients of other workers are unknown here, so every binary frame is
+  sent in full.
+"""
+from collections import OrderedDict
+from itertools import count
+import logging
+import threading
+from flask import request
+from flask_socketio import emit, join_room
+from services.event_encoding import (
+    EVENT_SCHEMAS, JSON, MSGPACK, changed_fields, encode_frame, msgpack, negotiate
+)
+
+logger = logging.getLogger(__name__)
+
+TICK_INTERVAL = 0.25       # seconds between flushes
+CLIENT_QUEUE_SIZE = 256    # events held for a lagging client
+MAX_BACKLOG = 64           # transport packets queued before a client counts as lagging
+CATCH_UP_BATCH = 32        # queued events sent to a recovered client per tick
+BASELINES = 10000          # keyed entity states remembered for delta frames
+
+ROOMS = {JSON: 'encoding:json', MSGPACK: 'encoding:msgpack'}
+KEYLESS = '#'
+
+
+class EventDispatcher:
+    """Batches, coalesces and fans out Socket.IO events off the request path"""
+
+    def __init__(self, tick=TICK_INTERVAL, queue_size=CLIENT_QUEUE_SIZE, max_backlog=MAX_BACKLOG):
+        self.tick = tick
+        self.queue_size = queue_size
+        self.max_backlog = max_backlog
+        self.socketio = None
+        self._lock = threading.Lock()
+        self._pending = OrderedDict()   # (event, key) -> data
+        self._clients = set()           # sids connected to this worker
+        self._lagging = {}              # sid -> OrderedDict((event, key) -> data)
+        self._resync = {}               # lagging sid whose queue overflowed -> event names it missed
+        self._binary = {}               # sid -> {(event, key): version last sent}
+        self._joining = []              # binary sids to add to their room at the next flush
+        self._baselines = OrderedDict() # (event, key) -> (version, data) last sent to binary clients
+        self._sequence = count()
+        self._started = False
+        self.deltas = True
+        self.counters = {
+            'emitted': 0, 'coalesced': 0, 'sent': 0, 'dropped': 0, 'resyncs': 0,
+            'binary_frames': 0, 'delta_frames': 0
+        }
+        self.by_event = {}              # event -> {'emitted': n, 'sent': n}
+
+    def init_app(self, app, socketio):
+        self.socketio = socketio
+        self.deltas = not app.config.get('SOCKETIO_MESSAGE_QUEUE')
+        socketio.on_event('connect', self._on_connect)
+        socketio.on_event('disconnect', self._on_disconnect)
+        app.extensions['event_dispatcher'] = self
+
+    # -- connections -------------------------------------------------------
+
+    def _on_connect(self, auth=None):
+        encoding = negotiate(auth, request.args)
+        # Binary clients with deltas join their room from the flush thread,
+        # so no broadcast reaches them before their baselines are tracked
+        if encoding == JSON or not self.deltas:
+            join_room(ROOMS[encoding])
+        with self._lock:
+            self._clients.add(request.sid)
+            if encoding == MSGPACK:
+                self._binary[request.sid] = {}
+                if self.deltas:
+                    self._joining.append(request.sid)
+                    self._start()
+        emit('hms_encoding', {'encoding': encoding, 'schemas': EVENT_SCHEMAS if encoding == MSGPACK else {}})
+
+    def _on_disconnect(self, *args):
+        with self._lock:
+            self._clients.discard(request.sid)
+            self._lagging.pop(request.sid, None)
+            self._resync.pop(request.sid, None)
+            self._binary.pop(request.sid, None)
+
+    @property
+    def connected_clients(self):
+        return len(self._clients)
+
+    # -- producing ---------------------------------------------------------
+
+    def emit(self, event, data, key=None):
+        """
+        Queue an event for every client.
+
+        Events sharing (event, key) within a tick are coalesced into the last
+        one; events without a key are always delivered.
+        """
+        if self.socketio is None:
+            return
+        slot = (event, key if key is not None else (KEYLESS, next(self._sequence)))
+        with self._lock:
+            self.counters['emitted'] += 1
+            counts = self.by_event.get(event)
+            if counts is None:
+                counts = self.by_event[event] = {'emitted': 0, 'sent': 0}
+            counts['emitted'] += 1
+            if slot in self._pending:
+                self.counters['coalesced'] += 1
+                self._pending.move_to_end(slot)
+            self._pending[slot] = data
+            self._start()
+
+    def _start(self):
+        if not self._started:
+            self._started = True
+            self.socketio.start_background_task(self._run)
+
+    # -- delivery ----------------------------------------------------------
+
+    def _backlog(self, sid):
+        """Packets waiting in a client's transport queue"""
+        server = self.socketio.server
+        try:
+            eio_sid = server.manager.eio_sid_from_sid(sid, '/')
+            return server.eio.sockets[eio_sid].queue.qsize()
+        except (AttributeError, KeyError, TypeError):
+            return 0
+
+    def _enqueue(self, sid, queue, slot, data):
+        missed = self._resync.get(sid)
+        if missed is not None:
+            missed.add(slot[0])
+            self.counters['dropped'] += 1
+            return
+        if slot in queue:
+            self.counters['coalesced'] += 1
+            queue.move_to_end(slot)
+        queue[slot] = data
+        if len(queue) > self.queue_size:
+            # Superseded states were replaced above, so any entry dropped now is
+            # state the client would never see: drop them all and have it refetch
+            self._resync[sid] = {event for event, _ in queue}
+            self.counters['dropped'] += len(queue)
+            queue.clear()
+
+    def _send_resync(self, sid):
+        """Tell a client whose queue overflowed to refetch, and put it back on the broadcasts"""
+        self.socketio.emit('hms_resync', {'events': sorted(self._resync.pop(sid, ()))}, to=sid)
+        # Its baselines are unknown now: the next update of every entity goes out in full
+        seen = self._binary.get(sid)
+        if seen is not None:
+            seen.clear()
+        self._lagging.pop(sid, None)
+        self.counters['resyncs'] += 1
+
+    @staticmethod
+    def _wire_key(slot):
+        key = slot[1]
+        return None if isinstance(key, tuple) and key[0] == KEYLESS else key
+
+    def _forget(self, slot):
+        for seen in list(self._binary.values()):
+            seen.pop(slot, None)
+
+    def _send_binary(self, slot, data, binary, lagging):
+        """Send one event to the MessagePack clients, as a delta where they can take one"""
+        event, key = slot[0], self._wire_key(slot)
+        if not self.deltas or key is None or not isinstance(data, dict):
+            self.socketio.emit(event, encode_frame(event, key, data), to=ROOMS[MSGPACK], skip_sid=lagging or None)
+            self.counters['binary_frames'] += 1
+            return
+
+        previous = self._baselines.pop(slot, None)
+        version = previous[0] + 1 if previous else 1
+        self._baselines[slot] = (version, data)
+        if len(self._baselines) > BASELINES:
+            self._forget(self._baselines.popitem(last=False)[0])
+
+        current, stale = [], []
+        for sid in binary:
+            seen = self._binary.get(sid)
+            if seen is None or sid in self._lagging:
+                continue
+            (current if previous and seen.get(slot) == previous[0] else stale).append(sid)
+            seen[slot] = version
+
+        full = encode_frame(event, key, data, version)
+        if len(current) > len(stale):
+            delta = encode_frame(event, key, data, version, previous[0], changed_fields(previous[1], data))
+            self.socketio.emit(event, delta, to=ROOMS[MSGPACK], skip_sid=(lagging + stale) or None)
+            self.counters['delta_frames'] += 1
+            for sid in stale:
+                self.socketio.emit(event, full, to=sid)
+            self.counters['binary_frames'] += 1 + len(stale)
+        else:
+            self.socketio.emit(event, full, to=ROOMS[MSGPACK], skip_sid=lagging or None)
+            self.counters['binary_frames'] += 1
+
+    def _send_to(self, sid, slot, data):
+        """Send a queued event to one catching-up client in its encoding"""
+        seen = self._binary.get(sid)
+        if seen is None:
+            self.socketio.emit(slot[0], data, to=sid)
+            return
+        # Queued states can be older than the baseline: the next update is sent in full
+        seen.pop(slot, None)
+        self.socketio.emit(slot[0], encode_frame(slot[0], self._wire_key(slot), data), to=sid)
+        self.counters['binary_frames'] += 1
+
+    def flush(self):
+        """Send everything queued since the last flush"""
+        with self._lock:
+            batch, self._pending = self._pending, OrderedDict()
+            clients = list(self._clients)
+            joining, self._joining = self._joining, []
+            binary = list(self._binary)
+
+        for sid in joining:
+            if sid in self._binary:
+                self.socketio.server.enter_room(sid, ROOMS[MSGPACK], namespace='/')
+
+        # Clients with a backed-up transport stop receiving broadcasts
+        for sid in clients:
+            if sid not in self._lagging and self._backlog(sid) > self.max_backlog:
+                self._lagging[sid] = OrderedDict()
+        lagging = list(self._lagging)
+
+        for slot, data in batch.items():
+            self.socketio.emit(slot[0], data, to=ROOMS[JSON], skip_sid=lagging or None)
+            if msgpack is not None and (binary or not self.deltas):
+                self._send_binary(slot, data, binary, lagging)
+            self.counters['sent'] += 1
+            self.by_event[slot[0]]['sent'] += 1
+            for sid in lagging:
+                queue = self._lagging.get(sid)
+                if queue is not None:
+                    self._enqueue(sid, queue, slot, data)
+
+        # Feed lagging clients from their own queues once they drain
+        for sid in lagging:
+            queue = self._lagging.get(sid)
+            if queue is None or self._backlog(sid) > self.max_backlog:
+                continue
+            if sid in self._resync:
+                self._send_resync(sid)
+                continue
+            for _ in range(min(CATCH_UP_BATCH, len(queue))):
+                slot, data = queue.popitem(last=False)
+                self._send_to(sid, slot, data)
+                self.counters['sent'] += 1
+            if not queue:
+                self._lagging.pop(sid, None)
+
+    def _run(self):
+        while True:
+            self.socketio.sleep(self.tick)
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Event dispatch failed')
+
+    def stats(self):
+        return dict(
+            self.counters, clients=len(self._clients), binary_clients=len(self._binary),
+            lagging=len(self._lagging), resyncing=len(self._resync), pending=len(self._pending),
+            by_event={event: dict(counts) for event, counts in list(self.by_event.items())}
+        )
+
+
+dispatcher = EventDispatcher()
@@ -0,0 +1,218 @@
+"""
+Message buses that carry Socket.IO emits between worker processes.
+
+Every worker runs its own SocketIO server; an emit made in one worker is
+published on the bus and replayed by every other worker to the clients
+connected to it. The bus is picked with SOCKETIO_MESSAGE_QUEUE:
+
+    (unset)                  single worker, no bus
+    memory://[channel]       in-process hub, for tests running several
+                             SocketIO servers in one process
+    unix:///path/bus.sock    Unix-socket broker, for workers on one host
+                             (start it with `python -m services.message_bus
+                             /path/bus.sock`)
+    redis://host:6379/0      Redis pub/sub, for workers on several hosts
+                             (anything else Flask-SocketIO accepts as
+                             message_queue also works)
+
+The bus only carries emits. Socket.IO sessions still live in the worker that
+accepted them, so a load balancer in front of several workers must use sticky
+sessions (e.g. nginx `ip_hash`, or `hash $remote_addr` on the upstream) or
+polling clients will land on workers that do not know their sid.
+
+The buses below skip the publishing worker: PubSubManager.emit() delivers to
+local clients itself before publishing, and base64-wraps binary payloads
+(MessagePack event frames) so they survive json.dumps(). Both need
+python-socketio 5.14.2 or later; older versions only publish and would leave
+the emitting worker's own clients without the event.
+"""
+import json
+import logging
+import os
+import queue
+import socket
+import socketserver
+import struct
+import sys
+import threading
+from socketio import PubSubManager
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHANNEL = 'hms-socketio'
+FRAME_HEADER = struct.Struct('!I')
+
+
+def _encode(data):
+    body = json.dumps(data, separators=(',', ':')).encode()
+    return FRAME_HEADER.pack(len(body)) + body
+
+
+def _read_frame(stream):
+    header = stream.read(FRAME_HEADER.size)
+    if len(header) < FRAME_HEADER.size:
+        return None
+    return stream.read(FRAME_HEADER.unpack(header)[0])
+
+
+class MemoryManager(PubSubManager):
+    """Pub/sub between SocketIO servers living in the same process"""
+
+    name = 'memory'
+    _channels = {}
+    _channels_lock = threading.Lock()
+
+    def __init__(self, channel=DEFAULT_CHANNEL, write_only=False, logger=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self._inbox = queue.Queue()
+        with self._channels_lock:
+            self._channels.setdefault(channel, []).append(self._inbox)
+
+    def _publish(self, data):
+        message = json.dumps(data)
+        for inbox in list(self._channels.get(self.channel, ())):
+            # emit() already delivered to this server's clients
+            if inbox is not self._inbox:
+                inbox.put(message)
+
+    def _listen(self):
+        while True:
+            yield json.loads(self._inbox.get())
+
+
+class UnixSocketManager(PubSubManager):
+    """Pub/sub through a BusBroker listening on a Unix socket"""
+
+    name = 'unix'
+
+    def __init__(self, url, channel=DEFAULT_CHANNEL, write_only=False, logger=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self.path = url[len('unix://'):] if url.startswith('unix://') else url
+        self._publisher = None
+        self._publish_lock = threading.Lock()
+
+    def _connect(self, role):
+        connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        connection.connect(self.path)
+        connection.sendall(_encode({'role': role, 'channel': self.channel, 'host_id': self.host_id}))
+        return connection
+
+    def _publish(self, data):
+        frame = _encode(data)
+        with self._publish_lock:
+            for attempt in range(2):
+                try:
+                    if self._publisher is None:
+                        self._publisher = self._connect('publish')
+                    self._publisher.sendall(frame)
+                    return
+                except OSError:
+                    if self._publisher is not None:
+                        self._publisher.close()
+                    self._publisher = None
+            logger.error('Cannot publish to message bus at %s', self.path)
+
+    def _listen(self):
+        retry = 0.5
+        while True:
+            try:
+                connection = self._connect('subscribe')
+                retry = 0.5
+                with connection, connection.makefile('rb') as stream:
+                    while True:
+                        body = _read_frame(stream)
+                        if body is None:
+                            break
+                        yield json.loads(body)
+            except OSError:
+                pass
+            logger.error('Lost message bus at %s, reconnecting in %.1fs', self.path, retry)
+            self.server.sleep(retry)
+            retry = min(retry * 2, 30)
+
+
+class _BusHandler(socketserver.StreamRequestHandler):
+    """One worker connection: a subscriber receives frames, a publisher sends them"""
+
+    def handle(self):
+        body = _read_frame(self.rfile)
+        if not body:
+            return
+        hello = json.loads(body)
+        channel, host_id = hello.get('channel'), hello.get('host_id')
+        if hello.get('role') == 'subscribe':
+            self._subscribe(channel, host_id)
+        else:
+            self._relay(channel, host_id)
+
+    def _subscribe(self, channel, host_id):
+        server = self.server
+        with server.lock:
+            server.subscribers[self.connection] = (channel, host_id, threading.Lock())
+        try:
+            # Nothing is read from a subscriber; wait for it to hang up
+            while self.rfile.read(1):
+                pass
+        finally:
+            with server.lock:
+                server.subscribers.pop(self.connection, None)
+
+    def _relay(self, channel, host_id):
+        server = self.server
+        while True:
+            body = _read_frame(self.rfile)
+            if body is None:
+                break
+            frame = FRAME_HEADER.pack(len(body)) + body
+            with server.lock:
+                targets = [
+                    (connection, lock) for connection, (c, h, lock) in server.subscribers.items()
+                    if c == channel and h != host_id   # the publisher delivered locally
+                ]
+            for connection, lock in targets:
+                # One writer per subscriber so frames never interleave
+                with lock:
+                    try:
+                        connection.sendall(frame)
+                    except OSError:
+                        pass
+
+
+class BusBroker(socketserver.ThreadingUnixStreamServer):
+    """Relays every frame a worker publishes to the other workers on its channel"""
+
+    daemon_threads = True
+
+    def __init__(self, path):
+        if os.path.exists(path):
+            os.unlink(path)
+        super().__init__(path, _BusHandler)
+        self.lock = threading.Lock()
+        self.subscribers = {}   # connection -> (channel, host_id, send lock)
+
+
+def create_client_manager(url, channel=DEFAULT_CHANNEL, write_only=False):
+    """
+    Build the client manager for SOCKETIO_MESSAGE_QUEUE.
+
+    Returns None for buses Flask-SocketIO creates itself from message_queue
+    (Redis, Kafka, Kombu) and when no bus is configured.
+    """
+    if not url:
+        return None
+    if url.startswith('memory://'):
+        return MemoryManager(channel=url[len('memory://'):] or channel, write_only=write_only)
+    if url.startswith('unix://'):
+        return UnixSocketManager(url, channel=channel, write_only=write_only)
+    return None
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    path = sys.argv[1] if len(sys.argv) > 1 else '/tmp/hms-socketio.sock'
+    broker = BusBroker(path)
+    logger.info('Message bus listening on %s', path)
+    try:
+        broker.serve_forever()
+    finally:
+        os.unlink(path)
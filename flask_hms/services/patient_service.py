@@ -0,0 +1,211 @@
+from database import db
+from models.patient import Patient
+from models.in_patient import InPatient
+from models.out_patient import OutPatient
+from models.room import Room
+from datetime import datetime
+from sqlalchemy import func, select
+from sqlalchemy.orm import joinedload, selectinload
+from validators.validators import validate_patient_data
+import uuid
+
+# Chart sections are the relationships declared on Patient. One-to-one sections
+# are joined into the patient row; collections are fetched with one SELECT ... IN
+# each, so a chart costs 1 + (number of requested collections) queries.
+DEFAULT_CHART_SECTIONS = ('in_patient', 'prescriptions', 'bills', 'lab_reports')
+
+
+_chart_sections = []
+
+
+def chart_sections():
+    """Patient's relationship names, read once the mappers can be configured"""
+    if not _chart_sections:
+        _chart_sections.extend(rel.key for rel in Patient.__mapper__.relationships)
+    return _chart_sections
+
+
+def parse_chart_sections(include):
+    """Turn an ?include= value into a tuple of chart sections"""
+    if include is None:
+        return DEFAULT_CHART_SECTIONS
+
+    sections = []
+    for name in include.split(','):
+        name = name.strip()
+        if not name:
+            continue
+        # 'inpatient' is the key used in the chart response
+        if name == 'inpatient':
+            name = 'in_patient'
+        if name not in chart_sections():
+            raise ValueError(f"Unknown section '{name}'. Must be one of: {', '.join(chart_sections())}")
+        if name not in sections:
+            sections.append(name)
+    return tuple(sections)
+
+
+def load_patient_chart(patient_id, sections=DEFAULT_CHART_SECTIONS):
+    """Load a patient and the requested chart sections in a fixed number of queries"""
+    options = []
+    for name in sections:
+        relationship = Patient.__mapper__.relationships[name]
+        attr = getattr(Patient, name)
+        if relationship.uselist:
+            options.append(selectinload(attr))
+        elif name == 'in_patient':
+            options.append(joinedload(attr).joinedload(InPatient.room))
+        else:
+            options.append(joinedload(attr))
+
+    return Patient.query.options(*options).filter(Patient.id == patient_id).first()
+
+
+def patient_chart_version(patient_id, sections=DEFAULT_CHART_SECTIONS):
+    """
+    Fingerprint of a chart in one query: the patient's updated_at plus the
+    row count and newest updated_at of every requested section (and of the
+    admission's room). Returns None when the patient does not exist; the
+    last element is the newest timestamp of all.
+    """
+    columns = [Patient.updated_at]
+    for name in sections:
+        model = Patient.__mapper__.relationships[name].mapper.class_
+        columns += [
+            select(func.count(model.id)).where(model.patient_id == Patient.id).scalar_subquery(),
+            select(func.max(model.updated_at)).where(model.patient_id == Patient.id).scalar_subquery()
+        ]
+        if name == 'in_patient':
+            columns.append(
+                select(func.max(Room.updated_at)).join(InPatient, InPatient.room_id == Room.id)
+                .where(InPatient.patient_id == Patient.id).scalar_subquery()
+            )
+    row = db.session.query(*columns).filter(Patient.id == patient_id).first()
+    if row is None:
+        return None
+    return tuple(row) + (max(value for value in row if isinstance(value, datetime)),)
+
+
+def serialize_patient_chart(patient, sections=DEFAULT_CHART_SECTIONS):
+    """Serialize a patient loaded by load_patient_chart"""
+    data = patient.to_dict()
+
+    for name in sections:
+        value = getattr(patient, name)
+        if name == 'in_patient':
+            if value:
+                data['inpatient'] = {
+                    'date_of_admission': str(value.date_of_admission),
+                    'date_of_discharge': str(value.date_of_discharge) if value.date_of_discharge else None,
+                    'room_id': value.room_id,
+                    'room': value.room.to_dict() if value.room else None
+                }
+        elif Patient.__mapper__.relationships[name].uselist:
+            data[name] = [item.to_dict() for item in value]
+        else:
+            data[name] = value.to_dict() if value else None
+
+    return data
+
+
+def import_patient_chunk(rows):
+    """
+    Validate and insert one chunk of bulk-import rows in a single transaction.
+
+    rows is a list of (row_number, data) pairs. Patients and their
+    OutPatient/InPatient records go in with multi-row INSERTs and beds are
+    taken with one conditional UPDATE per room, so a chunk costs a handful of
+    statements regardless of its size. The caller commits.
+
+    Returns (patient_ids, errors, room_ids): the inserted Patient ids, a list
+    of {'row', 'errors'} dicts and the rooms whose bed counts changed.
+    """
+    errors = []
+    valid = []
+    for row_number, data in rows:
+        values, row_errors = validate_patient_data(data)
+        if row_errors:
+            errors.append({'row': row_number, 'errors': row_errors})
+        else:
+            valid.append((row_number, values))
+
+    # Hand out beds in row order from what each room has left
+    wanted = {}
+    for _, values in valid:
+        if values['room_id'] is not None:
+            wanted[values['room_id']] = wanted.get(values['room_id'], 0) + 1
+
+    remaining = {}
+    if wanted:
+        remaining = dict(
+            db.session.query(Room.id, Room.bed_count_remaining).filter(Room.id.in_(list(wanted))).all()
+        )
+
+    allotted = {}
+    admitted = []
+    for row_number, values in valid:
+        room_id = values['room_id']
+        if room_id is not None:
+            if room_id not in remaining:
+                errors.append({'row': row_number, 'errors': ['Room not found']})
+                continue
+            if allotted.get(room_id, 0) >= (remaining[room_id] or 0):
+                errors.append({'row': row_number, 'errors': ['No beds available in this room']})
+                continue
+            allotted[room_id] = allotted.get(room_id, 0) + 1
+        admitted.append((row_number, values))
+
+    # Conditional decrement: a room that lost beds to a concurrent admission
+    # since the read above fails as a whole instead of overbooking
+    for room_id, count in list(allotted.items()):
+        result = db.session.execute(
+            Room.__table__.update()
+            .where(Room.id == room_id, Room.bed_count_remaining >= count)
+            .values(bed_count_remaining=Room.bed_count_remaining - count, updated_at=datetime.utcnow())
+        )
+        if result.rowcount != 1:
+            del allotted[room_id]
+    confirmed = []
+    for row_number, values in admitted:
+        if values['room_id'] is not None and values['room_id'] not in allotted:
+            errors.append({'row': row_number, 'errors': ['No beds available in this room']})
+        else:
+            confirmed.append((row_number, values))
+    admitted = confirmed
+    errors.sort(key=lambda error: error['row'])
+
+    if not admitted:
+        return [], errors, list(allotted)
+
+    now = datetime.utcnow()
+    patient_rows = []
+    for _, values in admitted:
+        row = {key: value for key, value in values.items() if key != 'room_id'}
+        row.update(patient_id=f"PAT-{uuid.uuid4().hex[:8].upper()}", created_at=now, updated_at=now)
+        patient_rows.append(row)
+    db.session.execute(Patient.__table__.insert(), patient_rows)
+
+    # MySQL has no INSERT ... RETURNING; read the new ids back by patient_id
+    codes = [row['patient_id'] for row in patient_rows]
+    ids = dict(db.session.query(Patient.patient_id, Patient.id).filter(Patient.patient_id.in_(codes)).all())
+
+    in_patient_rows = []
+    out_patient_rows = []
+    for row, (_, values) in zip(patient_rows, admitted):
+        patient_id = ids[row['patient_id']]
+        if values['room_id'] is not None:
+            in_patient_rows.append({
+                'patient_id': patient_id,
+                'date_of_admission': now,
+                'room_id': values['room_id'],
+                'created_at': now,
+                'updated_at': now
+            })
+        else:
+            out_patient_rows.append({'patient_id': patient_id, 'created_at': now, 'updated_at': now})
+    if in_patient_rows:
+        db.session.execute(InPatient.__table__.insert(), in_patient_rows)
+    if out_patient_rows:
+        db.session.execute(OutPatient.__table__.insert(), out_patient_rows)
+
+    return [ids[code] for code in codes], errors, list(allotted)
@@ -0,0 +1,277 @@
+from database import db
+from models.room import Room
+from datetime import datetime
+from sqlalchemy import func, select, update
+from sqlalchemy.exc import OperationalError
+import random
+import threading
+import time
+
+MAX_ALLOCATION_ATTEMPTS = 5
+CANDIDATE_ROOMS = 8
+RETRY_BACKOFF = 0.005  # seconds, doubled on every retry
+
+# MySQL deadlock and lock wait timeout
+RETRYABLE_ERRORS = (1213, 1205)
+
+AVAILABILITY_KEYS = ('room_type', 'status')
+VERSION_CHECK_INTERVAL = 2   # seconds between fingerprint checks against the DB
+RESYNC_INTERVAL = 300        # full reload even when the fingerprint matches
+
+
+class NoBedAvailable(Exception):
+    """Raised when a bed cannot be allocated"""
+
+    def __init__(self, message, not_found=False):
+        super().__init__(message)
+        self.not_found = not_found
+
+
+def _is_retryable(error):
+    code = getattr(error.orig, 'args', (None,))[0] if error.orig is not None else None
+    return code in RETRYABLE_ERRORS or 'locked' in str(error.orig).lower()
+
+
+def _take_bed(connection, room_id):
+    """Conditional decrement: succeeds only while the room still has a free bed"""
+    result = connection.execute(
+        update(Room.__table__)
+        .where(Room.id == room_id, Room.bed_count_remaining > 0)
+        .values(bed_count_remaining=Room.bed_count_remaining - 1, updated_at=datetime.utcnow())
+    )
+    return result.rowcount == 1
+
+
+def allocate_bed(room_id=None, room_type=None):
+    """
+    Atomically take one bed and return the id of the room it came from.
+
+    With room_id the bed must come from that room; otherwise any room of
+    room_type with a free bed is used. Each attempt is a single conditional
+    UPDATE committed in its own short transaction, so concurrent admissions
+    never oversell a room and no row lock outlives the statement. Callers that
+    fail to record the admission afterwards must hand the bed back with
+    release_bed(). Raises NoBedAvailable.
+    """
+    if room_id is None and room_type is None:
+        raise ValueError('room_id or room_type is required')
+
+    delay = RETRY_BACKOFF
+    for attempt in range(MAX_ALLOCATION_ATTEMPTS):
+        try:
+            with db.engine.begin() as connection:
+                if room_id is not None:
+                    if _take_bed(connection, room_id):
+                        return room_id
+                    exists = connection.execute(select(Room.id).where(Room.id == room_id)).first()
+                    if not exists:
+                        raise NoBedAvailable('Room not found', not_found=True)
+                    raise NoBedAvailable('No beds available in this room')
+
+                candidates = connection.execute(
+                    select(Room.id)
+                    .where(Room.room_type == room_type, Room.bed_count_remaining > 0)
+                    .order_by(Room.bed_count_remaining.desc())
+                    .limit(CANDIDATE_ROOMS)
+                ).scalars().all()
+                if not candidates:
+                    raise NoBedAvailable(f'No {room_type} beds available')
+
+                # Spread concurrent admissions over the emptiest rooms
+                random.shuffle(candidates)
+                for candidate in candidates:
+                    if _take_bed(connection, candidate):
+                        return candidate
+        except OperationalError as e:
+            if not _is_retryable(e) or attempt == MAX_ALLOCATION_ATTEMPTS - 1:
+                raise
+
+        # Every candidate was taken by a concurrent admission; look again
+        time.sleep(delay * random.random())
+        delay *= 2
+
+    raise NoBedAvailable(f'No {room_type} beds available')
+
+
+def release_bed(room_id):
+    """
+    Give one bed back to a room.
+
+    Runs in the caller's session so the bed is returned in the same commit as
+    the discharge or delete; the increment never exceeds bed_count_total.
+    Returns False when the room was already fully free.
+    """
+    result = db.session.execute(
+        update(Room.__table__)
+        .where(Room.id == room_id, Room.bed_count_remaining < Room.bed_count_total)
+        .values(bed_count_remaining=Room.bed_count_remaining + 1, updated_at=datetime.utcnow())
+    )
+    return result.rowcount == 1
+
+
+class RoomAvailabilityIndex:
+    """
+    Process-local free-bed counts and free-room sets keyed by room_type and status.
+
+    The admission, discharge and room routes call index_room()/remove_room()
+    after they commit. Changes made by other workers (or straight SQL) are
+    caught by comparing a cheap fingerprint of the rooms table - row count,
+    free beds and latest updated_at - against the index every few seconds and
+    reloading on mismatch, so between checks queries never touch the database.
+    """
+
+    def __init__(self, keys=AVAILABILITY_KEYS):
+        self._lock = threading.Lock()
+        self._keys = keys
+        self._rooms = {}        # id -> Room.to_dict() snapshot
+        self._updated_at = {}   # id -> updated_at, for the fingerprint
+        self._free = set()      # ids of rooms with a free bed
+        self._by_key = {}       # (key, value) -> ids of free rooms
+        self._beds = {}         # (key, value) -> [free beds, total beds]
+        self._free_beds = 0
+        self._built = False
+        self._checked_at = 0.0
+        self._built_at = 0.0
+
+    # -- maintenance -------------------------------------------------------
+
+    def _discard(self, room_id):
+        data = self._rooms.pop(room_id, None)
+        self._updated_at.pop(room_id, None)
+        if data is None:
+            return
+        self._free.discard(room_id)
+        self._free_beds -= data['bed_count_remaining'] or 0
+        for key in self._keys:
+            entry = (key, data[key])
+            ids = self._by_key.get(entry)
+            if ids is not None:
+                ids.discard(room_id)
+            beds = self._beds[entry]
+            beds[0] -= data['bed_count_remaining'] or 0
+            beds[1] -= data['bed_count_total'] or 0
+
+    def _add(self, data, updated_at):
+        self._discard(data['id'])
+        self._rooms[data['id']] = data
+        self._updated_at[data['id']] = updated_at
+        free = data['bed_count_remaining'] or 0
+        self._free_beds += free
+        if free > 0:
+            self._free.add(data['id'])
+        for key in self._keys:
+            entry = (key, data[key])
+            if free > 0:
+                self._by_key.setdefault(entry, set()).add(data['id'])
+            beds = self._beds.setdefault(entry, [0, 0])
+            beds[0] += free
+            beds[1] += data['bed_count_total'] or 0
+
+    def add(self, room):
+        """Insert or replace one room from a committed Room instance"""
+        data = room.to_dict()
+        with self._lock:
+            self._add(data, room.updated_at)
+
+    def remove(self, room_id):
+        with self._lock:
+            self._discard(room_id)
+
+    def _fingerprint(self):
+        latest = max((value for value in self._updated_at.values() if value), default=None)
+        return len(self._rooms), self._free_beds, latest
+
+    def build(self):
+        """Load every room from the database (needs an app context)"""
+        rooms = Room.query.all()
+        with self._lock:
+            self._rooms, self._updated_at, self._free = {}, {}, set()
+            self._by_key, self._beds, self._free_beds = {}, {}, 0
+            for room in rooms:
+                self._add(room.to_dict(), room.updated_at)
+            self._built = True
+            self._built_at = self._checked_at = time.monotonic()
+
+    def sync(self):
+        """Reload when the rooms table no longer matches the index"""
+        now = time.monotonic()
+        if not self._built or now - self._built_at >= RESYNC_INTERVAL:
+            self.build()
+            return
+        if now - self._checked_at < VERSION_CHECK_INTERVAL:
+            return
+        self._checked_at = now
+
+        count, free_beds, latest = db.session.query(
+            func.count(Room.id), func.coalesce(func.sum(Room.bed_count_remaining), 0), func.max(Room.updated_at)
+        ).one()
+        with self._lock:
+            current = self._fingerprint() == (count, int(free_beds), latest)
+        if not current:
+            self.build()
+
+    # -- queries -----------------------------------------------------------
+
+    def version(self):
+        """Row count, free count and latest updated_at the index holds, for ETags"""
+        with self._lock:
+            return self._fingerprint()
+
+    def available(self, **filters):
+        """Snapshots of rooms with a free bed, matching every key=value filter"""
+        with self._lock:
+            ids = self._free
+            for key, value in filters.items():
+                if value is None:
+                    continue
+                if key not in self._keys:
+                    raise ValueError(f"Cannot filter availability by '{key}'")
+                ids = ids & self._by_key.get((key, value), set())
+            return [self._rooms[room_id] for room_id in sorted(ids)]
+
+    def summary(self):
+        """Free beds, total beds and free rooms overall and per key value"""
+        with self._lock:
+            data = {'free_beds': self._free_beds, 'free_rooms': len(self._free)}
+            for key in self._keys:
+                data[f'by_{key}'] = {
+                    value: {
+                        'free_beds': beds[0],
+                        'total_beds': beds[1],
+                        'free_rooms': len(self._by_key.get((k, value), ()))
+                    }
+                    for (k, value), beds in self._beds.items() if k == key and value is not None
+                }
+            return data
+
+
+room_availability = RoomAvailabilityIndex()
+
+
+def index_room(room):
+    """Refresh one room after a committed change to it"""
+    if room is not None and room_availability._built:
+        room_availability.add(room)
+
+
+def remove_room(room_id):
+    """Drop a room after a committed delete"""
+    room_availability.remove(room_id)
+
+
+def available_rooms(room_type=None, status=None):
+    """Rooms with a free bed, served from the availability index"""
+    room_availability.sync()
+    return room_availability.available(room_type=room_type, status=status)
+
+
+def availability_summary():
+    """Free-bed counts per room type and status, served from the availability index"""
+    room_availability.sync()
+    return room_availability.summary()
+
+
+def availability_version():
+    """Version of the availability index, checked against the database at most every few seconds"""
+    room_availability.sync()
+    return room_availability.version()
@@ -0,0 +1,3 @@
+# This file makes the utils directory a Python package.
+# compression, json_provider, metrics, profiler and query_stats are copied to
+# backend/utils; backend/check_shared_utils.py fails when the copies differ.
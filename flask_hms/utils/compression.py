@@ -0,0 +1,65 @@
+"""
+Response compression.
+
+init_compression(app) compresses responses of COMPRESS_MIN_SIZE bytes or
+more whose type is in COMPRESS_MIMETYPES, choosing brotli when the client
+accepts it and the optional brotli package is installed, gzip otherwise.
+Streamed responses (?stream=1), 304s and responses that already carry a
+Content-Encoding are passed through unchanged.
+"""
+import gzip
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # optional dependency
+    brotli = None
+
+COMPRESS_MIN_SIZE = 1024
+COMPRESS_LEVEL = 5           # gzip 1-9
+COMPRESS_BR_QUALITY = 4      # brotli 0-11; higher levels cost far more CPU
+COMPRESS_MIMETYPES = ('application/json', 'text/html', 'text/plain', 'text/csv', 'application/javascript')
+
+
+def _choose_encoding(accept):
+    if brotli is not None and accept.quality('br') > 0:
+        return 'br'
+    if accept.quality('gzip') > 0:
+        return 'gzip'
+    return None
+
+
+def init_compression(app):
+    if not app.config.get('COMPRESS_ENABLED', True):
+        return
+    min_size = app.config.get('COMPRESS_MIN_SIZE', COMPRESS_MIN_SIZE)
+    level = app.config.get('COMPRESS_LEVEL', COMPRESS_LEVEL)
+    quality = app.config.get('COMPRESS_BR_QUALITY', COMPRESS_BR_QUALITY)
+    mimetypes = app.config.get('COMPRESS_MIMETYPES', COMPRESS_MIMETYPES)
+
+    @app.after_request
+    def compress_response(response):
+        if (response.status_code < 200 or response.status_code in (204, 304)
+                or response.direct_passthrough or response.is_streamed
+                or 'Content-Encoding' in response.headers
+                or response.mimetype not in mimetypes):
+            return response
+
+        response.vary.add('Accept-Encoding')
+        data = response.get_data()
+        if len(data) < min_size:
+            return response
+        encoding = _choose_encoding(request.accept_encodings)
+        if encoding is None:
+            return response
+
+        if encoding == 'br':
+            compressed = brotli.compress(data, quality=quality)
+        else:
+            compressed = gzip.compress(data, compresslevel=level, mtime=0)
+        response.set_data(compressed)
+        response.headers['Content-Encoding'] = encoding
+        # A strong ETag names the uncompressed bytes
+        if response.headers.get('ETag', '').startswith('"'):
+            response.headers['ETag'] = 'W/' + response.headers['ETag']
+        return response
@@ -0,0 +1,188 @@
+import base64
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from flask import Response, json as flask_json, stream_with_context
+from database import db
+from sqlalchemy import text
+
+DEFAULT_PAGE_LIMIT = 20
+MAX_PAGE_LIMIT = 100
+STREAM_CHUNK_SIZE = 500
+
+
+def encode_cursor(values):
+    """Encode keyset values into an opaque, URL-safe cursor"""
+    raw = json.dumps(values, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).rstrip(b'=').decode()
+
+
+def decode_cursor(cursor):
+    """Decode a cursor produced by encode_cursor"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        raise ValueError('Invalid cursor')
+    if not isinstance(values, dict):
+        raise ValueError('Invalid cursor')
+    return values
+
+
+def wants_keyset(args):
+    """True when the request asks for cursor pagination (?after= or ?limit=)"""
+    return 'after' in args or 'limit' in args
+
+
+def parse_limit(value, default=DEFAULT_PAGE_LIMIT, maximum=MAX_PAGE_LIMIT):
+    """Clamp a ?limit= value to 1..maximum"""
+    try:
+        limit = int(value) if value not in (None, '') else default
+    except (TypeError, ValueError):
+        raise ValueError('limit must be an integer')
+    return max(1, min(limit, maximum))
+
+
+def keyset_paginate(query, key_column, after=None, limit=DEFAULT_PAGE_LIMIT):
+    """
+    Page through a query ordered on an indexed, unique column.
+
+    Seeks past the key stored in the cursor instead of using OFFSET, so every
+    page costs the same no matter how deep it is. Returns (items, next_cursor);
+    next_cursor is None on the last page.
+    """
+    if after:
+        last_key = decode_cursor(after).get(key_column.key)
+        if last_key is None:
+            raise ValueError('Invalid cursor')
+        query = query.filter(key_column > last_key)
+
+    # Fetch one extra row to know whether another page exists
+    rows = query.order_by(key_column).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    next_cursor = None
+    if has_more:
+        last = rows[-1]
+        # Works for both ORM instances and column tuples
+        next_cursor = encode_cursor({key_column.key: getattr(last, key_column.key)})
+    return rows, next_cursor
+
+
+def estimate_row_count(model):
+    """Planner estimate of a table's row count; exact COUNT(*) where unavailable"""
+    if db.engine.dialect.name == 'mysql':
+        estimate = db.session.execute(
+            text(
+                'SELECT TABLE_ROWS FROM information_schema.TABLES '
+                'WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :table'
+            ),
+            {'table': model.__tablename__}
+        ).scalar()
+        if estimate is not None:
+            return int(estimate)
+    return model.query.count()
+
+
+def page_total(query, model, mode, filtered):
+    """
+    Resolve the ?total= mode of a keyset page.
+
+    'exact' runs COUNT(*) over the filtered query, 'estimate' returns the table
+    estimate for unfiltered listings, anything else skips the total.
+    """
+    if mode == 'exact':
+        return query.order_by(None).count()
+    if mode == 'estimate' and not filtered:
+        return estimate_row_count(model)
+    return None
+
+
+def wants_stream(args):
+    """True when the request asks for a streamed response (?stream=1)"""
+    return args.get('stream', '').lower() in ('1', 'true', 'yes')
+
+
+def stream_json_array(query, serialize, envelope=None, chunk_size=STREAM_CHUNK_SIZE):
+    """
+    Stream a query as a JSON array without materializing it.
+
+    Rows are fetched in server-side chunks (yield_per) and written out as
+    they are serialized, so memory stays flat and the first byte goes out
+    after the first chunk. With an envelope dict the array is emitted as its
+    'data' key, e.g. {"success": true, "data": [...]}.
+    """
+    if envelope:
+        head = flask_json.dumps(envelope)[:-1] + ', "data": ['
+        tail = ']}'
+    else:
+        head, tail = '[', ']'
+
+    def generate():
+        yield head
+        separator = ''
+        buffer = []
+        for row in query.yield_per(chunk_size):
+            buffer.append(flask_json.dumps(serialize(row)))
+            if len(buffer) >= chunk_size:
+                yield separator + ','.join(buffer)
+                separator = ','
+                buffer = []
+        if buffer:
+            yield separator + ','.join(buffer)
+        yield tail
+
+    return Response(stream_with_context(generate()), mimetype='application/json')
+
+
+def model_columns(model, names):
+    """Map serialized field names to the model's columns, in order"""
+    return {name: getattr(model, name) for name in names}
+
+
+def _json_value(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (date, datetime)):
+        return str(value)
+    return value
+
+
+def parse_fields(fields, columns):
+    """Validate a ?fields= value against the selectable columns; id always comes first"""
+    names = ['id']
+    for name in fields.split(','):
+        name = name.strip()
+        if not name or name in names:
+            continue
+        if name not in columns:
+            raise ValueError(f"Unknown field '{name}'. Must be one of: {', '.join(columns)}")
+        names.append(name)
+    return names
+
+
+def sparse_fieldset(query, fields, columns, serialize, joins=None):
+    """
+    Apply a ?fields= projection to a query.
+
+    columns maps each selectable field name to a column expression; joins maps
+    fields that live on another table to a function adding the join. Without
+    fields the query and serializer are returned unchanged. With fields only
+    the requested columns (plus id) are SELECTed and rows are serialized
+    straight from the result tuples, with no ORM instances or lazy loads.
+    Raises ValueError for unknown fields.
+    """
+    if not fields:
+        return query, serialize
+
+    names = parse_fields(fields, columns)
+    for name in names:
+        if joins and name in joins:
+            query = joins[name](query)
+    query = query.with_entities(*[columns[name].label(name) for name in names])
+
+    def serialize_row(row):
+        return {name: _json_value(value) for name, value in zip(names, row)}
+
+    return query, serialize_row
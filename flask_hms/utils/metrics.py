@@ -0,0 +1,248 @@
+"""
+Prometheus text-format metrics at /metrics.
+
+init_metrics(app, db) collects, per process:
+
+* http_request_duration_seconds   latency histogram per method and route
+                                  (the URL rule, not the path), with the
+                                  route's blueprint as a label
+* http_blueprint_request_duration_seconds
+                                  the same, summed per blueprint at scrape time
+* http_requests_total             requests per method, route and status
+* http_request_errors_total       5xx responses per method and route
+* db_pool_*                       size, checked out, checked in and overflow
+                                  gauges per engine, plus a histogram of the
+                                  time spent waiting for a pooled connection
+* socketio_*                      events emitted and sent per event type,
+                                  coalesced/dropped counters and connected
+                                  clients, when the app has an event
+                                  dispatcher (app.extensions['event_dispatcher'])
+
+The request path costs two perf_counter() calls, a bisect over the bucket
+bounds and a few additions under one lock; all formatting happens when
+/metrics is scraped. Requests without a matching route are counted under
+route="unmatched" so unknown URLs cannot grow the label set. Each worker
+process reports its own numbers.
+"""
+from bisect import bisect_left
+from flask import Response, g, request
+import threading
+import time
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+POOL_WAIT_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class Histogram:
+    """Cumulative-on-render histogram: one count per bucket plus sum and count"""
+
+    __slots__ = ('bounds', 'counts', 'sum', 'count')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def merge(self, other):
+        for i, n in enumerate(other.counts):
+            self.counts[i] += n
+        self.sum += other.sum
+        self.count += other.count
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(**labels):
+    return ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items())
+
+
+def _header(lines, name, kind, help_text):
+    lines.append(f'# HELP {name} {help_text}')
+    lines.append(f'# TYPE {name} {kind}')
+
+
+def _histogram_lines(lines, name, labels, histogram):
+    cumulative = 0
+    for bound, n in zip(histogram.bounds, histogram.counts):
+        cumulative += n
+        lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+    lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {histogram.count}')
+    lines.append(f'{name}_sum{{{labels}}} {histogram.sum:.6f}')
+    lines.append(f'{name}_count{{{labels}}} {histogram.count}')
+
+
+class Metrics:
+    """Request, pool and event counters for one process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latency = {}       # (method, route, blueprint) -> Histogram
+        self.requests = {}      # (method, route, status) -> count
+        self.errors = {}        # (method, route) -> count
+        self.pool_wait = {}     # engine name -> Histogram
+        self.engines = {}       # engine name -> Engine
+        self.dispatcher = None
+
+    # -- collecting --------------------------------------------------------
+
+    def observe_request(self, method, route, blueprint, status, seconds):
+        with self._lock:
+            histogram = self.latency.get((method, route, blueprint))
+            if histogram is None:
+                histogram = self.latency[(method, route, blueprint)] = Histogram(BUCKETS)
+            histogram.observe(seconds)
+            key = (method, route, status)
+            self.requests[key] = self.requests.get(key, 0) + 1
+            if status >= 500:
+                self.errors[(method, route)] = self.errors.get((method, route), 0) + 1
+
+    def watch_pool(self, name, engine):
+        """Time every connection checkout from the engine's pool"""
+        pool = engine.pool
+        histogram = self.pool_wait[name] = Histogram(POOL_WAIT_BUCKETS)
+        connect = pool.connect
+        lock = self._lock
+
+        def timed_connect():
+            started = time.perf_counter()
+            try:
+                return connect()
+            finally:
+                waited = time.perf_counter() - started
+                with lock:
+                    histogram.observe(waited)
+
+        pool.connect = timed_connect
+        self.engines[name] = engine
+
+    # -- rendering ---------------------------------------------------------
+
+    def render(self):
+        with self._lock:
+            latency = {key: (h.counts[:], h.sum, h.count) for key, h in self.latency.items()}
+            requests = dict(self.requests)
+            errors = dict(self.errors)
+            pool_wait = {name: (h.counts[:], h.sum, h.count) for name, h in self.pool_wait.items()}
+
+        lines = []
+        self._render_requests(lines, latency, requests, errors)
+        self._render_pools(lines, pool_wait)
+        if self.dispatcher is not None:
+            self._render_dispatcher(lines)
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def _copy(bounds, snapshot):
+        histogram = Histogram(bounds)
+        histogram.counts, histogram.sum, histogram.count = snapshot
+        return histogram
+
+    def _render_requests(self, lines, latency, requests, errors):
+        _header(lines, 'http_request_duration_seconds', 'histogram', 'Request latency per route')
+        per_blueprint = {}
+        for (method, route, blueprint), snapshot in sorted(latency.items()):
+            histogram = self._copy(BUCKETS, snapshot)
+            _histogram_lines(lines, 'http_request_duration_seconds',
+                             _labels(method=method, route=route, blueprint=blueprint), histogram)
+            per_blueprint.setdefault(blueprint, Histogram(BUCKETS)).merge(histogram)
+
+        _header(lines, 'http_blueprint_request_duration_seconds', 'histogram', 'Request latency per blueprint')
+        for blueprint, histogram in sorted(per_blueprint.items()):
+            _histogram_lines(lines, 'http_blueprint_request_duration_seconds', _labels(blueprint=blueprint), histogram)
+
+        _header(lines, 'http_requests_total', 'counter', 'Requests per route and status')
+        for (method, route, status), n in sorted(requests.items()):
+            lines.append(f'http_requests_total{{{_labels(method=method, route=route, status=status)}}} {n}')
+
+        _header(lines, 'http_request_errors_total', 'counter', '5xx responses per route')
+        for (method, route), n in sorted(errors.items()):
+            lines.append(f'http_request_errors_total{{{_labels(method=method, route=route)}}} {n}')
+
+    def _render_pools(self, lines, pool_wait):
+        gauges = (
+            ('db_pool_size', 'size', 'Connections the pool keeps open'),
+            ('db_pool_checked_out', 'checkedout', 'Connections currently in use'),
+            ('db_pool_checked_in', 'checkedin', 'Idle connections in the pool'),
+            ('db_pool_overflow', 'overflow', 'Connections open beyond the pool size'),
+        )
+        for name, method, help_text in gauges:
+            _header(lines, name, 'gauge', help_text)
+            for engine_name, engine in sorted(self.engines.items()):
+                # Pools without the method (sqlite's static/singleton pools) are skipped
+                read = getattr(engine.pool, method, None)
+                if read is not None:
+                    # QueuePool.overflow() counts down from -pool_size while the pool fills
+                    value = max(read(), 0) if method == 'overflow' else read()
+                    lines.append(f'{name}{{{_labels(engine=engine_name)}}} {value}')
+
+        _header(lines, 'db_pool_wait_seconds', 'histogram', 'Time spent waiting for a pooled connection')
+        for engine_name, snapshot in sorted(pool_wait.items()):
+            _histogram_lines(lines, 'db_pool_wait_seconds', _labels(engine=engine_name),
+                             self._copy(POOL_WAIT_BUCKETS, snapshot))
+
+    def _render_dispatcher(self, lines):
+        stats = self.dispatcher.stats()
+        by_event = stats.get('by_event', {})
+        for name, field, help_text in (
+            ('socketio_events_emitted_total', 'emitted', 'Events queued by request handlers'),
+            ('socketio_events_sent_total', 'sent', 'Events sent to clients after coalescing'),
+        ):
+            _header(lines, name, 'counter', help_text)
+            for event, counts in sorted(by_event.items()):
+                lines.append(f'{name}{{{_labels(event=event)}}} {counts[field]}')
+        for name, kind, key, help_text in (
+            ('socketio_events_coalesced_total', 'counter', 'coalesced', 'Events superseded within a tick'),
+            ('socketio_events_dropped_total', 'counter', 'dropped', 'Events dropped from lagging client queues'),
+            ('socketio_resyncs_total', 'counter', 'resyncs', 'Lagging clients told to refetch after a queue overflow'),
+            ('socketio_binary_frames_total', 'counter', 'binary_frames', 'MessagePack frames sent'),
+            ('socketio_connected_clients', 'gauge', 'clients', 'Clients connected to this worker'),
+            ('socketio_binary_clients', 'gauge', 'binary_clients', 'Connected clients using MessagePack'),
+            ('socketio_lagging_clients', 'gauge', 'lagging', 'Clients fed from their own queue'),
+            ('socketio_pending_events', 'gauge', 'pending', 'Events waiting for the next tick'),
+        ):
+            if key in stats:
+                _header(lines, name, kind, help_text)
+                lines.append(f'{name} {stats[key]}')
+
+
+metrics = Metrics()
+
+
+def init_metrics(app, db):
+    if not app.config.get('METRICS_ENABLED', True):
+        return
+    with app.app_context():
+        for name, engine in db.engines.items():
+            metrics.watch_pool(name or 'default', engine)
+    metrics.dispatcher = app.extensions.get('event_dispatcher')
+
+    @app.before_request
+    def start_request_timer():
+        g.metrics_started = time.perf_counter()
+
+    @app.after_request
+    def observe_request(response):
+        started = g.pop('metrics_started', None)
+        if started is not None and request.endpoint != 'metrics':
+            rule = request.url_rule
+            metrics.observe_request(
+                request.method,
+                rule.rule if rule is not None else 'unmatched',
+                request.blueprint or '',
+                response.status_code,
+                time.perf_counter() - started
+            )
+        return response
+
+    @app.route('/metrics', endpoint='metrics')
+    def metrics_endpoint():
+        return Response(metrics.render(), content_type=CONTENT_TYPE)
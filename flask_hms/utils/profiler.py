@@ -0,0 +1,223 @@
+"""
+On-demand CPU and memory profiling of a running worker.
+
+Nothing runs until an admin asks for a profile: the request hooks installed
+by init_profiler(app) read one module attribute and return while no session
+is active, and no sampler thread or tracemalloc tracing exists outside a
+session, so the hooks can stay installed in production.
+
+A session covers either the next `seconds` seconds or the next `requests`
+requests whose URL rule (or path) equals `route`, whichever ends first; it
+blocks the admin request until then. One session runs at a time.
+
+CPU: a background thread samples the Python stacks of the threads serving
+requests (all threads with include_idle) every `interval` seconds via
+sys._current_frames() and returns them as collapsed stacks, one
+"outer;...;inner count" line per distinct stack, which flamegraph.pl,
+speedscope and inferno read directly.
+
+Memory: tracemalloc traces allocations for the session and the top sites
+by growth between the first and last snapshot are returned. tracemalloc is
+process-wide, so requests to other routes running at the same time show up
+too.
+"""
+from collections import Counter
+from flask import request
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+MAX_SECONDS = 120
+DEFAULT_SECONDS = 10
+SAMPLE_INTERVAL = 0.005
+TRACE_FRAMES = 10
+TOP_SITES = 25
+
+
+class ProfilerBusy(Exception):
+    """Another profiling session is running in this worker"""
+
+
+class _Session:
+    """Which requests a profile covers and when it ends"""
+
+    def __init__(self, seconds, route=None, requests=None):
+        self.deadline = time.monotonic() + seconds
+        self.route = route
+        self.requests = requests
+        self.claimed = 0
+        self.completed = 0
+        self.threads = set()        # idents of threads serving covered requests
+        self.done = threading.Event()
+        self._lock = threading.Lock()
+
+    def enter(self):
+        if self.route is not None:
+            rule = request.url_rule
+            if request.path != self.route and (rule is None or rule.rule != self.route):
+                return
+        with self._lock:
+            if self.requests is not None and self.claimed >= self.requests:
+                return
+            self.claimed += 1
+            self.threads.add(threading.get_ident())
+
+    def exit(self):
+        ident = threading.get_ident()
+        with self._lock:
+            if ident not in self.threads:
+                return
+            self.threads.discard(ident)
+            self.completed += 1
+            if self.requests is not None and self.completed >= self.requests:
+                self.done.set()
+
+    def wait(self):
+        self.done.wait(max(self.deadline - time.monotonic(), 0))
+
+
+class Profiler:
+    """Runs one CPU or memory profiling session at a time"""
+
+    def __init__(self):
+        self.session = None
+        self._busy = threading.Lock()
+        self._names = {}
+
+    def _start(self, seconds, route, requests):
+        if not self._busy.acquire(blocking=False):
+            raise ProfilerBusy('A profiling session is already running')
+        self.session = _Session(seconds, route, requests)
+        return self.session
+
+    def _finish(self):
+        self.session = None
+        self._busy.release()
+
+    def _frame_name(self, code):
+        name = self._names.get(code)
+        if name is None:
+            path = code.co_filename.replace(os.sep, '/').split('/')
+            name = f"{code.co_name} ({'/'.join(path[-2:])}:{code.co_firstlineno})".replace(';', ':')
+            self._names[code] = name
+        return name
+
+    def _sample(self, session, stacks, interval, include_idle, exclude):
+        me = threading.get_ident()
+        while not session.done.is_set() and time.monotonic() < session.deadline:
+            targets = None if include_idle else set(session.threads)
+            for ident, frame in sys._current_frames().items():
+                if ident == me or ident in exclude or (targets is not None and ident not in targets):
+                    continue
+                names = []
+                while frame is not None:
+                    names.append(self._frame_name(frame.f_code))
+                    frame = frame.f_back
+                stacks[';'.join(reversed(names))] += 1
+            time.sleep(interval)
+
+    def cpu(self, seconds=DEFAULT_SECONDS, route=None, requests=None, interval=SAMPLE_INTERVAL, include_idle=False):
+        """Sample stacks for the session; returns (collapsed stacks text, summary)"""
+        session = self._start(seconds, route, requests)
+        stacks = Counter()
+        started = time.perf_counter()
+        try:
+            sampler = threading.Thread(
+                target=self._sample, name='profiler-sampler',
+                args=(session, stacks, interval, include_idle, {threading.get_ident()}), daemon=True
+            )
+            sampler.start()
+            session.wait()
+            session.done.set()
+            sampler.join()
+        finally:
+            self._finish()
+            self._names.clear()
+
+        collapsed = ''.join(f'{stack} {count}\n' for stack, count in stacks.most_common())
+        return collapsed, {
+            'samples': sum(stacks.values()),
+            'stacks': len(stacks),
+            'requests': session.completed,
+            'seconds': round(time.perf_counter() - started, 3)
+        }
+
+    def memory(self, seconds=DEFAULT_SECONDS, route=None, requests=None, limit=TOP_SITES,
+               frames=TRACE_FRAMES, group_by='lineno'):
+        """Trace allocations for the session; returns the top sites by growth"""
+        session = self._start(seconds, route, requests)
+        already_tracing = tracemalloc.is_tracing()
+        started = time.perf_counter()
+        try:
+            if not already_tracing:
+                tracemalloc.start(frames)
+            tracemalloc.reset_peak()
+            before = tracemalloc.take_snapshot()
+            session.wait()
+            after = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+        finally:
+            if not already_tracing:
+                tracemalloc.stop()
+            self._finish()
+
+        ignore = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__)]
+        stats = after.filter_traces(ignore).compare_to(before.filter_traces(ignore), group_by)
+        sites = []
+        for stat in stats[:limit]:
+            frame = stat.traceback[-1]
+            site = {
+                'site': f'{frame.filename}:{frame.lineno}',
+                'size_kb': round(stat.size / 1024, 1),
+                'size_diff_kb': round(stat.size_diff / 1024, 1),
+                'count': stat.count,
+                'count_diff': stat.count_diff
+            }
+            if group_by == 'traceback':
+                site['traceback'] = [f'{f.filename}:{f.lineno}' for f in stat.traceback]
+            sites.append(site)
+        return {
+            'requests': session.completed,
+            'seconds': round(time.perf_counter() - started, 3),
+            'traced_kb': round(current / 1024, 1),
+            'peak_kb': round(peak / 1024, 1),
+            'top': sites
+        }
+
+
+profiler = Profiler()
+
+
+def parse_session_args(args, max_seconds=MAX_SECONDS):
+    """seconds/route/requests from query args; raises ValueError"""
+    try:
+        seconds = float(args.get('seconds', DEFAULT_SECONDS))
+        requests = int(args['requests']) if args.get('requests') else None
+    except ValueError:
+        raise ValueError("'seconds' and 'requests' must be numbers")
+    if not 0 < seconds <= max_seconds:
+        raise ValueError(f"'seconds' must be between 0 and {max_seconds}")
+    if requests is not None and requests < 1:
+        raise ValueError("'requests' must be at least 1")
+    route = args.get('route') or None
+    if requests is not None and route is None:
+        raise ValueError("'requests' needs a 'route'")
+    return seconds, route, requests
+
+
+def init_profiler(app):
+    """Install the request hooks; they return at once while no session runs"""
+
+    @app.before_request
+    def profile_enter():
+        session = profiler.session
+        if session is not None:
+            session.enter()
+
+    @app.teardown_request
+    def profile_exit(exc=None):
+        session = profiler.session
+        if session is not None:
+            session.exit()
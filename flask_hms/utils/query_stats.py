@@ -0,0 +1,183 @@
+"""
+Per-request SQL statistics.
+
+init_query_stats(app) times every statement a request sends through
+SQLAlchemy (cursor execute events, so ORM loads, Core statements and lazy
+loads triggered while serializing all count) and keeps per request:
+
+* the number of statements and the total time spent in the database
+* its three slowest statements
+* a fingerprint per statement shape (literals and IN lists collapsed), with
+  how often each ran
+
+A shape that runs more than SQL_N_PLUS_ONE_THRESHOLD times in one request is
+flagged as a likely N+1, e.g. a relationship lazy-loaded once per row of a
+list.
+
+Where the numbers go:
+
+* With debug on (or SQL_STATS_HEADERS set) every response carries
+  X-DB-Queries, X-DB-Time-Ms, Server-Timing and, when flagged, X-DB-N-Plus-One
+  with the fingerprints.
+* A SQL_STATS_SAMPLE_RATE fraction of requests is logged as one JSON line on
+  the 'sql.stats' logger; requests with an N+1 flag or slower in the
+  database than SQL_SLOW_REQUEST_MS are always logged, at WARNING.
+
+Work outside a request (CLI commands, background writers) is not counted.
+"""
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+import hashlib
+import heapq
+import json
+import logging
+import random
+import re
+import time
+
+logger = logging.getLogger('sql.stats')
+
+SAMPLE_RATE = 0.01
+SLOW_REQUEST_MS = 500
+N_PLUS_ONE_THRESHOLD = 10
+SLOWEST = 3
+STATEMENT_CHARS = 300
+
+_IN_LIST = re.compile(r'\(\s*(?:\?|%s|%\(\w+\)s|:\w+)(?:\s*,\s*(?:\?|%s|%\(\w+\)s|:\w+))+\s*\)')
+_LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_SPACE = re.compile(r'\s+')
+
+
+def fingerprint(statement):
+    """Statement shape: literals and bound IN lists collapsed, whitespace squeezed"""
+    shape = _IN_LIST.sub('(?+)', statement)
+    shape = _LITERAL.sub('?', shape)
+    return _SPACE.sub(' ', shape).strip()
+
+
+def _short(statement):
+    statement = _SPACE.sub(' ', statement).strip()
+    return statement if len(statement) <= STATEMENT_CHARS else statement[:STATEMENT_CHARS] + '...'
+
+
+class QueryStats:
+    """Statements run during one request"""
+
+    __slots__ = ('count', 'total_ms', 'slowest', 'shapes')
+
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+        self.slowest = []   # min-heap of (ms, statement)
+        self.shapes = {}    # statement -> [count, ms]
+
+    def record(self, statement, ms):
+        self.count += 1
+        self.total_ms += ms
+        if len(self.slowest) < SLOWEST:
+            heapq.heappush(self.slowest, (ms, statement))
+        elif ms > self.slowest[0][0]:
+            heapq.heapreplace(self.slowest, (ms, statement))
+        shape = self.shapes.get(statement)
+        if shape is None:
+            self.shapes[statement] = [1, ms]
+        else:
+            shape[0] += 1
+            shape[1] += ms
+
+    def repeated(self, threshold):
+        """(fingerprint, count, ms) of shapes run more than threshold times, most frequent first"""
+        merged = {}
+        for statement, (count, ms) in self.shapes.items():
+            total = merged.setdefault(fingerprint(statement), [0, 0.0])
+            total[0] += count
+            total[1] += ms
+        return sorted(
+            ((shape, count, ms) for shape, (count, ms) in merged.items() if count > threshold),
+            key=lambda item: -item[1]
+        )
+
+    def summary(self, threshold):
+        return {
+            'queries': self.count,
+            'db_ms': round(self.total_ms, 2),
+            'slowest': [
+                {'ms': round(ms, 2), 'sql': _short(statement)}
+                for ms, statement in sorted(self.slowest, reverse=True)
+            ],
+            'n_plus_one': [
+                {'id': _shape_id(shape), 'count': count, 'ms': round(ms, 2), 'sql': _short(shape)}
+                for shape, count, ms in self.repeated(threshold)
+            ]
+        }
+
+
+def _shape_id(shape):
+    return hashlib.sha1(shape.encode()).hexdigest()[:10]
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and 'query_stats' in g:
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get('query_started')
+    if not started or not has_request_context() or 'query_stats' not in g:
+        return
+    g.query_stats.record(statement, (time.perf_counter() - started.pop()) * 1000)
+
+
+def _handle_error(context):
+    started = context.connection.info.get('query_started') if context.connection is not None else None
+    if started:
+        started.pop()
+
+
+def init_query_stats(app):
+    if not app.config.get('SQL_STATS_ENABLED', True):
+        return
+    headers = app.config.get('SQL_STATS_HEADERS')
+    sample_rate = app.config.get('SQL_STATS_SAMPLE_RATE', SAMPLE_RATE)
+    slow_ms = app.config.get('SQL_SLOW_REQUEST_MS', SLOW_REQUEST_MS)
+    threshold = app.config.get('SQL_N_PLUS_ONE_THRESHOLD', N_PLUS_ONE_THRESHOLD)
+
+    # Engine-wide listeners; registered once per process
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        event.listen(Engine, 'handle_error', _handle_error)
+
+    @app.before_request
+    def start_query_stats():
+        g.query_stats = QueryStats()
+
+    @app.after_request
+    def report_query_stats(response):
+        stats = g.pop('query_stats', None)
+        if stats is None:
+            return response
+        flagged = stats.repeated(threshold) if stats.count > threshold else []
+
+        # Decided per request: app.run(debug=True) turns debug on after create_app()
+        if headers or (headers is None and app.debug):
+            response.headers['X-DB-Queries'] = str(stats.count)
+            response.headers['X-DB-Time-Ms'] = f'{stats.total_ms:.2f}'
+            response.headers.add('Server-Timing', f'db;dur={stats.total_ms:.2f};desc="{stats.count} queries"')
+            if flagged:
+                response.headers['X-DB-N-Plus-One'] = ', '.join(
+                    f'{_shape_id(shape)}x{count}' for shape, count, ms in flagged
+                )
+
+        # Flagged and slow requests at WARNING, the plain sample at INFO
+        alert = bool(flagged) or stats.total_ms >= slow_ms
+        if alert or (sample_rate and random.random() < sample_rate):
+            logger.log(logging.WARNING if alert else logging.INFO, json.dumps(dict(
+                stats.summary(threshold),
+                method=request.method,
+                path=request.path,
+                endpoint=request.endpoint,
+                status=response.status_code
+            )))
+        return response
@@ -0,0 +1,137 @@
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+PATIENT_GENDERS = ('Male', 'Female', 'Other')
+PATIENT_CATEGORIES = ('OutPatient', 'InPatient')
+
+# Column sizes of models.patient.Patient; None is an unbounded TEXT column
+PATIENT_STRINGS = {
+    'first_name': 100, 'middle_name': 100, 'last_name': 100, 'blood_group': 10,
+    'phone_no': 30, 'email_id': 150, 'address': None, 'disease': 255
+}
+# Largest absolute value each Numeric(precision, scale) column holds
+PATIENT_DECIMALS = {
+    'height': Decimal('999.99'), 'weight': Decimal('999.99'), 'bmi': Decimal('999.99'),
+    'amount': Decimal('9999999999.99')
+}
+MAX_AGE = 150
+
+
+def _blank(value):
+    return value is None or (isinstance(value, str) and not value.strip())
+
+
+def _clean(value):
+    if _blank(value):
+        return None
+    return value.strip() if isinstance(value, str) else value
+
+
+def validate_patient_data(data):
+    """
+    Validate a patient payload (JSON object or CSV row).
+
+    Returns (values, errors): values holds the Patient column values plus
+    'room_id', errors is a list of messages; values is None when errors exist.
+    """
+    if not isinstance(data, dict):
+        return None, ['Row must be an object']
+
+    errors = []
+    data = {key: _clean(value) for key, value in data.items() if key}
+
+    if not data.get('first_name') or not data.get('phone_no'):
+        errors.append('first_name and phone_no are required')
+
+    for field, max_length in PATIENT_STRINGS.items():
+        value = data.get(field)
+        if value is None:
+            continue
+        # JSON rows may send phone numbers as numbers
+        if isinstance(value, int) and not isinstance(value, bool):
+            value = data[field] = str(value)
+        if not isinstance(value, str):
+            errors.append(f'{field} must be a string')
+        elif max_length is not None and len(value) > max_length:
+            errors.append(f'{field} must be at most {max_length} characters')
+
+    date_of_birth = None
+    if data.get('date_of_birth'):
+        try:
+            date_of_birth = datetime.strptime(str(data['date_of_birth']), '%Y-%m-%d').date()
+        except ValueError:
+            errors.append('date_of_birth must be YYYY-MM-DD')
+
+    age = None
+    if data.get('age') is not None:
+        try:
+            if isinstance(data['age'], (bool, float)):
+                raise TypeError
+            age = int(data['age'])
+        except (TypeError, ValueError):
+            errors.append('age must be an integer')
+        else:
+            if not 0 <= age <= MAX_AGE:
+                errors.append(f'age must be between 0 and {MAX_AGE}')
+
+    decimals = {}
+    for field, largest in PATIENT_DECIMALS.items():
+        if data.get(field) is None:
+            continue
+        try:
+            if isinstance(data[field], (bool, dict, list)):
+                raise InvalidOperation
+            value = Decimal(str(data[field]))
+        except InvalidOperation:
+            errors.append(f'{field} must be a number')
+            continue
+        # Decimal() accepts 'NaN' and 'Infinity'
+        if not value.is_finite():
+            errors.append(f'{field} must be a finite number')
+        elif abs(value) > largest:
+            errors.append(f'{field} must be at most {largest}')
+        else:
+            decimals[field] = value
+
+    gender = data.get('gender') or 'Other'
+    if gender not in PATIENT_GENDERS:
+        errors.append(f"gender must be one of: {', '.join(PATIENT_GENDERS)}")
+
+    category = data.get('category') or 'OutPatient'
+    if category not in PATIENT_CATEGORIES:
+        errors.append(f"category must be one of: {', '.join(PATIENT_CATEGORIES)}")
+
+    room_id = None
+    if data.get('room_id') is not None:
+        try:
+            if isinstance(data['room_id'], (bool, float)):
+                raise TypeError
+            room_id = int(data['room_id'])
+        except (TypeError, ValueError):
+            errors.append('room_id must be an integer')
+    if category == 'InPatient' and room_id is None:
+        errors.append('room_id is required for InPatient')
+
+    if errors:
+        return None, errors
+
+    return {
+        'first_name': data['first_name'],
+        'middle_name': data.get('middle_name'),
+        'last_name': data.get('last_name'),
+        'name': f"{data['first_name']} {data.get('last_name') or ''}".strip(),
+        'date_of_birth': date_of_birth,
+        'age': age,
+        'gender': gender,
+        'blood_group': data.get('blood_group'),
+        'height': decimals.get('height'),
+        'weight': decimals.get('weight'),
+        'bmi': decimals.get('bmi'),
+        'phone_no': data['phone_no'],
+        'email_id': data.get('email_id'),
+        'address': data.get('address'),
+        'disease': data.get('disease'),
+        'category': category,
+        'amount': decimals.get('amount', Decimal('0')),
+        'room_id': room_id if category == 'InPatient' else None
+    }, []